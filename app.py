@@ -1,7 +1,14 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import pandas as pd
 import comtradeapicall
+import trade_export
+import trade_normalize
 import ml_model
+import forecast_table
+import hs_hierarchy
+import model_runtime
+import training_executor
+import feature_store
 import llm_assistant
 import os
 from dotenv import load_dotenv
@@ -46,16 +53,153 @@ def get_trade_data():
             countOnly=None,
             includeDesc=True
         )
-        import numpy as np
-        df = df.replace([np.nan, np.inf, -np.inf], None)
-        # Only send a preview (first 10 rows)
+        # Only send a preview (first 10 rows); inf/NaN were cleaned when the data was cached
         return jsonify({
             'columns': list(df.columns),
-            'rows': df.head(10).to_dict(orient='records')
+            'rows': trade_normalize.json_records(df.head(10))
         })
     except Exception as e:
         return jsonify({'error': str(e)})
 
+# Upper bound on reporter x partner x period x commodity combinations per bulk request
+MAX_BULK_QUERIES = int(os.environ.get("MAX_BULK_QUERIES", "500"))
+
+def _as_list(value, default):
+    """Accept a single code or a list of codes from a JSON body"""
+    if value is None or value == '' or value == []:
+        return list(default)
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v not in (None, '')]
+    return [value]
+
+def _int_field(source, name, default, minimum=1):
+    """
+    Read a whole-number field from a JSON body
+
+    Raises:
+        ValueError: With a client-facing message if the value is not an integer >= minimum
+    """
+    value = source.get(name, default)
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer, got {value!r}')
+    if number < minimum:
+        raise ValueError(f'{name} must be at least {minimum}, got {number}')
+    return number
+
+# API endpoint to fetch many reporter/partner combinations in one request
+@app.route('/api/trade/bulk', methods=['POST'])
+def get_bulk_trade_data():
+    data = request.json or {}
+    all_countries = [c['code'] for c in comtradeapicall.get_country_list()]
+    reporters = _as_list(data.get('reporterCodes', data.get('reporterCode')), all_countries)
+    partners = _as_list(data.get('partnerCodes', data.get('partnerCode')), all_countries)
+    periods = _as_list(data.get('periods', data.get('period')), ['2022'])
+    cmd_codes = _as_list(data.get('cmdCodes', data.get('cmdCode')), ['TOTAL'])
+    flow_code = data.get('flowCode') or None
+    output_format = data.get('format', 'csv')
+    
+    n_queries = len(reporters) * len(partners) * len(periods) * len(cmd_codes)
+    if n_queries > MAX_BULK_QUERIES:
+        return jsonify({'error': f'Too many combinations ({n_queries}); the limit is {MAX_BULK_QUERIES}'}), 400
+    if output_format not in trade_export.EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {output_format}'}), 400
+    
+    results = comtradeapicall.iterBulk(
+        reporters, partners, periods, cmd_codes,
+        typeCode='C',
+        freqCode='A',
+        clCode='HS',
+        flowCode=flow_code,
+        maxRecords=500,
+        format_output='JSON',
+        breakdownMode='classic',
+        includeDesc=True
+    )
+    return _stream_export(_genuine_frames(results), output_format, 'custom_trade_data')
+
+# API endpoint to download a full query result as CSV or NDJSON
+@app.route('/api/trade/export', methods=['POST'])
+def export_trade_data():
+    data = request.json or {}
+    reporter = data.get('reporterCode', '842')  # USA
+    partner = data.get('partnerCode', '156')    # China
+    periods = _as_list(data.get('periods', data.get('period')), ['2022'])
+    cmd_code = data.get('cmdCode', 'TOTAL')
+    flow_code = data.get('flowCode', None)
+    output_format = data.get('format', 'csv')
+    try:
+        max_records = _int_field(data, 'maxRecords', 100000)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if output_format not in trade_export.EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {output_format}'}), 400
+    
+    # Periods are fetched one at a time as the response is consumed
+    results = (
+        ({'period': period}, *comtradeapicall.lookupFinalData(
+            typeCode='C',
+            freqCode='A',
+            clCode='HS',
+            period=period,
+            reporterCode=reporter,
+            partnerCode=partner,
+            cmdCode=cmd_code,
+            flowCode=flow_code,
+            maxRecords=max_records,
+            format_output='JSON',
+            breakdownMode='classic',
+            includeDesc=True
+        ))
+        for period in periods
+    )
+    return _stream_export(_genuine_frames(results), output_format, f'trade_{reporter}_{partner}')
+
+def _genuine_frames(results):
+    """Yield the frames of (query, df, ok) results, skipping fallback and error results"""
+    skipped = []
+    for query, df, ok in results:
+        if ok:
+            yield df
+        else:
+            skipped.append(query)
+    if skipped:
+        print(f"Export skipped {len(skipped)} queries without API data: {skipped[:10]}")
+
+def _stream_export(frames, output_format, filename):
+    """Stream DataFrames as a chunked CSV/NDJSON download"""
+    return Response(
+        stream_with_context(trade_export.iter_export(frames, output_format)),
+        mimetype=trade_export.EXPORT_FORMATS[output_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{output_format}'}
+    )
+
+# API endpoint exposing COMTRADE cache counters
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = comtradeapicall.get_cache_stats()
+    stats['features'] = feature_store.get_feature_stats()
+    stats['models'] = ml_model.get_model_stats()
+    stats['training'] = training_executor.get_executor().stats()
+    if _forecast_table is not None:
+        stats['forecast_table'] = _forecast_table.stats()
+    return jsonify(stats)
+
+# API endpoint exposing COMTRADE rate limiter queue depth
+@app.route('/api/rate_limit/stats', methods=['GET'])
+def rate_limit_stats():
+    return jsonify(comtradeapicall.get_rate_limit_stats())
+
+# API endpoint reporting model backend import and call latency
+@app.route('/api/model_runtime/stats', methods=['GET'])
+def model_runtime_stats():
+    return jsonify(model_runtime.get_runtime_stats())
+
+_forecast_table = forecast_table.open_default_forecast_table()
+
 # API endpoint for ML prediction
 @app.route('/api/predict', methods=['POST'])
 def predict_trade():
@@ -92,43 +236,29 @@ def predict_trade():
                 'mse': None
             }), 400
             
-        # Fetch historical data for training - with error handling
-        import pandas as pd
-        import numpy as np
-        
-        # Use 10 years of historical data
-        years = [str(y) for y in range(predict_year-10, predict_year)]
-        dfs = []
+        # Jobs need the training pool; without it a request would block instead of returning a job id
+        if data.get('async') and training_executor.get_executor().max_workers == 0:
+            return jsonify({
+                'error': 'Asynchronous prediction is unavailable: training runs in process (ML_TRAIN_WORKERS=0)',
+                'prediction': None,
+                'historical': [],
+                'model_type': model_type,
+                'prediction_year': predict_year,
+                'mse': None
+            }), 400
+            
+        # Popular corridors are answered from the precomputed table unless a live fit is requested
+        if _forecast_table is not None and not data.get('live'):
+            cached = _forecast_table.get(reporter, partner, cmd_code, flow_code, predict_year, model_type)
+            if cached is not None:
+                cached.update({'prediction_year': predict_year, 'precomputed': True})
+                return jsonify(cached)
         
-        for year in years:
-            try:
-                df_year = comtradeapicall.previewFinalData(
-                    typeCode='C',
-                    freqCode='A',
-                    clCode='HS',
-                    period=year,
-                    reporterCode=reporter,
-                    partnerCode=partner,
-                    partner2Code=None,
-                    customsCode=None,
-                    motCode=None,
-                    cmdCode=cmd_code,
-                    flowCode=flow_code,
-                    maxRecords=1000,
-                    format_output='JSON',
-                    aggregateBy=None,
-                    breakdownMode='classic',
-                    countOnly=None,
-                    includeDesc=True
-                )
-                if not df_year.empty:
-                    dfs.append(df_year)
-            except Exception as year_err:
-                print(f"Error fetching data for year {year}: {str(year_err)}")
-                # Continue with other years
+        # Use 10 years of historical data, fetched concurrently
+        df = forecast_table.fetch_history(reporter, partner, cmd_code, flow_code, predict_year)
                 
         # Check if we have any data
-        if not dfs:
+        if df.empty:
             return jsonify({
                 'error': 'No historical data available for prediction',
                 'prediction': None,
@@ -138,11 +268,26 @@ def predict_trade():
                 'mse': None
             }), 404
             
-        # Combine historical data
-        df = pd.concat(dfs, ignore_index=True)
+        # Slow model types train in the process pool unless the model is already cached
+        executor = training_executor.get_executor()
+        offload = (executor.max_workers > 0 and model_type in training_executor.OFFLOAD_MODEL_TYPES
+                   and not ml_model.has_model(df, model_type))
+        if offload and data.get('async'):
+            job_id = executor.submit(df, predict_year, partner, flow_code, model_type,
+                                     meta={'model_type': model_type, 'prediction_year': predict_year})
+            return jsonify({
+                'job_id': job_id,
+                'status': 'pending',
+                'status_url': f'/api/predict/{job_id}',
+                'model_type': model_type,
+                'prediction_year': predict_year
+            }), 202
         
         # Make prediction using machine learning model
-        result = ml_model.train_and_predict(df, predict_year, partner, flow_code, model_type=model_type)
+        if offload:
+            result = executor.run(df, predict_year, partner, flow_code, model_type)
+        else:
+            result = ml_model.train_and_predict(df, predict_year, partner, flow_code, model_type=model_type)
         
         # Ensure the result has the expected structure
         if isinstance(result, dict) and 'error' in result:
@@ -174,6 +319,174 @@ def predict_trade():
             'mse': None
         }), 500
 
+# API endpoint to poll an asynchronous prediction job
+@app.route('/api/predict/<job_id>', methods=['GET'])
+def predict_trade_job(job_id):
+    state = training_executor.get_executor().result(job_id)
+    meta = state.get('meta', {})
+    if state['status'] == 'unknown':
+        return jsonify({'error': 'Unknown or expired job', 'job_id': job_id, 'status': 'unknown'}), 404
+    if state['status'] in ('pending', 'running'):
+        return jsonify({'job_id': job_id, 'status': state['status'], **meta}), 202
+    if state['status'] == 'failed':
+        return jsonify({
+            'error': state['error'],
+            'job_id': job_id,
+            'status': 'failed',
+            'prediction': None,
+            'historical': [],
+            'mse': None,
+            **meta
+        }), 500
+    
+    result = state['result']
+    if isinstance(result, dict) and 'error' in result:
+        return jsonify({
+            'error': result['error'],
+            'job_id': job_id,
+            'status': 'done',
+            'prediction': None,
+            'historical': [],
+            'mse': None,
+            **meta
+        }), 400
+    return jsonify({**result, **meta, 'job_id': job_id, 'status': 'done'})
+
+MAX_BATCH_CORRIDORS = int(os.environ.get("MAX_BATCH_CORRIDORS", "100"))
+
+# API endpoint for forecasting many corridors in one call
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_trade_batch():
+    data = request.json or {}
+    corridors = data.get('corridors') or []
+    model_type = data.get('modelType', 'linear')
+    if not isinstance(corridors, list) or not corridors:
+        return jsonify({'error': 'corridors must be a non-empty list'}), 400
+    if len(corridors) > MAX_BATCH_CORRIDORS:
+        return jsonify({'error': f'Too many corridors ({len(corridors)}); the limit is {MAX_BATCH_CORRIDORS}'}), 400
+    
+    # Fields missing from a corridor fall back to the top-level values, then the /api/predict defaults
+    specs = []
+    for i, corridor in enumerate(corridors):
+        corridor = corridor if isinstance(corridor, dict) else {}
+        try:
+            period = _int_field(corridor, 'period', data.get('period', 2023))
+        except ValueError as e:
+            return jsonify({'error': f'corridors[{i}]: {str(e)}'}), 400
+        spec = {
+            'reporterCode': str(corridor.get('reporterCode', data.get('reporterCode', '842'))),
+            'partnerCode': str(corridor.get('partnerCode', data.get('partnerCode', '156'))),
+            'cmdCode': str(corridor.get('cmdCode', data.get('cmdCode', 'TOTAL'))),
+            'flowCode': corridor.get('flowCode', data.get('flowCode')) or None,
+            'period': period,
+        }
+        spec['years'] = [str(y) for y in range(spec['period'] - 10, spec['period'])]
+        specs.append(spec)
+    
+    # Fetch every corridor's history together; corridors sharing a history fetch it once
+    queries = []
+    for spec in specs:
+        for year in spec['years']:
+            queries.append({
+                'reporterCode': spec['reporterCode'], 'partnerCode': spec['partnerCode'],
+                'cmdCode': spec['cmdCode'], 'period': year,
+            })
+    histories = {}
+    # Same query parameters as /api/predict and the incremental sync, so all share entries
+    # Fallback and error results are left out, so they are never trained on
+    for query, df, ok in comtradeapicall.iterQueries(queries, **comtradeapicall.HISTORY_QUERY):
+        if ok:
+            histories[tuple(query.values())] = df
+    
+    batch = []
+    for spec in specs:
+        frames = [histories.get((spec['reporterCode'], spec['partnerCode'], spec['cmdCode'], year))
+                  for year in spec['years']]
+        frames = [df for df in frames if df is not None and not df.empty]
+        history = forecast_table.filter_flow(pd.concat(frames, ignore_index=True), spec['flowCode']) if frames else None
+        batch.append({
+            'df': history if history is not None and not history.empty else None,
+            'predict_year': spec['period'],
+            'partner_code': spec['partnerCode'],
+            'flow_code': spec['flowCode'],
+        })
+    
+    try:
+        results = ml_model.train_and_predict_batch(batch, model_type=model_type)
+    except Exception as e:
+        import traceback
+        print(f"Batch prediction error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e), 'results': []}), 500
+    
+    response = []
+    for spec, result in zip(specs, results):
+        item = {key: spec[key] for key in ('reporterCode', 'partnerCode', 'cmdCode', 'flowCode')}
+        item['prediction_year'] = spec['period']
+        item.update({'prediction': None, 'mse': None, 'model_type': model_type})
+        item.update(result)
+        response.append(item)
+    return jsonify({'model_type': model_type, 'results': response})
+
+# API endpoint forecasting a whole HS tree (TOTAL -> chapters -> headings -> subheadings) in one call
+@app.route('/api/predict/hierarchy', methods=['POST'])
+def predict_trade_hierarchy():
+    data = request.json or {}
+    reporter = data.get('reporterCode', '842')
+    partner = data.get('partnerCode', '156')
+    flow_code = data.get('flowCode') or None
+    level = data.get('level', 'chapter')
+    method = data.get('reconciliation', 'wls')
+    try:
+        predict_year = _int_field(data, 'period', 2023)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if level not in hs_hierarchy.LEVEL_QUERIES:
+        return jsonify({'error': f'Unknown level: {level}'}), 400
+    if method not in hs_hierarchy.RECONCILIATION_METHODS:
+        return jsonify({'error': f'Unknown reconciliation method: {method}'}), 400
+    # Either an explicit list of codes at one level, or every code at the level
+    cmd_codes = _as_list(data.get('cmdCodes'), [])
+    cmd_code = ','.join(c for c in cmd_codes if c != 'TOTAL') or hs_hierarchy.LEVEL_QUERIES[level]
+    
+    years = [str(y) for y in range(predict_year - 10, predict_year)]
+    df = comtradeapicall.fetchPeriods(
+        years,
+        typeCode='C',
+        freqCode='A',
+        clCode='HS',
+        reporterCode=reporter,
+        partnerCode=partner,
+        cmdCode=cmd_code,
+        flowCode=flow_code,
+        maxRecords=100000,
+        format_output='JSON',
+        breakdownMode='classic',
+        includeDesc=True
+    )
+    if df.empty or 'cmdCode' not in df.columns:
+        return jsonify({'error': 'No historical data available for prediction', 'trees': {}}), 404
+    # Fallback example data has no flows or HS codes to build a tree from
+    if 'flowCode' not in df.columns or 'primaryValue' not in df.columns:
+        return jsonify({
+            'error': 'COMTRADE data is unavailable; only fallback data was returned',
+            'fallback': True,
+            'trees': {}
+        }), 503
+    
+    trees = hs_hierarchy.forecast_hierarchy(df, predict_year, flow_code=flow_code, method=method)
+    if not any(tree is not None for tree in trees.values()):
+        return jsonify({'error': 'No HS code history available for prediction', 'trees': trees}), 404
+    return jsonify({
+        'reporterCode': reporter,
+        'partnerCode': partner,
+        'prediction_year': predict_year,
+        'level': level,
+        'reconciliation': method,
+        'model_type': 'trend',
+        'trees': trees
+    })
+
 # Initialize the LLM assistant
 trade_assistant = llm_assistant.TradeAssistant(api_token=os.environ.get("HUGGINGFACE_API_TOKEN"))
 
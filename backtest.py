@@ -0,0 +1,277 @@
+"""
+Rolling-origin backtesting of the prediction models
+For every corridor in a fixture dataset and every origin year, each model is trained
+on the years before the origin only and asked to forecast the origin year. The
+report records forecast error, wall time and peak memory per model type, and can be
+compared with an earlier report to catch accuracy or speed regressions:
+
+    python backtest.py --fixture data/fixture.csv --models linear xgboost trend --out data/backtest.json
+    python backtest.py --synthetic 50 --baseline data/backtest.json
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import ml_model
+import trend_engine
+from model_registry import ModelRegistry
+from trade_normalize import normalize_trade_frame
+
+logger = logging.getLogger(__name__)
+
+# 'trend' is the vectorized trend engine, fitted for all corridors at once
+MODEL_TYPES = ['linear', 'xgboost', 'lstm', 'trend']
+
+
+def load_fixture(path: str) -> pd.DataFrame:
+    """Load a fixture exported as CSV, NDJSON or Arrow/Feather (e.g. from /api/trade/export)"""
+    if path.endswith(('.ndjson', '.jsonl')):
+        df = pd.read_json(path, lines=True, dtype=False)
+    elif path.endswith(('.arrow', '.feather')):
+        df = pd.read_feather(path)
+    else:
+        df = pd.read_csv(path, dtype={key: str for key in trend_engine.SERIES_KEYS})
+    return normalize_trade_frame(df)
+
+
+def synthetic_fixture(n_series: int = 50, years: Iterable[int] = range(2008, 2023), seed: int = 0) -> pd.DataFrame:
+    """
+    Generate corridors with a trend, noise and an occasional level shift
+
+    Deterministic for a given seed, so reports from different runs are comparable.
+    """
+    rng = np.random.default_rng(seed)
+    years = np.asarray(list(years))
+    partners = ['156', '276', '392', '410', '124', '484', '826', '250', '356', '076']
+    rows = []
+    for i in range(n_series):
+        level = rng.lognormal(20, 1.5)
+        growth = rng.normal(0.03, 0.05)
+        shift = rng.integers(len(years)) if rng.random() < 0.3 else None
+        for j, year in enumerate(years):
+            value = level * (1 + growth) ** j * rng.lognormal(0, 0.08)
+            if shift is not None and j >= shift:
+                value *= 0.7
+            rows.append({
+                'reporterCode': '842', 'partnerCode': partners[i % len(partners)],
+                'cmdCode': f'{i // len(partners):02d}', 'flowCode': 'X' if i % 2 else 'M',
+                'refYear': int(year), 'primaryValue': float(value),
+            })
+    return normalize_trade_frame(pd.DataFrame(rows))
+
+
+def split_series(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Split a long frame into one sorted yearly history per corridor"""
+    keys = [k for k in trend_engine.SERIES_KEYS if k in df.columns]
+    frame = df[keys + ['refYear', 'primaryValue']].copy()
+    for key in keys:
+        frame[key] = frame[key].astype(object)
+    frame['refYear'] = pd.to_numeric(frame['refYear'], errors='coerce')
+    frame['primaryValue'] = pd.to_numeric(frame['primaryValue'], errors='coerce').astype('float64')
+    frame = frame.dropna(subset=['refYear', 'primaryValue'])
+    yearly = frame.groupby(keys + ['refYear'], as_index=False)['primaryValue'].sum()
+    series = []
+    for key, history in yearly.groupby(keys, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        series.append({'key': dict(zip(keys, key)), 'history': history.sort_values('refYear').reset_index(drop=True)})
+    return series
+
+
+def _errors(actual: np.ndarray, predicted: np.ndarray) -> Dict[str, Any]:
+    if len(actual) == 0:
+        return {'forecasts': 0, 'mae': None, 'rmse': None, 'mape': None}
+    error = predicted - actual
+    nonzero = actual != 0
+    return {
+        'forecasts': int(len(actual)),
+        'mae': float(np.mean(np.abs(error))),
+        'rmse': float(np.sqrt(np.mean(error ** 2))),
+        'mape': float(np.mean(np.abs(error[nonzero] / actual[nonzero]))) if nonzero.any() else None,
+    }
+
+
+def _forecast_ml(series: List[Dict[str, Any]], model_type: str, origins: List[int]):
+    """Forecast each origin of each corridor with ml_model; returns (actuals, predictions, failures)"""
+    actuals, predictions, failures = [], [], 0
+    for item in series:
+        history, key = item['history'], item['key']
+        for origin in origins:
+            train = history[history['refYear'] < origin]
+            target = history[history['refYear'] == origin]
+            if target.empty or len(train) < 2:
+                continue
+            result = ml_model.train_and_predict(
+                train, origin, key.get('partnerCode', 0), key.get('flowCode'), model_type=model_type
+            )
+            if 'error' in result:
+                failures += 1
+                if failures == 1:
+                    logger.warning(f"{model_type}: {result['error']}")
+                continue
+            actuals.append(float(target['primaryValue'].iloc[0]))
+            predictions.append(result['prediction'])
+    return np.array(actuals), np.array(predictions), failures
+
+
+def _forecast_trend(series: List[Dict[str, Any]], origins: List[int]):
+    """Forecast every origin for all corridors at once with the trend engine"""
+    if not series:
+        return np.array([]), np.array([]), 0
+    years = np.array(sorted({int(y) for item in series for y in item['history']['refYear']}), dtype=np.float64)
+    values = np.full((len(series), len(years)), np.nan)
+    for i, item in enumerate(series):
+        values[i, np.searchsorted(years, item['history']['refYear'].to_numpy(dtype=np.float64))] = \
+            item['history']['primaryValue'].to_numpy()
+    actuals, predictions = [], []
+    for origin in origins:
+        column = np.searchsorted(years, origin)
+        if column >= len(years) or years[column] != origin:
+            continue
+        fit = trend_engine.fit_trends(values[:, :column], years[:column], origin)
+        usable = (fit['n_obs'] >= 2) & ~np.isnan(values[:, column])
+        actuals.append(values[usable, column])
+        predictions.append(fit['forecast'][usable])
+    if not actuals:
+        return np.array([]), np.array([]), 0
+    return np.concatenate(actuals), np.concatenate(predictions), 0
+
+
+def _run_model(series, model_type, origins):
+    if model_type == 'trend':
+        return _forecast_trend(series, origins)
+    return _forecast_ml(series, model_type, origins)
+
+
+def backtest(df: pd.DataFrame, model_types: Iterable[str] = ('linear', 'trend'), min_train: int = 5,
+             memory_sample: int = 3) -> Dict[str, Any]:
+    """
+    Run rolling-origin evaluation of each model type on a fixture
+
+    Origins are every year after the first min_train years. Wall time covers the
+    full run; peak memory is traced (tracemalloc, Python-level allocations) in a
+    separate pass over the first memory_sample corridors, since tracing slows
+    allocation-heavy code down. Models are trained with a private, memory-only
+    registry so the backtest neither reads nor pollutes the shared model cache,
+    and always from scratch: incremental updates from the previous origin are
+    disabled, so reports stay comparable across runs.
+
+    Returns:
+        Report dict with config, environment and per-model metrics
+    """
+    series = split_series(df)
+    all_years = sorted({int(y) for item in series for y in item['history']['refYear']})
+    origins = all_years[min_train:]
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'corridors': len(series), 'years': [all_years[0], all_years[-1]] if all_years else [],
+            'origins': origins, 'min_train': min_train, 'memory_sample': memory_sample,
+        },
+        'environment': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(),
+        },
+        'models': {},
+    }
+
+    saved_registry, saved_updates = ml_model._registry, ml_model.MAX_INCREMENTAL_UPDATES
+    ml_model._registry = ModelRegistry(None, max_models=1)
+    ml_model.MAX_INCREMENTAL_UPDATES = 0
+    try:
+        for model_type in model_types:
+            start = time.perf_counter()
+            actuals, predictions, failures = _run_model(series, model_type, origins)
+            seconds = time.perf_counter() - start
+
+            tracemalloc.start()
+            _run_model(series[:memory_sample], model_type, origins)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            metrics = _errors(actuals, predictions)
+            metrics.update({
+                'failures': failures,
+                'seconds': seconds,
+                'ms_per_forecast': (seconds * 1000 / metrics['forecasts']) if metrics['forecasts'] else None,
+                'peak_memory_mb': peak / 1e6,
+            })
+            report['models'][model_type] = metrics
+    finally:
+        ml_model._registry = saved_registry
+        ml_model.MAX_INCREMENTAL_UPDATES = saved_updates
+    return report
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], time_tolerance: float = 1.25,
+                    error_tolerance: float = 1.05) -> List[str]:
+    """
+    List regressions of current against baseline
+
+    A model regresses when its time per forecast grows by more than
+    time_tolerance times, or its MAPE (or MAE without MAPE) by more than
+    error_tolerance times.
+    """
+    regressions = []
+    for model_type, metrics in current['models'].items():
+        before = baseline.get('models', {}).get(model_type)
+        if not before:
+            continue
+        if before.get('ms_per_forecast') and metrics.get('ms_per_forecast'):
+            ratio = metrics['ms_per_forecast'] / before['ms_per_forecast']
+            if ratio > time_tolerance:
+                regressions.append(f"{model_type}: {ratio:.2f}x slower per forecast")
+        error = 'mape' if metrics.get('mape') is not None and before.get('mape') else 'mae'
+        if before.get(error) and metrics.get(error) is not None:
+            ratio = metrics[error] / before[error]
+            if ratio > error_tolerance:
+                regressions.append(f"{model_type}: {error} {ratio:.2f}x worse")
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Render the per-model metrics as a text table"""
+    lines = [
+        f"Backtest: {report['config']['corridors']} corridors, origins {report['config']['origins']}",
+        f"{'model':8s} {'forecasts':>9s} {'MAPE':>8s} {'RMSE':>12s} {'ms/fcst':>9s} {'total s':>8s} {'peak MB':>8s} {'fail':>5s}",
+    ]
+    for model_type, m in report['models'].items():
+        mape = f"{m['mape'] * 100:7.1f}%" if m['mape'] is not None else f"{'-':>8s}"
+        rmse = f"{m['rmse']:12.4g}" if m['rmse'] is not None else f"{'-':>12s}"
+        per = f"{m['ms_per_forecast']:9.2f}" if m['ms_per_forecast'] is not None else f"{'-':>9s}"
+        lines.append(f"{model_type:8s} {m['forecasts']:9d} {mape} {rmse} {per} {m['seconds']:8.2f} "
+                     f"{m['peak_memory_mb']:8.1f} {m['failures']:5d}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the prediction models")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--fixture", help="CSV, NDJSON or Arrow file of COMTRADE rows")
+    source.add_argument("--synthetic", type=int, default=None, help="Generate this many synthetic corridors")
+    parser.add_argument("--models", nargs="+", default=['linear', 'trend'], choices=MODEL_TYPES)
+    parser.add_argument("--min-train", type=int, default=5, help="Years of history before the first origin")
+    parser.add_argument("--memory-sample", type=int, default=3, help="Corridors traced for peak memory")
+    parser.add_argument("--out", default=None, help="Write the report to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    fixture = load_fixture(args.fixture) if args.fixture else synthetic_fixture(args.synthetic or 50)
+    report = backtest(fixture, args.models, min_train=args.min_train, memory_sample=args.memory_sample)
+    print(format_report(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_reports(report, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
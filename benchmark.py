@@ -0,0 +1,475 @@
+"""
+Benchmarks for the International Trade Flow Predictor
+Run individual benchmarks from the command line, e.g.
+
+    python benchmark.py connections
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+import requests
+
+# Benchmarks must not read from or write to the persistent store
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+import numpy as np
+import pandas as pd
+
+import comtradeapicall
+import http_session
+import trade_decode
+from rate_limiter import RateLimiter
+from trade_normalize import json_records, normalize_trade_frame
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests"))
+from conftest import StubComtradeServer
+
+
+def synthetic_dataset(n_rows, seed=0):
+    """Return a COMTRADE-style 'dataset' list of n_rows records"""
+    rng = np.random.default_rng(seed)
+    partners = ['156', '276', '392', '410', '124', '484', '826', '250']
+    commodities = ['TOTAL', '01', '27', '30', '84', '85', '87', '90']
+    values = rng.lognormal(18, 2, n_rows)
+    return [
+        {
+            'typeCode': 'C', 'freqCode': 'A', 'refYear': 2012 + i % 10, 'period': str(2012 + i % 10),
+            'reporterCode': 842, 'reporterISO': 'USA', 'reporterDesc': 'USA',
+            'flowCode': 'X' if i % 2 else 'M', 'flowDesc': 'Export' if i % 2 else 'Import',
+            'partnerCode': int(partners[i % len(partners)]), 'partnerDesc': f'Partner {partners[i % len(partners)]}',
+            'classificationCode': 'H6', 'cmdCode': commodities[(i // 8) % len(commodities)],
+            'cmdDesc': f'Commodity {commodities[(i // 8) % len(commodities)]}',
+            'qtyUnitCode': 8, 'qty': None if i % 7 == 0 else float(values[i] / 10),
+            'netWgt': float(values[i] / 3), 'primaryValue': float(values[i]),
+            'cifvalue': None, 'fobvalue': float(values[i]) if i % 2 else None, 'isReported': True,
+        }
+        for i in range(n_rows)
+    ]
+
+
+def bench_connections(n=100):
+    """Compare TCP connection setups for n requests with plain requests.get vs the pooled session"""
+    with StubComtradeServer() as server:
+        start = time.perf_counter()
+        for _ in range(n):
+            requests.get(server.url, params={'ps': '2022'}, timeout=5).json()
+        plain_time = time.perf_counter() - start
+        plain_connections = server.connections
+
+        server.reset()
+        session = http_session.get_session()
+        start = time.perf_counter()
+        for _ in range(n):
+            session.get(server.url, params={'ps': '2022'}, timeout=http_session.get_timeout()).json()
+        pooled_time = time.perf_counter() - start
+        pooled_connections = server.connections
+
+    print(f"{n} requests against a local stub server")
+    print(f"  requests.get:   {plain_connections:4d} connections, {plain_time * 1000:8.1f} ms")
+    print(f"  pooled session: {pooled_connections:4d} connections, {pooled_time * 1000:8.1f} ms")
+    return {'plain': plain_connections, 'pooled': pooled_connections}
+
+
+def bench_async(n=200):
+    """Run n distinct lookups on one event loop against a local stub server"""
+    from comtrade_async import AsyncComtradeClient
+
+    # The stub server is not rate limited; keep the limiter out of the measurement
+    limiter = comtradeapicall._rate_limiter
+    comtradeapicall._rate_limiter = RateLimiter([])
+    comtradeapicall._data_cache.clear()
+    try:
+        with StubComtradeServer() as server:
+            async def run():
+                async with AsyncComtradeClient(base_url=server.url, alternative_url=server.url) as client:
+                    queries = [{'period': str(2000 + i % 20), 'reporterCode': str(i)} for i in range(n)]
+                    return await client.fetchMany(queries)
+
+            start = time.perf_counter()
+            frames = asyncio.run(run())
+            elapsed = time.perf_counter() - start
+    finally:
+        comtradeapicall._rate_limiter = limiter
+
+    print(f"{n} async lookups on one event loop: {elapsed * 1000:.1f} ms, "
+          f"{server.connections} connections, {sum(len(f) for f in frames)} rows")
+    return {'seconds': elapsed, 'connections': server.connections}
+
+
+def bench_normalize(n=10000, repeats=50):
+    """Compare cached memory per row and /api/trade serialization time before and after normalization"""
+    raw = pd.DataFrame(synthetic_dataset(n))
+    raw.loc[::97, 'primaryValue'] = np.inf
+    normalized = normalize_trade_frame(raw)
+
+    raw_bytes = raw.memory_usage(deep=True).sum() / n
+    normalized_bytes = normalized.memory_usage(deep=True).sum() / n
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        # Previous /api/trade path: clean the whole frame on every request
+        df = raw.replace([np.nan, np.inf, -np.inf], None)
+        df.head(10).to_dict(orient='records')
+    before = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        json_records(normalized.head(10))
+    after = (time.perf_counter() - start) / repeats
+
+    print(f"Ingest normalization, {n} rows")
+    print(f"  memory per cached row:      {raw_bytes:8.1f} B -> {normalized_bytes:8.1f} B")
+    print(f"  serialization per request:  {before * 1000:8.2f} ms -> {after * 1000:8.2f} ms")
+    return {'bytes_before': raw_bytes, 'bytes_after': normalized_bytes, 'seconds_before': before, 'seconds_after': after}
+
+
+# Raw COMTRADE response bodies recorded with record_decode_fixtures (or saved by hand)
+FIXTURE_DIR = os.environ.get("BENCH_FIXTURE_DIR", os.path.join("data", "fixtures"))
+
+
+def record_decode_fixtures(directory=FIXTURE_DIR, sizes=(1000, 10000, 100000), period='2022', reporterCode='842'):
+    """
+    Save raw COMTRADE responses of up to each size in records as decode_<n>.json
+
+    Queries all partners and HS6 commodities of one reporter so large responses
+    are available; the bodies are written exactly as received.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for n in sizes:
+        params = comtradeapicall._build_params(
+            'C', 'A', 'HS', period, reporterCode, None, None, None, None, 'AG6', None, n, 'JSON',
+            None, 'classic', None)
+        comtradeapicall._rate_limiter.acquire()
+        response = http_session.get_session().get(comtradeapicall.BASE_URL, params=params, timeout=http_session.get_timeout())
+        response.raise_for_status()
+        path = os.path.join(directory, f"decode_{n}.json")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        paths.append(path)
+        print(f"Recorded {len(response.content) / 1e6:.1f} MB to {path}")
+    return paths
+
+
+def decode_fixtures(directory=FIXTURE_DIR, sizes=(1000, 10000, 100000)):
+    """
+    Return the response files bench_decode measures
+
+    Recorded responses in directory are used when there are any; otherwise
+    deterministic synthetic responses in the COMTRADE layout (compact JSON, as the
+    API sends it) are written to a temporary directory.
+    """
+    import tempfile
+
+    paths = sorted(glob.glob(os.path.join(directory, "*.json")), key=os.path.getsize)
+    if paths:
+        return paths
+    directory = tempfile.mkdtemp(prefix="comtrade_fixtures_")
+    for n in sizes:
+        path = os.path.join(directory, f"synthetic_{n}.json")
+        document = {
+            'elapsedTime': '0.5 secs', 'count': n, 'error': '',
+            'validation': {'status': {'name': 'Ok', 'value': 0}, 'valid': [
+                {'type': 'reporter', 'id': 842, 'text': 'USA'}, {'type': 'partner', 'id': 156, 'text': 'China'}]},
+            'dataset': synthetic_dataset(n),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, separators=(',', ':'))
+        paths.append(path)
+    return paths
+
+
+def bench_decode(directory=FIXTURE_DIR):
+    """Compare json.loads / orjson + pd.DataFrame(rows) with trade_decode on response files"""
+    import tracemalloc
+
+    paths = decode_fixtures(directory)
+    print(f"Payload decoding (backend: {trade_decode.JSON_BACKEND}); time / peak traced memory")
+    results = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            payload = f.read()
+
+        candidates = {
+            'json': lambda: pd.DataFrame(json.loads(payload)['dataset']),
+            'decoded': lambda: trade_decode.frame_from_records(trade_decode.decode_payload(payload)['dataset']),
+        }
+        if trade_decode.orjson is not None:
+            candidates['orjson'] = lambda: pd.DataFrame(trade_decode.orjson.loads(payload)['dataset'])
+
+        timings = {}
+        for name, fn in candidates.items():
+            rows = len(fn())  # warm up
+            elapsed = min(_time_calls(fn, 1) for _ in range(3))
+            # Measured separately: tracing allocations distorts the timing
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            timings[name] = (elapsed, peak)
+        results[os.path.basename(path)] = timings
+        print(f"  {os.path.basename(path):22s} {rows:7d} rows: " + "  ".join(
+            f"{name} {t * 1000:7.1f} ms / {m / 1e6:6.1f} MB" for name, (t, m) in timings.items()))
+    return results
+
+
+def bench_features(n=10000, repeats=20):
+    """Compare per-request featurization cost of the old prepare_features with the feature store"""
+    import feature_store
+
+    df = normalize_trade_frame(pd.DataFrame(synthetic_dataset(n)))
+
+    def legacy(df):
+        df = df.copy()
+        df['year'] = df['refYear'].astype(int)
+        df['flowCode'] = df['flowCode'].astype(object).map({'M': 0, 'X': 1}).fillna(-1).astype(int)
+        df['partnerCode'] = df['partnerCode'].astype(int)
+        df = df[df['primaryValue'].notnull()]
+        return df[['year', 'flowCode', 'partnerCode']], df['primaryValue'].astype(float)
+
+    timings = {}
+    store = feature_store.FeatureStore()
+    for name, fn in (('legacy', legacy),
+                     ('compute', feature_store.compute_features),
+                     ('fingerprint', feature_store.dataset_fingerprint),
+                     ('cached', store.get_features)):
+        fn(df)  # warm up (and fill the store)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn(df)
+        timings[name] = (time.perf_counter() - start) / repeats
+
+    print(f"Featurization per /api/predict request, {n} rows")
+    print(f"  legacy prepare_features:   {timings['legacy'] * 1000:8.2f} ms")
+    print(f"  vectorized compute:        {timings['compute'] * 1000:8.2f} ms")
+    print(f"  feature store hit:         {timings['cached'] * 1000:8.2f} ms "
+          f"(of which fingerprint {timings['fingerprint'] * 1000:.2f} ms)")
+    return timings
+
+
+def bench_models(n=5000, repeats=20, model_types=('linear', 'xgboost', 'lstm')):
+    """Compare the first (training) and repeat (registry hit) prediction latency per model type"""
+    import ml_model
+
+    df = normalize_trade_frame(pd.DataFrame(synthetic_dataset(n)))
+    print(f"Prediction latency with the model registry, {n} rows")
+    results = {}
+    for model_type in model_types:
+        start = time.perf_counter()
+        result = ml_model.train_and_predict(df, 2023, '156', 'X', model_type=model_type)
+        first = time.perf_counter() - start
+        if 'error' in result:
+            print(f"  {model_type:8s} skipped: {result['error']}")
+            continue
+        start = time.perf_counter()
+        for year in range(repeats):
+            ml_model.train_and_predict(df, 2023 + year, '156', 'X', model_type=model_type)
+        repeat = (time.perf_counter() - start) / repeats
+        results[model_type] = (first, repeat)
+        print(f"  {model_type:8s} first: {first * 1000:9.1f} ms   repeat: {repeat * 1000:7.2f} ms")
+    return results
+
+
+def bench_trends(n_series=10000, n_years=10, sample=200):
+    """Compare per-series LinearRegression fits with the vectorized trend engine"""
+    from sklearn.linear_model import LinearRegression
+    import trend_engine
+
+    rng = np.random.default_rng(0)
+    years = np.arange(2013, 2013 + n_years, dtype=np.float64)
+    values = rng.lognormal(18, 2, (n_series, n_years)) * (1 + 0.05 * np.arange(n_years))
+    values[rng.random(values.shape) < 0.1] = np.nan
+
+    # Per-series sklearn fits are timed on a sample and scaled up
+    start = time.perf_counter()
+    for row in values[:sample]:
+        observed = ~np.isnan(row)
+        LinearRegression().fit(years[observed, None], row[observed])
+    per_series = (time.perf_counter() - start) / sample
+
+    start = time.perf_counter()
+    trend_engine.fit_trends(values, years)
+    vectorized = time.perf_counter() - start
+
+    print(f"Trend fits, {n_series} series x {n_years} years")
+    print(f"  per-series LinearRegression: {per_series * n_series:8.3f} s (extrapolated from {sample})")
+    print(f"  vectorized fit_trends:       {vectorized:8.3f} s")
+    return {'seconds_before': per_series * n_series, 'seconds_after': vectorized}
+
+
+def bench_runtime(n=2000):
+    """Report backend import time and first vs repeat LSTM training with the pooled compiled model"""
+    import ml_model
+    import model_runtime
+
+    for name in model_runtime.BACKEND_MODULES:
+        try:
+            model_runtime.load_backend(name)
+        except ImportError:
+            pass
+    df = normalize_trade_frame(pd.DataFrame(synthetic_dataset(n)))
+    results = {}
+    for seed in range(3):
+        # A different history each time so the model registry cannot answer
+        shifted = df.assign(primaryValue=df['primaryValue'] * (1 + seed / 10))
+        start = time.perf_counter()
+        result = ml_model.train_and_predict(shifted, 2023, '156', 'X', model_type='lstm')
+        results[seed] = time.perf_counter() - start
+        if 'error' in result:
+            break
+    stats = model_runtime.get_runtime_stats()
+    print("Model runtime")
+    for name, backend in stats['backends'].items():
+        status = f"{backend['import_seconds']:.2f} s" if backend['loaded'] else "not installed"
+        print(f"  import {name:12s} {status}")
+    if 'train_lstm' in stats['calls']:
+        print("  lstm fits: " + ", ".join(f"{seconds:.2f} s" for seconds in results.values()))
+    return stats
+
+
+def bench_updates(rows_per_year=500, model_types=('linear', 'xgboost', 'lstm')):
+    """Compare retraining a corridor's model from scratch with updating it when a new year arrives"""
+    import ml_model
+    from model_registry import ModelRegistry
+
+    rng = np.random.default_rng(0)
+    years = np.repeat(np.arange(2012, 2024), rows_per_year)
+    df = pd.DataFrame({
+        'reporterCode': '842', 'partnerCode': '156', 'cmdCode': 'TOTAL',
+        'flowCode': np.where(np.arange(len(years)) % 2, 'X', 'M'), 'refYear': years,
+        'primaryValue': rng.lognormal(18, 1, len(years)) * (1 + 0.05 * (years - 2012)),
+    })
+    before = df[df['refYear'] < 2022].reset_index(drop=True)
+    after = df[df['refYear'] > 2012].reset_index(drop=True)
+    print(f"Model refresh when a new year arrives, {rows_per_year} rows per year, 10-year window")
+    results = {}
+    for model_type in model_types:
+        timings = {}
+        for mode in ('retrain', 'update'):
+            ml_model._registry = ModelRegistry(None)
+            try:
+                if mode == 'update':
+                    ml_model.get_model(before, model_type)
+                start = time.perf_counter()
+                entry = ml_model.get_model(after, model_type)
+                timings[mode] = time.perf_counter() - start
+            except ImportError as e:
+                print(f"  {model_type:8s} skipped: {str(e)}")
+                break
+            timings[f'{mode}_mse'] = entry['mse']
+        else:
+            results[model_type] = timings
+            print(f"  {model_type:8s} retrain: {timings['retrain'] * 1000:9.1f} ms   update: {timings['update'] * 1000:9.1f} ms")
+    return results
+
+
+_LSTM_RSS_SCRIPTS = {
+    'numpy': (
+        "import numpy as np, lstm_inference\n"
+        "rng = np.random.default_rng(0)\n"
+        "model = lstm_inference.NumpyLSTM(rng.normal(size=(1, {w})), rng.normal(size=({u}, {w})), np.zeros({w}),"
+        " rng.normal(size=({u}, 1)), np.zeros(1))\n"
+        "model.predict(np.zeros((1, 1, 1)))\n"
+    ),
+    'keras': (
+        "import numpy as np, tensorflow as tf\n"
+        "model = tf.keras.Sequential([tf.keras.layers.LSTM({u}, input_shape=(1, 1)), tf.keras.layers.Dense(1)])\n"
+        "model.predict(np.zeros((1, 1, 1), dtype=np.float32), verbose=0)\n"
+    ),
+}
+
+
+def _peak_rss_mb(script):
+    """Run a script in a fresh interpreter and return its peak resident memory in MB, or None if it fails"""
+    import subprocess
+    import sys
+
+    # ru_maxrss starts from the forking parent's peak on Linux, so read the exec'd process' own VmHWM there
+    code = script + (
+        "import resource, sys\n"
+        "try:\n"
+        "    print([l.split()[1] for l in open('/proc/self/status') if l.startswith('VmHWM')][0])\n"
+        "except OSError:\n"
+        "    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return int(proc.stdout.split()[-1]) / 1e3
+
+
+def bench_lstm_inference(units=16, repeats=2000):
+    """Compare per-prediction latency and resident memory of the NumPy LSTM with the Keras paths"""
+    import lstm_inference
+    import model_runtime
+
+    x = np.zeros((1, 1, 1), dtype=np.float32)
+    try:
+        model_runtime.load_backend('tensorflow')
+        with model_runtime.lstm_pool.lease(units) as keras_model:
+            numpy_model = lstm_inference.export_lstm(keras_model)
+            probe = np.linspace(-1, 2, 50, dtype=np.float32).reshape((-1, 1, 1))
+            diff = np.abs(keras_model.predict(probe, verbose=0) - numpy_model.predict(probe)).max()
+            paths = {
+                'keras predict()': lambda: keras_model.predict(x, verbose=0),
+                'keras __call__': lambda: keras_model(x, training=False),
+            }
+            timings = {name: _time_calls(call, max(repeats // 20, 10)) for name, call in paths.items()}
+    except ImportError:
+        rng = np.random.default_rng(0)
+        numpy_model = lstm_inference.NumpyLSTM(rng.normal(size=(1, 4 * units)), rng.normal(size=(units, 4 * units)),
+                                               np.zeros(4 * units), rng.normal(size=(units, 1)), np.zeros(1))
+        diff, timings = None, {}
+    timings['numpy'] = _time_calls(lambda: numpy_model.predict(x), repeats)
+
+    print(f"LSTM({units}) -> Dense(1) single-row prediction")
+    for name, seconds in timings.items():
+        print(f"  {name:16s} {seconds * 1e6:10.1f} us")
+    if diff is not None:
+        print(f"  max |keras - numpy| over 50 inputs: {diff:.2e}")
+    else:
+        print("  keras paths skipped: tensorflow is not installed")
+    for name, script in _LSTM_RSS_SCRIPTS.items():
+        rss = _peak_rss_mb(script.format(u=units, w=4 * units))
+        print(f"  peak RSS {name:7s} {f'{rss:8.1f} MB' if rss is not None else 'unavailable'}")
+    return timings
+
+
+def _time_calls(call, repeats):
+    call()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        call()
+    return (time.perf_counter() - start) / repeats
+
+
+BENCHMARKS = {
+    'async': bench_async,
+    'connections': bench_connections,
+    'decode': bench_decode,
+    'features': bench_features,
+    'lstm_inference': bench_lstm_inference,
+    'models': bench_models,
+    'normalize': bench_normalize,
+    'runtime': bench_runtime,
+    'trends': bench_trends,
+    'updates': bench_updates,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run performance benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument("--record", action="store_true",
+                        help="Record COMTRADE responses for the decode benchmark first (uses the live API)")
+    args = parser.parse_args()
+    if args.record:
+        record_decode_fixtures()
+    names = sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,248 @@
+"""
+Asyncio client for the UN COMTRADE API
+Same parameters, caching and fallback behaviour as comtradeapicall.previewFinalData,
+but waits for the network, retries and the rate limiter without blocking a thread
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+import comtradeapicall
+from http_session import CONNECT_TIMEOUT, POOL_MAXSIZE, READ_TIMEOUT
+from trade_decode import decode_payload
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncComtradeClient:
+    """
+    Reusable async COMTRADE client holding one aiohttp session
+
+    Use as an async context manager so the connection pool is closed:
+
+        async with AsyncComtradeClient() as client:
+            df = await client.previewFinalData(period='2022', reporterCode='842', partnerCode='156')
+
+    base_url and alternative_url default to the module URLs in comtradeapicall and
+    can point at a local fake server for testing.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, alternative_url: Optional[str] = None,
+                 max_connections: int = POOL_MAXSIZE, retry_delay: float = 2, max_retries: int = 3):
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("aiohttp is not installed. Please install it to use the async COMTRADE client.")
+        self.base_url = base_url or comtradeapicall.BASE_URL
+        self.alternative_url = alternative_url or comtradeapicall.BASE_URL_ALTERNATIVE
+        self.max_connections = max_connections
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self._session = None
+        self._in_flight = {}  # cache key -> Task, coalesces identical concurrent lookups
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+                headers={'Accept-Encoding': 'gzip, deflate'}
+            )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def previewFinalData(
+        self,
+        typeCode='C',
+        freqCode='A',
+        clCode='HS',
+        period=None,
+        reporterCode=None,
+        partnerCode=None,
+        partner2Code=None,
+        customsCode=None,
+        motCode=None,
+        cmdCode=None,
+        flowCode=None,
+        maxRecords=500,
+        format_output='JSON',
+        aggregateBy=None,
+        breakdownMode='classic',
+        countOnly=None,
+        includeDesc=True
+    ) -> pd.DataFrame:
+        """
+        Async counterpart of comtradeapicall.previewFinalData
+
+        Shares the in-memory cache and on-disk store with the synchronous client.
+        See comtradeapicall.previewFinalData for the parameters.
+
+        Returns:
+            Pandas DataFrame containing the trade data
+        """
+        await self.open()
+        cache_key = comtradeapicall.make_cache_key(
+            typeCode=typeCode, freqCode=freqCode, clCode=clCode, period=period,
+            reporterCode=reporterCode, partnerCode=partnerCode, partner2Code=partner2Code,
+            customsCode=customsCode, motCode=motCode, cmdCode=cmdCode, flowCode=flowCode,
+            maxRecords=maxRecords, format_output=format_output, aggregateBy=aggregateBy,
+            breakdownMode=breakdownMode, countOnly=countOnly, includeDesc=includeDesc
+        )
+        cached = comtradeapicall._data_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached data for {cache_key}")
+            return cached
+
+        task = self._in_flight.get(cache_key)
+        if task is None:
+            params = comtradeapicall._build_params(
+                typeCode, freqCode, clCode, period, reporterCode, partnerCode, partner2Code,
+                customsCode, motCode, cmdCode, flowCode, maxRecords, format_output,
+                aggregateBy, breakdownMode, countOnly
+            )
+            context = (reporterCode, partnerCode, period, cmdCode, flowCode, includeDesc)
+            task = asyncio.ensure_future(self._load(cache_key, params, clCode, context))
+            self._in_flight[cache_key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(cache_key, None))
+        # Shield so one cancelled caller does not cancel the fetch others are waiting on
+        return await asyncio.shield(task)
+
+    async def fetchPeriods(self, periods: Iterable[Any], **kwargs) -> pd.DataFrame:
+        """
+        Async counterpart of comtradeapicall.fetchPeriods
+
+        All periods are requested concurrently on the event loop; the rate limiter
+        and the connection limit decide how many are actually on the wire.
+        """
+        periods = [str(p) for p in periods]
+        results = await asyncio.gather(
+            *(self.previewFinalData(period=p, **kwargs) for p in periods),
+            return_exceptions=True
+        )
+        dfs = []
+        for period, result in zip(periods, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching data for period {period}: {str(result)}")
+            elif not result.empty:
+                dfs.append(result)
+        if not dfs:
+            return pd.DataFrame()
+        return pd.concat(dfs, ignore_index=True)
+
+    async def fetchMany(self, queries: List[Dict[str, Any]]) -> List[pd.DataFrame]:
+        """Run many previewFinalData lookups (one kwargs dict each) concurrently, in order"""
+        return await asyncio.gather(*(self.previewFinalData(**query) for query in queries))
+
+    async def _load(self, cache_key, params, clCode, context) -> pd.DataFrame:
+        reporterCode, partnerCode, period = context[0], context[1], context[2]
+        store = comtradeapicall._store
+        if store is not None:
+            stored = store.get(cache_key)
+            if stored is not None:
+                comtradeapicall._data_cache.set(cache_key, stored)
+                return stored
+
+        df, ok = await self._fetch_from_api(params, *context)
+        if ok and store is not None:
+            store.put(cache_key, df, clCode=clCode, reporterCode=reporterCode, period=period)
+        comtradeapicall._data_cache.set(cache_key, df, negative=not ok)
+        return df
+
+    async def _fetch_from_api(self, params, reporterCode, partnerCode, period, cmdCode, flowCode, includeDesc):
+        """Request/retry loop mirroring comtradeapicall._fetch_from_api, with non-blocking waits"""
+        limiter = comtradeapicall._rate_limiter
+
+        def fallback():
+            return comtradeapicall.get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode)
+
+        # aiohttp rejects None query values
+        query = {k: str(v) for k, v in params.items() if v is not None}
+        use_alternative = False
+
+        for attempt in range(self.max_retries):
+            current_url = self.alternative_url if use_alternative else self.base_url
+            try:
+                wait_timeout = comtradeapicall.get_rate_wait_timeout()
+                if not await limiter.acquire_async(timeout=wait_timeout):
+                    logger.warning(f"Rate limit budget exhausted for more than {wait_timeout:g} seconds; using fallback data")
+                    return fallback(), False
+                async with self._session.get(current_url, params=query) as response:
+                    if response.status == 200:
+                        data = decode_payload(await response.read())
+                        return comtradeapicall._parse_payload(data, reporterCode, partnerCode, includeDesc)
+
+                    if response.status == 429:
+                        wait_time = int(response.headers.get('Retry-After', 5))
+                        logger.warning(f"Rate limited. Delaying all requests by {wait_time} seconds...")
+                        limiter.penalize(wait_time)
+                        continue
+
+                    if response.status == 404:
+                        if attempt < self.max_retries - 1:
+                            logger.warning("Request failed with status 404. Switching to alternative endpoint...")
+                            use_alternative = True
+                            await asyncio.sleep(self.retry_delay)
+                            continue
+                        logger.error("All retries failed with 404. API endpoints may be unavailable.")
+                        return fallback(), False
+
+                    if attempt < self.max_retries - 1:
+                        logger.warning(f"Request failed with status {response.status}. Retrying in {self.retry_delay} seconds...")
+                        await asyncio.sleep(self.retry_delay)
+                        continue
+                    text = await response.text()
+                    logger.error(f"All retries failed. Last status: {response.status}, Response: {text}")
+                    return fallback(), False
+
+            except asyncio.TimeoutError:
+                logger.warning(f"Request timed out. Attempt {attempt+1}/{self.max_retries}")
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    logger.error("All retries timed out")
+                    return pd.DataFrame({'message': ['API request timed out']}), False
+
+            except aiohttp.ClientConnectionError:
+                logger.warning(f"Connection error. Attempt {attempt+1}/{self.max_retries}")
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    logger.error("All retries failed with connection errors")
+                    return fallback(), False
+
+            except Exception as e:
+                logger.error(f"Unexpected error: {str(e)}")
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    logger.error(f"All retries failed with errors: {str(e)}")
+                    return pd.DataFrame({'message': [f'Unexpected error: {str(e)}']}), False
+
+        logger.error("All retries were rate limited")
+        return fallback(), False
+
+
+async def previewFinalDataAsync(**kwargs) -> pd.DataFrame:
+    """
+    One-off async lookup with a temporary client
+
+    Bulk callers should keep an AsyncComtradeClient open instead so connections are reused.
+    """
+    async with AsyncComtradeClient() as client:
+        return await client.previewFinalData(**kwargs)
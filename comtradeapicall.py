@@ -8,7 +8,17 @@ import json
 import time
 import logging
 import os
-from typing import Dict, List, Any, Optional
+import inspect
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+
+from http_session import get_session, get_timeout
+from rate_limiter import limiter_from_env
+from trade_cache import SingleFlight, TradeCache, open_shared_cache
+from trade_decode import decode_payload, frame_from_records
+from trade_normalize import normalize_trade_frame
+from trade_store import open_default_store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +31,32 @@ BASE_URL = "https://comtrade.un.org/api/get"
 BASE_URL_ALTERNATIVE = "https://data.un.org/ws/rest/comtrade/get"
 
 # Cache for storing previous results to reduce API calls
-_data_cache = {}
+# Bounded by memory footprint with LRU eviction; failed lookups expire sooner
+_data_cache = TradeCache(
+    max_bytes=int(os.environ.get("COMTRADE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.environ.get("COMTRADE_CACHE_TTL", str(24 * 3600))),
+    negative_ttl=float(os.environ.get("COMTRADE_CACHE_NEGATIVE_TTL", "300"))
+)
+
+# Client-side limiter for the documented 1 request/second and 100 requests/hour
+_rate_limiter = limiter_from_env()
+
+# Longest a lookup waits for the rate limiter before serving fallback data instead;
+# 0 or less waits as long as needed. Incremental sync always waits.
+RATE_WAIT_TIMEOUT = float(os.environ.get("COMTRADE_RATE_WAIT_TIMEOUT", "30"))
+
+# Concurrent identical misses in this process share one upstream fetch
+_single_flight = SingleFlight()
+
+# Optional cache shared by all worker processes on the host (set COMTRADE_SHARED_CACHE)
+_shared_cache = open_shared_cache()
+
+# Persistent columnar store shared by all processes (None if disabled or pyarrow is missing)
+_store = open_default_store()
+
+# Upper bound on concurrent upstream requests issued by fetchPeriods.
+# Requests still pass through _rate_limiter, so this only bounds threads waiting on it.
+FETCH_MAX_WORKERS = int(os.environ.get("COMTRADE_FETCH_WORKERS", "4"))
 
 def previewFinalData(
     typeCode='C',
@@ -67,15 +102,119 @@ def previewFinalData(
     Returns:
         Pandas DataFrame containing the trade data
     """
-    # Create cache key based on parameters
-    cache_key = f"{typeCode}-{freqCode}-{clCode}-{period}-{reporterCode}-{partnerCode}-{partner2Code}-{cmdCode}-{flowCode}"
+    df, _ = lookupFinalData(
+        typeCode=typeCode, freqCode=freqCode, clCode=clCode, period=period,
+        reporterCode=reporterCode, partnerCode=partnerCode, partner2Code=partner2Code,
+        customsCode=customsCode, motCode=motCode, cmdCode=cmdCode, flowCode=flowCode,
+        maxRecords=maxRecords, format_output=format_output, aggregateBy=aggregateBy,
+        breakdownMode=breakdownMode, countOnly=countOnly, includeDesc=includeDesc
+    )
+    return df
+
+def lookupFinalData(**kwargs) -> Tuple[pd.DataFrame, bool]:
+    """
+    previewFinalData that also reports whether the result is genuine API data
+
+    Accepts the same keyword arguments as previewFinalData.
+
+    Returns:
+        Tuple of (DataFrame, ok) where ok is False for fallback and error frames,
+        also when they are served from a cache
+    """
+    query = dict(_PREVIEW_DEFAULTS)
+    query.update(kwargs)
+    # Cache key covers every parameter that changes the upstream response
+    cache_key = make_cache_key(**query)
     
     # Check if we have this result cached
-    if cache_key in _data_cache:
+    cached = _data_cache.lookup(cache_key)
+    if cached is not None:
         logger.info(f"Using cached data for {cache_key}")
-        return _data_cache[cache_key]
+        df, negative = cached
+        return df, not negative
+    
+    def load():
+        # Next the on-disk store, which survives restarts and is shared by workers
+        if _store is not None:
+            stored = _store.get(cache_key)
+            if stored is not None:
+                logger.info(f"Using stored data for {cache_key}")
+                _data_cache.set(cache_key, stored)
+                return stored, True
+    
+        params = _build_params(
+            query['typeCode'], query['freqCode'], query['clCode'], query['period'],
+            query['reporterCode'], query['partnerCode'], query['partner2Code'],
+            query['customsCode'], query['motCode'], query['cmdCode'], query['flowCode'],
+            query['maxRecords'], query['format_output'], query['aggregateBy'],
+            query['breakdownMode'], query['countOnly']
+        )
+    
+        def fetch():
+            df, ok = _fetch_from_api(params, query['reporterCode'], query['partnerCode'], query['period'],
+                                     query['cmdCode'], query['flowCode'], query['includeDesc'],
+                                     wait_timeout=get_rate_wait_timeout())
+            # Only genuine API results are persisted; fallback data must not outlive the outage
+            if ok and _store is not None:
+                _store.put(cache_key, df, clCode=query['clCode'], reporterCode=query['reporterCode'],
+                           period=query['period'])
+            return df, ok
+    
+        if _shared_cache is not None:
+            # Workers share results, and only one of them fetches a given key at a time
+            df, ok = _shared_cache.get_or_compute(cache_key, fetch)
+        else:
+            df, ok = fetch()
+    
+        # Failed lookups are cached too, but only briefly
+        _data_cache.set(cache_key, df, negative=not ok)
+        return df, ok
+    
+    # Identical requests already in flight in this process wait for that result
+    return _single_flight.do(cache_key, load)
+
+# Default previewFinalData arguments, used to rebuild cache keys outside the function
+_PREVIEW_DEFAULTS = {
+    name: param.default for name, param in inspect.signature(previewFinalData).parameters.items()
+}
+
+# Parameters of the yearly corridor histories the predictor trains on. Incremental
+# sync, pre-warming and every prediction path query with exactly these (plus
+# period, reporter, partner and commodity), so they read and write the same cache
+# and store entries. Histories are fetched for all flows and filtered locally.
+HISTORY_QUERY = {
+    'typeCode': 'C',
+    'freqCode': 'A',
+    'clCode': 'HS',
+    'flowCode': None,
+    'maxRecords': int(os.environ.get("COMTRADE_HISTORY_MAX_RECORDS", "1000")),
+    'format_output': 'JSON',
+    'breakdownMode': 'classic',
+    'includeDesc': True,
+}
+
+def make_cache_key(**query) -> tuple:
+    """
+    Build a normalized, hashable cache key from previewFinalData parameters
     
-    # Build the query parameters
+    Values are compared as strings so that e.g. period=2022 and period='2022'
+    share the same entry; an empty string means "no filter" like None (see
+    _build_params), so flowCode='' and flowCode=None do too.
+    """
+    return tuple(sorted((name, None if value is None or value == '' else str(value)) for name, value in query.items()))
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Return counters of the in-memory cache, request coalescing, the shared cache and the on-disk store"""
+    stats = _data_cache.stats()
+    stats['single_flight'] = _single_flight.stats()
+    stats['shared'] = _shared_cache.stats() if _shared_cache is not None else None
+    stats['store'] = _store.stats() if _store is not None else None
+    return stats
+
+def _build_params(typeCode, freqCode, clCode, period, reporterCode, partnerCode, partner2Code,
+                  customsCode, motCode, cmdCode, flowCode, maxRecords, format_output,
+                  aggregateBy, breakdownMode, countOnly) -> Dict[str, Any]:
+    """Translate previewFinalData arguments into COMTRADE query parameters"""
     params = {
         'type': typeCode,
         'freq': freqCode,
@@ -104,10 +243,59 @@ def previewFinalData(
         params['break'] = breakdownMode
     if countOnly is not None:
         params['count'] = countOnly
+    return params
+
+def _parse_payload(data, reporterCode, partnerCode, includeDesc):
+    """
+    Turn a decoded COMTRADE response into a DataFrame
+    
+    Returns:
+        Tuple of (DataFrame, ok) where ok is False if the payload had no dataset
+    """
+    # Check if the API returned a valid response
+    if 'dataset' in data and isinstance(data['dataset'], (list, pd.DataFrame)):
+        # Convert to pandas DataFrame (decode_payload usually returns it as one already)
+        df = frame_from_records(data['dataset'])
+        
+        # Add descriptions if requested
+        if includeDesc and 'validation' in data:
+            # Process validation data to add descriptions
+            for validation in data['validation']['valid']:
+                if validation['type'] == 'reporter' and 'id' in validation and validation['id'] == reporterCode:
+                    df['reporterDesc'] = validation['text']
+                if validation['type'] == 'partner' and 'id' in validation and validation['id'] == partnerCode:
+                    df['partnerDesc'] = validation['text']
+        
+        # Compact dtypes and inf/NaN cleaning happen once, before the frame is cached
+        return normalize_trade_frame(df), True
     
+    logger.warning(f"API returned unexpected format: {data}")
+    # Return empty DataFrame with message
+    return pd.DataFrame({'message': ['No data available or API format changed']}), False
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """Return queue depth and wait counters of the client-side rate limiter"""
+    return _rate_limiter.stats()
+
+def get_rate_wait_timeout() -> Optional[float]:
+    """Return the rate limiter wait bound for lookups, or None to wait as long as needed"""
+    return RATE_WAIT_TIMEOUT if RATE_WAIT_TIMEOUT > 0 else None
+
+def _fetch_from_api(params, reporterCode, partnerCode, period, cmdCode, flowCode, includeDesc, wait_timeout=None):
+    """
+    Run the request/retry loop against the COMTRADE endpoints
+    
+    Args:
+        wait_timeout: Maximum seconds to wait for the rate limiter per attempt;
+            when the budget is spent for longer, fallback data is returned
+            (None waits as long as needed)
+    
+    Returns:
+        Tuple of (DataFrame, ok) where ok is False for fallback and error frames
+    """
     logger.info(f"Sending request to UN COMTRADE API with params: {params}")
     
-    # Handle API rate limiting - max 1 request per second, 100 per hour
+    # API rate limiting (max 1 request per second, 100 per hour) is enforced by _rate_limiter
     try:
         # Make the request with retries for network issues
         max_retries = 3
@@ -120,40 +308,22 @@ def previewFinalData(
                 current_url = BASE_URL_ALTERNATIVE if use_alternative else BASE_URL
                 logger.info(f"Using API endpoint: {current_url}")
                 
-                response = requests.get(current_url, params=params, timeout=15)
+                # Wait for our turn instead of discovering the limit through 429s
+                if not _rate_limiter.acquire(timeout=wait_timeout):
+                    logger.warning(f"Rate limit budget exhausted for more than {wait_timeout:g} seconds; using fallback data")
+                    return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode), False
+                response = get_session().get(current_url, params=params, timeout=get_timeout())
                 
                 # If request succeeded
                 if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Check if the API returned a valid response
-                    if 'dataset' in data and isinstance(data['dataset'], list):
-                        # Convert to pandas DataFrame
-                        df = pd.DataFrame(data['dataset'])
-                        
-                        # Add descriptions if requested
-                        if includeDesc and 'validation' in data:
-                            # Process validation data to add descriptions
-                            for validation in data['validation']['valid']:
-                                if validation['type'] == 'reporter' and 'id' in validation and validation['id'] == reporterCode:
-                                    df['reporterDesc'] = validation['text']
-                                if validation['type'] == 'partner' and 'id' in validation and validation['id'] == partnerCode:
-                                    df['partnerDesc'] = validation['text']
-                                    
-                        # Cache the result
-                        _data_cache[cache_key] = df
-                        
-                        return df
-                    else:
-                        logger.warning(f"API returned unexpected format: {data}")
-                        # Return empty DataFrame with message
-                        return pd.DataFrame({'message': ['No data available or API format changed']})
+                    return _parse_payload(decode_payload(response.content), reporterCode, partnerCode, includeDesc)
                 
                 # Handle rate limiting
                 elif response.status_code == 429:
                     wait_time = int(response.headers.get('Retry-After', 5))
-                    logger.warning(f"Rate limited. Waiting {wait_time} seconds...")
-                    time.sleep(wait_time)
+                    logger.warning(f"Rate limited. Delaying all requests by {wait_time} seconds...")
+                    # Back off every caller sharing the limiter; the next acquire() waits it out
+                    _rate_limiter.penalize(wait_time)
                     continue
                     
                 # Handle 404 specifically - the API endpoint might have changed
@@ -166,7 +336,7 @@ def previewFinalData(
                     else:
                         logger.error(f"All retries failed with 404. API endpoints may be unavailable.")
                         # Use fallback data when the API endpoint is not available
-                        return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode)
+                        return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode), False
                 
                 # Other error status codes
                 else:
@@ -176,7 +346,7 @@ def previewFinalData(
                     else:
                         logger.error(f"All retries failed. Last status: {response.status_code}, Response: {response.text}")
                         # Use fallback data for any persistent API errors
-                        return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode)
+                        return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode), False
                         
             except requests.exceptions.Timeout:
                 logger.warning(f"Request timed out. Attempt {attempt+1}/{max_retries}")
@@ -184,7 +354,7 @@ def previewFinalData(
                     time.sleep(retry_delay)
                 else:
                     logger.error("All retries timed out")
-                    return pd.DataFrame({'message': ['API request timed out']})
+                    return pd.DataFrame({'message': ['API request timed out']}), False
                     
             except requests.exceptions.ConnectionError:
                 logger.warning(f"Connection error. Attempt {attempt+1}/{max_retries}")
@@ -193,7 +363,7 @@ def previewFinalData(
                 else:
                     logger.error("All retries failed with connection errors")
                     # Return a fallback response with example data for Hugging Face Spaces
-                    return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode)
+                    return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode), False
                     
             except Exception as e:
                 logger.error(f"Unexpected error: {str(e)}")
@@ -201,12 +371,184 @@ def previewFinalData(
                     time.sleep(retry_delay)
                 else:
                     logger.error(f"All retries failed with errors: {str(e)}")
-                    return pd.DataFrame({'message': [f'Unexpected error: {str(e)}']})
+                    return pd.DataFrame({'message': [f'Unexpected error: {str(e)}']}), False
                 
     except Exception as e:
         logger.error(f"Error making API request: {str(e)}")
         # Return a fallback response with example data for Hugging Face Spaces
-        return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode)
+        return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode), False
+    
+    # Every attempt was consumed by 429 responses
+    logger.error("All retries were rate limited")
+    return get_fallback_data(reporterCode, partnerCode, period, cmdCode, flowCode), False
+
+def fetchPeriods(periods: Iterable[Any], max_workers: Optional[int] = None, **kwargs) -> pd.DataFrame:
+    """
+    Fetch several periods for the same query concurrently and combine the results
+
+    Each period is requested through previewFinalData, so caching, retries and
+    fallback data behave exactly as for a single call. Requests run on a bounded
+    worker pool so cold lookups take roughly as long as the slowest period
+    instead of the sum of all of them.
+
+    Args:
+        periods: Years or months (YYYY or YYYYMM) to fetch
+        max_workers: Maximum number of concurrent requests (defaults to FETCH_MAX_WORKERS)
+        **kwargs: Any other previewFinalData parameter except period
+
+    Returns:
+        Pandas DataFrame with the non-empty results of all periods, in period order
+    """
+    periods = [str(p) for p in periods]
+    if not periods:
+        return pd.DataFrame()
+
+    def fetch_one(period):
+        try:
+            return previewFinalData(period=period, **kwargs)
+        except Exception as e:
+            logger.error(f"Error fetching data for period {period}: {str(e)}")
+            return None
+
+    workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(periods)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="comtrade-fetch") as pool:
+        results = list(pool.map(fetch_one, periods))
+
+    dfs = [df for df in results if df is not None and not df.empty]
+    if not dfs:
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+def iterBulk(
+    reporterCodes: Iterable[Any],
+    partnerCodes: Iterable[Any],
+    periods: Iterable[Any],
+    cmdCodes: Iterable[Any] = ('TOTAL',),
+    skipSelfPairs: bool = True,
+    max_workers: Optional[int] = None,
+    **kwargs
+) -> Iterator[Tuple[Dict[str, Any], pd.DataFrame, bool]]:
+    """
+    Fetch the cartesian product of reporters, partners, periods and commodities
+    
+    Duplicate combinations are requested once. Combinations already in the
+    in-memory cache are yielded first without touching the worker pool; the rest
+    are fetched concurrently (subject to the rate limiter) and yielded as they
+    complete, so callers can stream results.
+    
+    Args:
+        reporterCodes: Reporter country codes
+        partnerCodes: Partner country codes
+        periods: Years or months (YYYY or YYYYMM)
+        cmdCodes: Commodity codes
+        skipSelfPairs: Skip combinations where reporter and partner are the same
+        max_workers: Maximum number of concurrent requests (defaults to FETCH_MAX_WORKERS)
+        **kwargs: Any other previewFinalData parameter
+        
+    Yields:
+        Tuples of (query, DataFrame, ok) where query holds the combination's codes
+        and ok is False for fallback and error frames
+    """
+    queries = []
+    seen = set()
+    for reporter, partner, period, cmd in itertools.product(reporterCodes, partnerCodes, periods, cmdCodes):
+        if skipSelfPairs and str(reporter) == str(partner):
+            continue
+        query = {'reporterCode': str(reporter), 'partnerCode': str(partner), 'period': str(period), 'cmdCode': str(cmd)}
+        combo = tuple(query.values())
+        if combo not in seen:
+            seen.add(combo)
+            queries.append(query)
+    return iterQueries(queries, max_workers=max_workers, **kwargs)
+
+def iterQueries(
+    queries: Iterable[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    **kwargs
+) -> Iterator[Tuple[Dict[str, Any], pd.DataFrame, bool]]:
+    """
+    Fetch an explicit list of queries concurrently
+    
+    Like iterBulk, but for combinations that are not a cartesian product (e.g.
+    one history per prediction corridor). Cache hits are yielded first, the
+    rest as they complete.
+    
+    Args:
+        queries: Dicts of previewFinalData parameters that differ per query
+        max_workers: Maximum number of concurrent requests (defaults to FETCH_MAX_WORKERS)
+        **kwargs: previewFinalData parameters shared by all queries
+        
+    Yields:
+        Tuples of (query, DataFrame, ok) where ok is False for fallback and error frames
+    """
+    queries = list(queries)
+    
+    def fetch_one(query):
+        try:
+            return lookupFinalData(**query, **kwargs)
+        except Exception as e:
+            logger.error(f"Error fetching data for {query}: {str(e)}")
+            return pd.DataFrame(), False
+    
+    # Serve cache hits straight away
+    misses = []
+    for query in queries:
+        if _cache_key_for(query, kwargs) in _data_cache:
+            yield (query, *fetch_one(query))
+        else:
+            misses.append(query)
+    
+    if not misses:
+        return
+    workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(misses)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="comtrade-bulk")
+    try:
+        futures = {pool.submit(fetch_one, query): query for query in misses}
+        for future in as_completed(futures):
+            yield (futures[future], *future.result())
+    finally:
+        # If the consumer stops early (e.g. client disconnected) drop the queued requests
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _cache_key_for(query: Dict[str, Any], kwargs: Dict[str, Any]) -> tuple:
+    """Cache key previewFinalData would use for query plus extra keyword arguments"""
+    params = dict(_PREVIEW_DEFAULTS)
+    params.update(kwargs)
+    params.update(query)
+    return make_cache_key(**params)
+
+def refreshFinalData(**kwargs) -> Tuple[pd.DataFrame, bool]:
+    """
+    Fetch a query from the API even if it is cached, and replace the cached copies
+    
+    Used by incremental sync to pick up new or revised periods. Accepts the same
+    keyword arguments as previewFinalData.
+    
+    Returns:
+        Tuple of (DataFrame, ok) where ok is False for fallback and error frames;
+        failed refreshes leave the existing cached and stored data untouched
+    """
+    query = dict(_PREVIEW_DEFAULTS)
+    query.update(kwargs)
+    cache_key = make_cache_key(**query)
+    params = _build_params(
+        query['typeCode'], query['freqCode'], query['clCode'], query['period'],
+        query['reporterCode'], query['partnerCode'], query['partner2Code'],
+        query['customsCode'], query['motCode'], query['cmdCode'], query['flowCode'],
+        query['maxRecords'], query['format_output'], query['aggregateBy'],
+        query['breakdownMode'], query['countOnly']
+    )
+    df, ok = _fetch_from_api(
+        params, query['reporterCode'], query['partnerCode'], query['period'],
+        query['cmdCode'], query['flowCode'], query['includeDesc']
+    )
+    if ok:
+        if _store is not None:
+            _store.put(cache_key, df, clCode=query['clCode'], reporterCode=query['reporterCode'], period=query['period'])
+        if _shared_cache is not None:
+            _shared_cache.set(cache_key, df)
+        _data_cache.set(cache_key, df)
+    return df, ok
 
 def get_fallback_data(reporter_code, partner_code, period, cmd_code, flow_code):
     """
@@ -304,7 +646,7 @@ def get_fallback_data(reporter_code, partner_code, period, cmd_code, flow_code):
     if 'rgCode' not in df.columns:
         df['rgCode'] = 1 if flow_code == 'M' else 2  # 1 for imports, 2 for exports
     
-    return df
+    return normalize_trade_frame(df)
 
 def get_country_list():
     """
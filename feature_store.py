@@ -0,0 +1,173 @@
+"""
+Feature store for the prediction models
+Computes the year/flow/partner feature matrix once per dataset (identified by a
+content fingerprint) and keeps it as contiguous NumPy arrays, so repeated
+/api/predict requests and different model types share one featurization
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Order of the columns in FeatureSet.X
+FEATURE_COLUMNS = ['year', 'flowCode', 'partnerCode']
+FLOW_CODES = {'M': 0, 'X': 1}
+
+# Source columns a feature set depends on; only these enter the fingerprint
+SOURCE_COLUMNS = ['refYear', 'flowCode', 'partnerCode', 'primaryValue']
+
+
+class FeatureSet:
+    """
+    Read-only feature matrix and target for one dataset
+
+    X is a C-contiguous float64 array of shape (rows, len(FEATURE_COLUMNS)) and
+    y a float64 array; rows without a trade value are already dropped. Both are
+    shared between requests and therefore marked read-only.
+    """
+
+    __slots__ = ('fingerprint', 'X', 'y')
+
+    def __init__(self, fingerprint: str, X: np.ndarray, y: np.ndarray):
+        X.flags.writeable = False
+        y.flags.writeable = False
+        self.fingerprint = fingerprint
+        self.X = X
+        self.y = y
+
+    @property
+    def nbytes(self) -> int:
+        return self.X.nbytes + self.y.nbytes
+
+    def column(self, name: str) -> np.ndarray:
+        """Return one feature column as a (rows, 1) view"""
+        index = FEATURE_COLUMNS.index(name)
+        return self.X[:, index:index + 1]
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Hash the columns the features are built from
+
+    Uses pandas' vectorized row hashing, which is considerably cheaper than
+    featurizing; categoricals are hashed by value so equal data from different
+    fetches gets the same fingerprint.
+    """
+    digest = hashlib.sha1()
+    for name in SOURCE_COLUMNS:
+        digest.update(name.encode("utf-8"))
+        if name in df.columns:
+            digest.update(pd.util.hash_pandas_object(df[name], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _flow_codes(column: pd.Series) -> np.ndarray:
+    """Map flow codes to 0 (import), 1 (export) or -1 through the categories, not per row"""
+    categorical = column.array if isinstance(column.dtype, pd.CategoricalDtype) else pd.Categorical(column)
+    lookup = np.array([FLOW_CODES.get(str(c), -1) for c in categorical.categories] + [-1], dtype=np.float64)
+    # Missing values have code -1, which picks the trailing -1 entry
+    return lookup[categorical.codes]
+
+
+def _numeric(column: pd.Series) -> np.ndarray:
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def compute_features(df: pd.DataFrame, fingerprint: Optional[str] = None) -> FeatureSet:
+    """
+    Build the feature matrix for a COMTRADE DataFrame
+
+    Rows with a missing trade value, year or partner are dropped.
+    """
+    if fingerprint is None:
+        fingerprint = dataset_fingerprint(df)
+    n = len(df)
+    X = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+    X[:, 0] = _numeric(df['refYear'])
+    X[:, 1] = _flow_codes(df['flowCode'])
+    X[:, 2] = _numeric(df['partnerCode'])
+    y = _numeric(df['primaryValue'])
+    keep = ~(np.isnan(y) | np.isnan(X[:, 0]) | np.isnan(X[:, 2]))
+    if not keep.all():
+        X, y = np.ascontiguousarray(X[keep]), y[keep]
+    return FeatureSet(fingerprint, X, y)
+
+
+class FeatureStore:
+    """
+    Thread-safe LRU of FeatureSets keyed by dataset fingerprint, bounded by bytes
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # fingerprint -> FeatureSet
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_features(self, df: pd.DataFrame) -> FeatureSet:
+        """Return the cached FeatureSet for df's content, computing it on a miss"""
+        fingerprint = dataset_fingerprint(df)
+        with self._lock:
+            features = self._entries.get(fingerprint)
+            if features is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return features
+            self.misses += 1
+        features = compute_features(df, fingerprint)
+        self._add(features)
+        return features
+
+    def _add(self, features: FeatureSet) -> None:
+        if features.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if features.fingerprint in self._entries:
+                return
+            self._entries[features.fingerprint] = features
+            self._bytes += features.nbytes
+            while self._bytes > self.max_bytes:
+                _, oldest = self._entries.popitem(last=False)
+                self._bytes -= oldest.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+_store = FeatureStore(max_bytes=int(os.environ.get("ML_FEATURE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))))
+
+
+def get_features(df: pd.DataFrame) -> FeatureSet:
+    """Return the features for df from the process-wide feature store"""
+    return _store.get_features(df)
+
+
+def get_feature_stats() -> Dict[str, Any]:
+    """Return counters of the process-wide feature store"""
+    return _store.stats()
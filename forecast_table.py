@@ -0,0 +1,215 @@
+"""
+Precomputed forecast table
+A scheduled job computes forecasts for configured corridors and model types into an
+indexed SQLite table; /api/predict answers from it when a fresh enough row exists
+and only trains live on a miss:
+
+    python forecast_table.py --reporters 842 156 --partners 156 842 276 --models linear xgboost
+"""
+import argparse
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_history(reporterCode, partnerCode, cmdCode='TOTAL', flowCode=None, predict_year: int = 2023,
+                  years: int = 10) -> pd.DataFrame:
+    """
+    Fetch the training history /api/predict uses for a corridor
+
+    Shared by the request path, the precompute job and model refreshes, and
+    queried with comtradeapicall.HISTORY_QUERY like the incremental sync, so all
+    of them read the same cache and store entries. Every flow is fetched and
+    the rows of other flows are dropped here.
+    """
+    import comtradeapicall
+
+    periods = [str(y) for y in range(predict_year - years, predict_year)]
+    df = comtradeapicall.fetchPeriods(
+        periods, reporterCode=reporterCode, partnerCode=partnerCode, cmdCode=cmdCode,
+        **comtradeapicall.HISTORY_QUERY
+    )
+    return filter_flow(df, flowCode)
+
+
+def filter_flow(df: pd.DataFrame, flowCode=None) -> pd.DataFrame:
+    """Keep the rows of one flow (all rows when flowCode is None or df has no flowCode column)"""
+    if not flowCode or df.empty or 'flowCode' not in df.columns:
+        return df
+    return df[(df['flowCode'].astype(object) == flowCode).to_numpy()].reset_index(drop=True)
+
+
+class ForecastTable:
+    """
+    SQLite table of forecasts keyed by corridor, forecast year and model type
+
+    The key columns form the primary key of a WITHOUT ROWID table, so a lookup
+    is a single index probe. WAL mode lets the job write while web workers read.
+    Rows older than max_age are treated as missing.
+    """
+
+    def __init__(self, path: str, max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS forecasts ("
+            " reporterCode TEXT, partnerCode TEXT, cmdCode TEXT, flowCode TEXT, period INTEGER, model_type TEXT,"
+            " prediction REAL, mse REAL, computed_at REAL,"
+            " PRIMARY KEY (reporterCode, partnerCode, cmdCode, flowCode, period, model_type)"
+            ") WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(reporterCode, partnerCode, cmdCode, flowCode, period, model_type) -> tuple:
+        # NULL never matches in a primary key lookup, so "all flows" is stored as ''
+        return (str(reporterCode), str(partnerCode), str(cmdCode or 'TOTAL'), flowCode or '', int(period), model_type)
+
+    def get(self, reporterCode, partnerCode, cmdCode, flowCode, period, model_type) -> Optional[Dict[str, Any]]:
+        """
+        Return the precomputed forecast, or None if missing or older than max_age
+
+        The result carries computed_at and staleness_seconds.
+        """
+        row = self._conn().execute(
+            "SELECT prediction, mse, computed_at FROM forecasts WHERE reporterCode = ? AND partnerCode = ?"
+            " AND cmdCode = ? AND flowCode = ? AND period = ? AND model_type = ?",
+            self._key(reporterCode, partnerCode, cmdCode, flowCode, period, model_type)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        prediction, mse, computed_at = row
+        staleness = time.time() - computed_at
+        if staleness > self.max_age:
+            self.stale += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {
+            'prediction': prediction,
+            'mse': mse,
+            'model_type': model_type,
+            'computed_at': computed_at,
+            'staleness_seconds': staleness,
+        }
+
+    def put(self, reporterCode, partnerCode, cmdCode, flowCode, period, model_type, prediction: float,
+            mse: Optional[float], computed_at: Optional[float] = None) -> None:
+        """Insert or replace one forecast"""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._key(reporterCode, partnerCode, cmdCode, flowCode, period, model_type)
+            + (float(prediction), None if mse is None else float(mse), computed_at or time.time())
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return row count and hit/miss counters"""
+        rows = self._conn().execute("SELECT COUNT(*) FROM forecasts").fetchone()[0]
+        return {
+            'path': self.path,
+            'rows': rows,
+            'max_age': self.max_age,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+        }
+
+
+def open_default_forecast_table() -> Optional[ForecastTable]:
+    """
+    Open the table configured by ML_FORECAST_TABLE (default data/forecasts.sqlite)
+
+    ML_FORECAST_MAX_AGE sets the staleness limit in seconds. Returns None when the
+    variable is empty or the database cannot be opened.
+    """
+    path = os.environ.get("ML_FORECAST_TABLE", os.path.join("data", "forecasts.sqlite"))
+    if not path:
+        return None
+    try:
+        return ForecastTable(path, max_age=float(os.environ.get("ML_FORECAST_MAX_AGE", str(7 * 24 * 3600))))
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not open forecast table at {path}: {str(e)}")
+        return None
+
+
+def precompute(
+    table: ForecastTable,
+    reporterCodes: Iterable[Any],
+    partnerCodes: Iterable[Any],
+    cmdCodes: Iterable[Any] = ('TOTAL',),
+    flowCodes: Iterable[Any] = (None,),
+    model_types: Iterable[str] = ('linear',),
+    predict_year: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Compute and store forecasts for every corridor and model type
+
+    Each corridor's history is fetched once (through the usual caches) and
+    shared by all model types. Failed forecasts are logged and skipped, leaving
+    any earlier row in place.
+
+    Returns:
+        Counts of forecasts written and failed
+    """
+    import ml_model
+
+    predict_year = predict_year or time.localtime().tm_year
+    model_types = list(model_types)
+    written = failed = 0
+    for reporter, partner, cmd, flow in itertools.product(reporterCodes, partnerCodes, cmdCodes, flowCodes):
+        if str(reporter) == str(partner):
+            continue
+        df = fetch_history(reporter, partner, cmd, flow, predict_year)
+        for model_type in model_types:
+            result = ml_model.train_and_predict(df, predict_year, partner, flow, model_type=model_type) \
+                if not df.empty else {'error': 'No historical data'}
+            if 'error' in result:
+                failed += 1
+                logger.warning(f"Precompute failed for {reporter}-{partner} {cmd} {flow} {model_type}: {result['error']}")
+                continue
+            table.put(reporter, partner, cmd, flow, predict_year, model_type, result['prediction'], result.get('mse'))
+            written += 1
+    return {'written': written, 'failed': failed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute forecasts for popular corridors")
+    parser.add_argument("--reporters", nargs="+", required=True, help="Reporter country codes")
+    parser.add_argument("--partners", nargs="+", required=True, help="Partner country codes")
+    parser.add_argument("--commodities", nargs="+", default=['TOTAL'], help="Commodity codes")
+    parser.add_argument("--flows", nargs="+", default=['all'], help="Flow codes (M, X or all)")
+    parser.add_argument("--models", nargs="+", default=['linear'], help="Model types")
+    parser.add_argument("--period", type=int, default=None, help="Forecast year (default: the current year)")
+    args = parser.parse_args()
+
+    table = open_default_forecast_table()
+    if table is None:
+        parser.error("the forecast table is disabled (set ML_FORECAST_TABLE)")
+    flows = [None if flow == 'all' else flow for flow in args.flows]
+    summary = precompute(table, args.reporters, args.partners, args.commodities, flows, args.models, args.period)
+    print(f"Wrote {summary['written']} forecasts, {summary['failed']} failed")
@@ -0,0 +1,225 @@
+"""
+Hierarchical forecasting over the HS commodity tree
+Data fetched once at the finest HS level (chapter, heading or subheading) is summed
+up the tree (subheading -> heading -> chapter -> TOTAL) level by level, every node
+gets a trend forecast in one vectorized pass, and the forecasts are reconciled so
+children add up to their parents.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import trend_engine
+
+logger = logging.getLogger(__name__)
+
+# Code length of each HS level
+LEVELS = {'chapter': 2, 'heading': 4, 'subheading': 6}
+
+# cmdCode asking COMTRADE for every code at a level
+LEVEL_QUERIES = {'chapter': 'AG2', 'heading': 'AG4', 'subheading': 'AG6'}
+
+RECONCILIATION_METHODS = ['wls', 'ols', 'bottom_up', 'none']
+
+_LEVEL_NAMES = {length: name for name, length in LEVELS.items()}
+
+
+def build_hierarchy(leaf_codes: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Build the HS tree above a set of leaf codes
+
+    Nodes are TOTAL, then every chapter, heading, ... prefix of the leaves, ending
+    with the leaves themselves, so parents always come before their children.
+
+    Args:
+        leaf_codes: Unique, sorted codes of equal length
+
+    Returns:
+        Tuple of (node codes, parent node index per node (-1 for TOTAL), depth per node);
+        the leaves are the last len(leaf_codes) nodes, in the given order
+    """
+    leaf_codes = list(leaf_codes)
+    leaf_length = len(leaf_codes[0]) if leaf_codes else 0
+    nodes = ['TOTAL']
+    parent = [-1]
+    depth = [0]
+    previous = np.zeros(len(leaf_codes), dtype=np.int64)  # node index of each leaf's ancestor so far
+    lengths = sorted({l for l in LEVELS.values() if l < leaf_length} | {leaf_length})
+    for level, length in enumerate(lengths, start=1):
+        prefixes, first, inverse = np.unique([code[:length] for code in leaf_codes], return_index=True, return_inverse=True)
+        offset = len(nodes)
+        nodes.extend(prefixes.tolist())
+        parent.extend(previous[first].tolist())
+        depth.extend([level] * len(prefixes))
+        previous = inverse.ravel() + offset
+    return nodes, np.asarray(parent, dtype=np.int64), np.asarray(depth, dtype=np.int64)
+
+
+def aggregate(parent: np.ndarray, depth: np.ndarray, leaf_values: np.ndarray) -> np.ndarray:
+    """
+    Sum leaf rows up the tree
+
+    Args:
+        parent, depth: From build_hierarchy
+        leaf_values: Array with one row per leaf (any number of columns)
+
+    Returns:
+        Array with one row per node
+    """
+    n_leaves = len(leaf_values)
+    values = np.zeros((len(parent),) + leaf_values.shape[1:])
+    values[len(parent) - n_leaves:] = leaf_values
+    for level in range(depth.max(), 0, -1):
+        rows = np.flatnonzero(depth == level)
+        np.add.at(values, parent[rows], values[rows])
+    return values
+
+
+def reconcile(parent: np.ndarray, depth: np.ndarray, base: np.ndarray,
+              variances: Optional[np.ndarray] = None, method: str = 'wls') -> np.ndarray:
+    """
+    Make node forecasts coherent (every parent equals the sum of its children)
+
+    'wls' and 'ols' give the least squares reconciliation, weighted by inverse
+    residual variance or unweighted. On a tree it is solved exactly in two passes
+    over the levels: upwards, each node combines its children's best estimate
+    with its own forecast; downwards, each parent's value is split among its
+    children in proportion to their uncertainty.
+
+    Args:
+        parent, depth: From build_hierarchy
+        base: Independent forecast per node
+        variances: Residual variance per node, used by 'wls'
+        method: 'wls', 'ols', 'bottom_up' (sum the leaf forecasts) or 'none'
+
+    Returns:
+        Reconciled forecast per node
+    """
+    if method == 'none':
+        return base
+    n = len(base)
+    is_leaf = np.bincount(parent[parent >= 0], minlength=n) == 0
+    if method == 'bottom_up':
+        return aggregate(parent, depth, base[is_leaf])
+    if method not in ('wls', 'ols'):
+        raise ValueError(f"Unknown reconciliation method: {method}")
+
+    weights = np.ones(n)
+    if method == 'wls' and variances is not None:
+        variances = np.asarray(variances, dtype=np.float64)
+        valid = np.isfinite(variances) & (variances > 0)
+        floor = variances[valid].min() if valid.any() else 1.0
+        variances = np.where(valid, variances, floor)
+        weights = np.median(variances) / variances
+
+    # Upward pass: each subtree's best value is m with precision a
+    a = np.zeros(n)
+    m = np.zeros(n)
+    spread = np.zeros(n)  # sum of children's 1/a
+    total = np.zeros(n)  # sum of children's m
+    for level in range(depth.max(), -1, -1):
+        rows = np.flatnonzero(depth == level)
+        leaf = is_leaf[rows]
+        children_a = np.where(leaf, 0.0, 1.0 / np.where(leaf, 1.0, spread[rows]))
+        a[rows] = children_a + weights[rows]
+        m[rows] = (children_a * total[rows] + weights[rows] * base[rows]) / a[rows]
+        if level > 0:
+            np.add.at(spread, parent[rows], 1.0 / a[rows])
+            np.add.at(total, parent[rows], m[rows])
+
+    # Downward pass: split each parent's value among its children
+    reconciled = np.empty(n)
+    reconciled[depth == 0] = m[depth == 0]
+    for level in range(1, depth.max() + 1):
+        rows = np.flatnonzero(depth == level)
+        p = parent[rows]
+        reconciled[rows] = m[rows] + (1.0 / a[rows]) / spread[p] * (reconciled[p] - total[p])
+    return reconciled
+
+
+def _leaf_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Keep the rows at the finest HS level present, dropping TOTAL and coarser aggregates"""
+    codes = df['cmdCode'].astype(object).astype(str)
+    numeric = codes.str.fullmatch(r'\d+')
+    if not numeric.any():
+        return df.iloc[0:0]
+    leaf_length = codes[numeric].str.len().max()
+    keep = (numeric & (codes.str.len() == leaf_length)).to_numpy()
+    leaves = df[keep].copy()
+    leaves['cmdCode'] = codes.to_numpy()[keep]
+    return leaves
+
+
+def forecast_tree(df: pd.DataFrame, predict_year: int, method: str = 'wls') -> Optional[Dict[str, Any]]:
+    """
+    Forecast every node of the HS tree for one flow
+
+    Returns:
+        Nested dict rooted at TOTAL, or None if df has no usable leaf history
+    """
+    leaves_df = _leaf_table(df)
+    if leaves_df.empty:
+        return None
+    index, years, values = trend_engine.series_matrix(leaves_df, keys=['cmdCode'])
+    # Years before the forecast year only; leaves without any observation are dropped
+    history = years < predict_year
+    years, values = years[history], values[:, history]
+    observed = ~np.isnan(values)
+    usable = observed.any(axis=1)
+    if not usable.any():
+        return None
+    leaf_codes = index['cmdCode'].astype(str).to_numpy()[usable]
+    values, observed = values[usable], observed[usable]
+
+    nodes, parent, depth = build_hierarchy(list(leaf_codes))
+    # A node is missing in a year only if none of its leaves reported that year
+    node_values = aggregate(parent, depth, np.where(observed, values, 0.0))
+    node_values[aggregate(parent, depth, observed.astype(np.float64)) == 0] = np.nan
+
+    fit = trend_engine.fit_trends(node_values, years, predict_year)
+    reconciled = reconcile(parent, depth, fit['forecast'], fit['mse'], method)
+
+    descriptions = {}
+    if 'cmdDesc' in df.columns:
+        codes = df['cmdCode'].astype(object).astype(str)
+        descriptions = dict(zip(codes, df['cmdDesc'].astype(object)))
+
+    tree = {}
+    for i, code in enumerate(nodes):
+        last = node_values[i][~np.isnan(node_values[i])]
+        tree[code] = {
+            'code': code,
+            'level': 'total' if code == 'TOTAL' else _LEVEL_NAMES.get(len(code), f'hs{len(code)}'),
+            'description': descriptions.get(code),
+            'forecast': float(reconciled[i]),
+            'base_forecast': float(fit['forecast'][i]),
+            'last_value': float(last[-1]) if len(last) else None,
+            'slope': float(fit['slope'][i]),
+            'n_obs': int(fit['n_obs'][i]),
+            'children': [],
+        }
+    for i in range(1, len(nodes)):
+        tree[nodes[parent[i]]]['children'].append(tree[nodes[i]])
+    return tree['TOTAL']
+
+
+def forecast_hierarchy(df: pd.DataFrame, predict_year: int, flow_code: Optional[str] = None,
+                       method: str = 'wls') -> Dict[str, Any]:
+    """
+    Forecast the HS tree per trade flow
+
+    Imports and exports are never summed together: with flow_code=None a tree is
+    built for every flow in the data.
+
+    Returns:
+        Dict mapping flow code to its tree (None when a flow has no usable history)
+    """
+    if df.empty or 'cmdCode' not in df.columns:
+        return {}
+    if 'flowCode' not in df.columns:
+        return {flow_code or 'all': forecast_tree(df, predict_year, method)}
+    flows = df['flowCode'].astype(object)
+    wanted = [flow_code] if flow_code else sorted(flows.dropna().unique())
+    return {flow: forecast_tree(df[flows == flow], predict_year, method) for flow in wanted}
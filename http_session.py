@@ -0,0 +1,58 @@
+"""
+Shared HTTP session for outbound API calls
+One pooled requests.Session per process so repeated calls to the COMTRADE and
+Hugging Face endpoints reuse keep-alive connections instead of reconnecting
+"""
+import os
+import threading
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept per host; should cover the threads of one worker
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "16"))
+# Number of distinct hosts whose pools are kept
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "4"))
+
+# Connect and read timeouts are separate: connecting should fail fast, reading may be slow
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide pooled session
+
+    A new session is built after a fork so gunicorn workers never share sockets
+    inherited from the master process.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def get_timeout(read: Optional[float] = None) -> Tuple[float, float]:
+    """Return a (connect, read) timeout tuple, optionally overriding the read timeout"""
+    return (CONNECT_TIMEOUT, READ_TIMEOUT if read is None else read)
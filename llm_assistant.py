@@ -6,6 +6,8 @@ import requests
 import json
 from typing import Dict, List, Any, Optional
 
+from http_session import get_session, get_timeout
+
 class TradeAssistant:
     """
     Assistant powered by Google Gemma-2b to help users with trade data analysis
@@ -131,11 +133,11 @@ class TradeAssistant:
                     print(f"API token begins with: {self.api_token[:5]}...")
                     
                     # Make the API request
-                    response = requests.post(
+                    response = get_session().post(
                         self.api_url,
                         headers=self.headers,
                         json=payload,
-                        timeout=15  # Extended timeout for Spaces environment
+                        timeout=get_timeout(read=15)  # Extended timeout for Spaces environment
                     )
                     
                     # Process successful responses
@@ -0,0 +1,144 @@
+"""
+NumPy inference for the LSTM forecaster
+Trained Keras LSTM(units) -> Dense(1) models are exported to their weight arrays
+and evaluated with a plain NumPy forward pass, so serving a forecast needs
+neither TensorFlow nor its per-call overhead. Models already saved in the
+registry in the .keras format can be converted once:
+
+    python lstm_inference.py --registry data/models
+"""
+import argparse
+import logging
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _hard_sigmoid(x: np.ndarray) -> np.ndarray:
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+# Keras activation names supported in the exported layers
+ACTIVATIONS = {
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'linear': lambda x: x,
+}
+
+
+class NumpyLSTM:
+    """
+    Forward pass of a single LSTM layer followed by a Dense(1) output
+
+    Holds the Keras weights as float32 arrays (gate order input, forget, cell,
+    output) and is picklable, so it is stored in the model registry with joblib
+    like the scikit-learn models.
+    """
+
+    def __init__(self, kernel: np.ndarray, recurrent_kernel: np.ndarray, bias: np.ndarray,
+                 dense_kernel: np.ndarray, dense_bias: np.ndarray,
+                 activation: str = 'tanh', recurrent_activation: str = 'sigmoid'):
+        if activation not in ACTIVATIONS or recurrent_activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported LSTM activation: {activation}/{recurrent_activation}")
+        self.kernel = np.ascontiguousarray(kernel, dtype=np.float32)
+        self.recurrent_kernel = np.ascontiguousarray(recurrent_kernel, dtype=np.float32)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float32)
+        self.dense_kernel = np.ascontiguousarray(dense_kernel, dtype=np.float32)
+        self.dense_bias = np.ascontiguousarray(dense_bias, dtype=np.float32)
+        self.activation = activation
+        self.recurrent_activation = recurrent_activation
+
+    @property
+    def units(self) -> int:
+        return self.recurrent_kernel.shape[0]
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """
+        Predict from inputs shaped [samples, time steps, features]
+
+        Returns:
+            Array of shape (samples, 1), like Keras' predict
+        """
+        x = np.asarray(x, dtype=np.float32)
+        activation = ACTIVATIONS[self.activation]
+        gate = ACTIVATIONS[self.recurrent_activation]
+        u = self.units
+        h = np.zeros((x.shape[0], u), dtype=np.float32)
+        c = np.zeros((x.shape[0], u), dtype=np.float32)
+        for t in range(x.shape[1]):
+            z = x[:, t] @ self.kernel + h @ self.recurrent_kernel + self.bias
+            i, f, o = gate(z[:, :u]), gate(z[:, u:2 * u]), gate(z[:, 3 * u:])
+            c = f * c + i * activation(z[:, 2 * u:3 * u])
+            h = o * activation(c)
+        return h @ self.dense_kernel + self.dense_bias
+
+    def get_weights(self) -> List[np.ndarray]:
+        """Return the weights in Keras' order, e.g. to warm-start a Keras model"""
+        return [self.kernel, self.recurrent_kernel, self.bias, self.dense_kernel, self.dense_bias]
+
+
+def export_lstm(model) -> NumpyLSTM:
+    """
+    Convert a Keras LSTM -> Dense(1) model to a NumpyLSTM
+
+    Raises:
+        ValueError: If the model has another architecture
+    """
+    lstm, dense = model.layers[0], model.layers[-1]
+    config = lstm.get_config()
+    if len(model.layers) != 2 or type(lstm).__name__ != 'LSTM' or type(dense).__name__ != 'Dense' \
+            or dense.get_config().get('activation', 'linear') != 'linear' or not config.get('use_bias', True):
+        raise ValueError("Only LSTM -> Dense(1) models can be exported")
+    kernel, recurrent_kernel, bias, dense_kernel, dense_bias = model.get_weights()
+    return NumpyLSTM(kernel, recurrent_kernel, bias, dense_kernel, dense_bias,
+                     activation=config.get('activation', 'tanh'),
+                     recurrent_activation=config.get('recurrent_activation', 'sigmoid'))
+
+
+def convert_registry(root: str) -> Dict[str, int]:
+    """
+    Replace the .keras models in a registry directory with NumPy exports
+
+    Each converted entry is rewritten as a joblib entry and its .keras file
+    removed; entries that cannot be converted are left as they are.
+
+    Returns:
+        Counts of entries converted and failed
+    """
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(root)
+    converted = failed = 0
+    for name in sorted(os.listdir(root)):
+        if not name.endswith(".keras") or name.count(".") != 1:
+            continue
+        key = name[:-len(".keras")]
+        entry = registry.get(key)
+        try:
+            if entry is None:
+                raise ValueError("entry could not be loaded")
+            registry.put(key, dict(entry, format='joblib', model=export_lstm(entry['model'])))
+            os.remove(os.path.join(root, name))
+            converted += 1
+        except (ValueError, OSError) as e:
+            failed += 1
+            logger.warning(f"Could not convert LSTM model {key}: {str(e)}")
+    return {'converted': converted, 'failed': failed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert registry LSTM models to NumPy inference")
+    parser.add_argument("--registry", default=os.environ.get("ML_MODEL_DIR", os.path.join("data", "models")),
+                        help="Model registry directory")
+    args = parser.parse_args()
+    summary = convert_registry(args.registry)
+    print(f"Converted {summary['converted']} LSTM models, {summary['failed']} failed")
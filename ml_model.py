@@ -1,75 +1,546 @@
+import hashlib
+import json
+import logging
+import os
+
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 
+from feature_store import FEATURE_COLUMNS, FLOW_CODES, SOURCE_COLUMNS, get_features
+from lstm_inference import export_lstm
+from model_registry import model_key, open_default_registry
+import model_runtime
+
+logger = logging.getLogger(__name__)
+
 def prepare_features(df):
-    df = df.copy()
-    df['year'] = df['refYear'].astype(int)
-    df['flowCode'] = df['flowCode'].map({'M': 0, 'X': 1}).fillna(-1)
-    df['partnerCode'] = df['partnerCode'].astype(int)
-    df = df[df['primaryValue'].notnull()]
-    X = df[['year', 'flowCode', 'partnerCode']]
-    y = df['primaryValue']
+    """Return the (X, y) features for df as a DataFrame and Series over the cached arrays"""
+    features = get_features(df)
+    X = pd.DataFrame(features.X, columns=FEATURE_COLUMNS, copy=False)
+    y = pd.Series(features.y, name='primaryValue', copy=False)
     return X, y
 
-def train_and_predict(df, predict_year, partner_code, flow_code, model_type='linear'):
-    X, y = prepare_features(df)
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    flow_map = {'M': 0, 'X': 1}
-    pred_X = np.array([[predict_year, flow_map.get(flow_code, -1), int(partner_code)]]).reshape(1, -1)
-
-    if model_type == 'linear':
-        model = LinearRegression()
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-        mse = mean_squared_error(y_test, y_pred)
-        pred_value = model.predict(pred_X)[0]
-    elif model_type == 'xgboost':
-        try:
-            from xgboost import XGBRegressor
-        except ImportError:
-            return {'error': 'xgboost is not installed. Please install it to use this model.'}
-        model = XGBRegressor(objective='reg:squarederror', n_estimators=100)
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-        mse = mean_squared_error(y_test, y_pred)
-        pred_value = model.predict(pred_X)[0]
-    elif model_type == 'lstm':
-        try:
-            import tensorflow as tf
-            from tensorflow.keras.models import Sequential
-            from tensorflow.keras.layers import LSTM, Dense
-            from sklearn.preprocessing import MinMaxScaler
-        except ImportError:
-            return {'error': 'tensorflow is not installed. Please install it to use this model.'}
-        # Only use year as feature for LSTM time series
-        scaler = MinMaxScaler()
-        X_lstm = scaler.fit_transform(X[['year']])
-        y_lstm = y.values.reshape(-1, 1)
-        y_lstm = scaler.fit_transform(y_lstm)
-        # Reshape for LSTM [samples, time steps, features]
-        X_lstm = X_lstm.reshape((X_lstm.shape[0], 1, 1))
-        X_train_lstm, X_test_lstm, y_train_lstm, y_test_lstm = train_test_split(X_lstm, y_lstm, test_size=0.2, random_state=42)
-        model = Sequential([
-            LSTM(16, input_shape=(1, 1)),
-            Dense(1)
-        ])
-        model.compile(optimizer='adam', loss='mse')
-        model.fit(X_train_lstm, y_train_lstm, epochs=50, batch_size=8, verbose=0)
-        y_pred = model.predict(X_test_lstm)
-        mse = mean_squared_error(y_test_lstm, y_pred)
-        # Predict for the input year
-        pred_X_lstm = scaler.transform(np.array([[predict_year]])).reshape((1, 1, 1))
-        pred_value = model.predict(pred_X_lstm)[0][0]
+# Hyperparameters per model type; part of the model registry key
+MODEL_PARAMS = {
+    'linear': {},
+    'xgboost': {'objective': 'reg:squarederror', 'n_estimators': 100},
+    'lstm': {'units': 16, 'epochs': 50, 'batch_size': 8},
+}
+
+# Hyperparameters overriding MODEL_PARAMS when a model is updated with new years
+UPDATE_PARAMS = {
+    'xgboost': {'n_estimators': 20},
+    'lstm': {'epochs': 10},
+}
+
+# Consecutive incremental updates before a model is retrained from scratch; 0 disables updates
+MAX_INCREMENTAL_UPDATES = int(os.environ.get("ML_MAX_INCREMENTAL_UPDATES", "5"))
+
+# Columns identifying the corridor a training history belongs to
+CORRIDOR_COLUMNS = ['reporterCode', 'partnerCode', 'cmdCode', 'flowCode']
+
+INSTALL_ERRORS = {
+    'xgboost': 'xgboost is not installed. Please install it to use this model.',
+    'lstm': 'tensorflow is not installed. Please install it to use this model.',
+}
+
+_registry = open_default_registry()
+
+# Import heavy backends at worker start when ML_PRELOAD_BACKENDS asks for it
+model_runtime.preload_from_env(lstm_units=MODEL_PARAMS['lstm']['units'])
+
+# One row in HOLDOUT_BUCKETS is held out of training to measure the reported mse
+HOLDOUT_BUCKETS = 5
+
+def _holdout_mask(X, y):
+    """
+    Mark the held-out rows by a hash of each row's values
+
+    A row's assignment does not depend on the other rows, so a row held out in
+    one training window is held out in every window containing it, and an
+    updated model is evaluated on exactly the rows a retrained one would be.
+    """
+    words = np.ascontiguousarray(np.column_stack([X, y])).view(np.uint64)
+    h = np.full(len(words), 0xcbf29ce484222325, dtype=np.uint64)
+    for column in words.T:
+        # FNV-style combine, then a splitmix64 finalizer so every bit affects the bucket
+        h = (h ^ column) * np.uint64(0x100000001b3)
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xbf58476d1ce4e5b9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94d049bb133111eb)
+    h ^= h >> np.uint64(31)
+    return h % np.uint64(HOLDOUT_BUCKETS) == 0
+
+def _split_indices(features):
+    """
+    Train/test row indices of a feature set
+
+    When no row (or every row) is held out, as happens with very short
+    histories, the model is trained on every row and the mse is in-sample.
+    """
+    test = _holdout_mask(features.X, features.y)
+    if test.all() or not test.any():
+        rows = np.arange(len(features))
+        return rows, rows
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+def _train_linear(features, params):
+    # Solved from per-year statistics, which incremental updates move along the years
+    stats = _year_stats(features)
+    model, mse = _solve_year_stats(stats)
+    return {'format': 'joblib', 'model': model, 'mse': mse, 'year_stats': stats}
+
+def _train_xgboost(features, params):
+    XGBRegressor = model_runtime.load_backend('xgboost').XGBRegressor
+    train, test = _split_indices(features)
+    model = XGBRegressor(**params)
+    model.fit(features.X[train], features.y[train])
+    mse = mean_squared_error(features.y[test], model.predict(features.X[test]))
+    return {'format': 'joblib', 'model': model, 'mse': float(mse)}
+
+def _train_lstm(features, params):
+    from sklearn.preprocessing import MinMaxScaler
+    model_runtime.load_backend('tensorflow')
+    # Only use year as feature for LSTM time series; year and value get their
+    # own scalers so the forecast year is scaled like the training years
+    x_scaler = MinMaxScaler()
+    y_scaler = MinMaxScaler()
+    X_lstm = x_scaler.fit_transform(features.column('year'))
+    y_lstm = y_scaler.fit_transform(features.y.reshape(-1, 1))
+    # Reshape for LSTM [samples, time steps, features]
+    X_lstm = X_lstm.reshape((X_lstm.shape[0], 1, 1))
+    train, test = _split_indices(features)
+    # Fit on a pooled, already compiled model and keep a NumPy export of the result,
+    # which evaluates and serves forecasts without TensorFlow
+    with model_runtime.lstm_pool.lease(params['units']) as model:
+        model.fit(X_lstm[train], y_lstm[train], epochs=params['epochs'], batch_size=params['batch_size'], verbose=0)
+        trained = export_lstm(model)
+    mse = mean_squared_error(y_lstm[test], trained.predict(X_lstm[test]))
+    return {'format': 'joblib', 'model': trained, 'mse': float(mse), 'x_scaler': x_scaler, 'y_scaler': y_scaler}
+
+TRAINERS = {
+    'linear': _train_linear,
+    'xgboost': _train_xgboost,
+    'lstm': _train_lstm,
+}
+
+def _year_rows(features, years):
+    """Boolean mask of the rows whose year is in years"""
+    return np.isin(features.X[:, 0], list(years))
+
+def _year_digests(features):
+    """Hash each year's rows, so a newer history can be checked against the years a model saw"""
+    digests = {}
+    for year in np.unique(features.X[:, 0]):
+        rows = features.X[:, 0] == year
+        digest = hashlib.sha1(features.X[rows].tobytes())
+        digest.update(features.y[rows].tobytes())
+        digests[int(year)] = digest.hexdigest()
+    return digests
+
+def _gram(X, y):
+    Z = np.column_stack([np.ones(len(y)), X])
+    return {'ztz': Z.T @ Z, 'zty': Z.T @ y, 'yty': float(y @ y)}
+
+def _sum_stats(parts):
+    parts = list(parts)
+    return {name: sum(part[name] for part in parts) for name in ('ztz', 'zty', 'yty')}
+
+def _year_stats(features, rows=None):
+    """
+    Least squares sufficient statistics per year, for the training and the held-out rows
+
+    For each year, the Gram matrix of [1, X] and its products with y, so the
+    statistics of any set of years are a sum and a window can move by adding
+    and removing years.
+    """
+    X, y = features.X, features.y
+    if rows is not None:
+        X, y = X[rows], y[rows]
+    held_out = _holdout_mask(X, y)
+    stats = {}
+    for year in np.unique(X[:, 0]):
+        in_year = X[:, 0] == year
+        stats[int(year)] = {
+            'train': _gram(X[in_year & ~held_out], y[in_year & ~held_out]),
+            'test': _gram(X[in_year & held_out], y[in_year & held_out]),
+        }
+    return stats
+
+def _solve_year_stats(stats):
+    """
+    Fit ordinary least squares from summed year statistics
+
+    Like LinearRegression, the intercept is not penalised and the minimum-norm
+    coefficients are taken, so constant columns get a zero coefficient. Years
+    are summed in order, so the same years always give the same model.
+
+    Returns:
+        Tuple of (LinearRegression, mse on the held-out rows)
+    """
+    years = sorted(stats)
+    train = _sum_stats(stats[year]['train'] for year in years)
+    test = _sum_stats(stats[year]['test'] for year in years)
+    if train['ztz'][0, 0] == 0 or test['ztz'][0, 0] == 0:
+        # Same fallback as _split_indices: every row trains, and the mse is in-sample
+        train = test = _sum_stats([train, test])
+    ztz, zty = train['ztz'], train['zty']
+    n = ztz[0, 0]
+    sx, sy = ztz[0, 1:], zty[0]
+    sxx = ztz[1:, 1:] - np.outer(sx, sx) / n
+    sxy = zty[1:] - sx * sy / n
+    coef = np.linalg.pinv(sxx, rcond=1e-10, hermitian=True) @ sxy
+    intercept = (sy - sx @ coef) / n
+    b = np.concatenate([[intercept], coef])
+    rss = test['yty'] - 2 * b @ test['zty'] + b @ test['ztz'] @ b
+    mse = max(rss, 0.0) / test['ztz'][0, 0]
+    model = LinearRegression()
+    model.coef_, model.intercept_, model.n_features_in_ = coef, float(intercept), len(coef)
+    return model, float(mse)
+
+def _update_linear(base, features, params, added, dropped):
+    """
+    Move the least squares window: add the new years' statistics and drop the oldest (recursive least squares)
+
+    Gives the same model and mse as _train_linear on the new window.
+    """
+    stats = {year: s for year, s in base['year_stats'].items() if year not in dropped}
+    stats.update(_year_stats(features, _year_rows(features, added)))
+    model, mse = _solve_year_stats(stats)
+    return {'format': 'joblib', 'model': model, 'mse': mse, 'year_stats': stats}
+
+def _update_xgboost(base, features, params, added, dropped):
+    """
+    Continue boosting the previous model (xgb_model) with a few rounds on the current window
+
+    The new rounds see the whole window's training rows: fitted on the new
+    year alone, trees cannot split on the year and only shift every forecast.
+    Held-out rows are never trained on, neither by the previous model nor by
+    the new rounds, so the mse stays an out-of-sample estimate.
+    """
+    XGBRegressor = model_runtime.load_backend('xgboost').XGBRegressor
+    train, test = _split_indices(features)
+    model = XGBRegressor(**{**params, **UPDATE_PARAMS['xgboost']})
+    model.fit(features.X[train], features.y[train], xgb_model=base['model'].get_booster())
+    mse = mean_squared_error(features.y[test], model.predict(features.X[test]))
+    return {'format': 'joblib', 'model': model, 'mse': float(mse)}
+
+def _update_lstm(base, features, params, added, dropped):
+    """
+    Fine-tune the previous LSTM's weights for a few epochs on the current window
+
+    The previous scalers are kept so the learned weights keep their meaning;
+    new years and values simply scale slightly beyond [0, 1].
+    """
+    model_runtime.load_backend('tensorflow')
+    x_scaler, y_scaler = base['x_scaler'], base['y_scaler']
+    X_lstm = x_scaler.transform(features.column('year')).reshape((-1, 1, 1))
+    y_lstm = y_scaler.transform(features.y.reshape(-1, 1))
+    train, test = _split_indices(features)
+    epochs = UPDATE_PARAMS['lstm']['epochs']
+    with model_runtime.lstm_pool.lease(params['units']) as model:
+        model.set_weights(base['model'].get_weights())
+        model.fit(X_lstm[train], y_lstm[train], epochs=epochs, batch_size=params['batch_size'], verbose=0)
+        trained = export_lstm(model)
+    mse = mean_squared_error(y_lstm[test], trained.predict(X_lstm[test]))
+    return {'format': 'joblib', 'model': trained, 'mse': float(mse), 'x_scaler': x_scaler, 'y_scaler': y_scaler}
+
+UPDATERS = {
+    'linear': _update_linear,
+    'xgboost': _update_xgboost,
+    'lstm': _update_lstm,
+}
+
+def corridor_of(df):
+    """Return the corridor a history covers: each of CORRIDOR_COLUMNS mapped to its single code, or None"""
+    corridor = {}
+    for name in CORRIDOR_COLUMNS:
+        values = df[name].dropna().astype(str).unique() if name in df.columns else []
+        corridor[name] = str(values[0]) if len(values) == 1 else None
+    return corridor
+
+def _lineage_key(corridor, model_type, params):
+    """Registry lineage of a corridor and model type, or None when df spans several reporters or partners"""
+    if corridor['reporterCode'] is None or corridor['partnerCode'] is None:
+        return None
+    payload = json.dumps([corridor, model_type, params], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _plan_update(base, digests):
+    """
+    Decide whether a model trained on base's years can be updated to the years in digests
+
+    Only a window moving forward qualifies: the years both share must be
+    unchanged (a revised year needs a full retrain) and every added year must be
+    newer than the base's last year.
+
+    Returns:
+        Tuple of (added years, dropped years), or None to train from scratch
+    """
+    old = {int(year): digest for year, digest in (base.get('year_digests') or {}).items()}
+    if not old or base.get('updates', 0) >= MAX_INCREMENTAL_UPDATES:
+        return None
+    shared = [year for year in digests if year in old]
+    added = sorted(year for year in digests if year not in old)
+    if not shared or not added or added[0] <= max(old):
+        return None
+    if any(old[year] != digests[year] for year in shared):
+        return None
+    return added, sorted(year for year in old if year not in digests)
+
+def _predict(entry, model_type, predict_year, partner_code, flow_code):
+    """Predict one value from a trained registry entry"""
+    if model_type == 'lstm':
+        pred_X_lstm = entry['x_scaler'].transform(np.array([[predict_year]], dtype=np.float64)).reshape((1, 1, 1))
+        if entry['format'] == 'keras':
+            # Entries saved before the NumPy export; calling the model skips predict()'s per-call setup
+            pred_value = float(np.asarray(entry['model'](pred_X_lstm, training=False))[0][0])
+        else:
+            pred_value = float(entry['model'].predict(pred_X_lstm)[0][0])
         # Inverse scale prediction
-        pred_value = scaler.inverse_transform([[pred_value]])[0][0]
-        mse = float(mse)
-    else:
+        return entry['y_scaler'].inverse_transform([[pred_value]])[0][0]
+    pred_X = np.array([[predict_year, FLOW_CODES.get(flow_code, -1), int(partner_code)]], dtype=np.float64)
+    return entry['model'].predict(pred_X)[0]
+
+def _model_key(features, model_type):
+    # The holdout rule changes what a model is trained on, so it is part of the key
+    return model_key(features.fingerprint, model_type, {'params': MODEL_PARAMS[model_type], 'holdout': HOLDOUT_BUCKETS})
+
+def get_model(df, model_type='linear'):
+    """
+    Return the trained registry entry for df and model_type, training it on a miss
+
+    Models depend only on the training data and hyperparameters, so one entry
+    serves every forecast year, partner and flow asked of it. On a miss, the
+    latest model of the same corridor is updated with the new years when its
+    window only moved forward, instead of training from scratch.
+    """
+    features = get_features(df)
+    params = MODEL_PARAMS[model_type]
+    key = _model_key(features, model_type)
+    corridor = corridor_of(df)
+    lineage = _lineage_key(corridor, model_type, params)
+
+    def train():
+        digests = _year_digests(features)
+        entry = _update_from_lineage(lineage, features, model_type, params, digests)
+        if entry is None:
+            with model_runtime.timed(f"train_{model_type}"):
+                entry = TRAINERS[model_type](features, params)
+            entry['updates'] = 0
+        entry['year_digests'] = digests
+        return entry
+
+    entry = _registry.get_or_train(key, train)
+    if lineage and entry.get('year_digests'):
+        _registry.set_latest(lineage, {
+            'key': key, 'corridor': corridor, 'model_type': model_type,
+            'last_year': max(int(year) for year in entry['year_digests']),
+        })
+    return entry
+
+def _update_from_lineage(lineage, features, model_type, params, digests):
+    """Update the corridor's latest model to the new history, or return None if it cannot be"""
+    if lineage is None or MAX_INCREMENTAL_UPDATES <= 0:
+        return None
+    record = _registry.latest(lineage)
+    base = _registry.get(record['key']) if record else None
+    plan = _plan_update(base, digests) if base is not None else None
+    if plan is None:
+        return None
+    added, dropped = plan
+    try:
+        with model_runtime.timed(f"update_{model_type}"):
+            entry = UPDATERS[model_type](base, features, params, added, dropped)
+    except ImportError:
+        raise
+    except Exception as e:
+        logger.warning(f"Incremental {model_type} update failed, retraining: {str(e)}")
+        return None
+    entry['updates'] = base.get('updates', 0) + 1
+    entry['updated_from'] = record['key']
+    return entry
+
+def has_model(df, model_type='linear'):
+    """Return whether a trained model for df and model_type is in the registry (memory or disk)"""
+    if model_type not in TRAINERS:
+        return False
+    return _registry.get(_model_key(get_features(df), model_type)) is not None
+
+def get_model_stats():
+    """Return counters of the trained-model registry"""
+    return _registry.stats()
+
+def refresh_models(reporterCode=None, model_types=None):
+    """
+    Bring the cached models up to the latest published year
+
+    Called after new periods land in the store. For every corridor with a
+    model (optionally only those of one reporter), the history window is moved
+    one year forward and, if that year is now available, the model is updated
+    incrementally through get_model. Histories are read with the query the
+    incremental sync stores (comtradeapicall.HISTORY_QUERY), and with the
+    persistent store enabled a corridor whose new year is not stored yet is
+    skipped without any upstream request.
+
+    Returns:
+        Counts of models updated, retrained, skipped (no new year) and failed
+    """
+    import comtradeapicall
+    from forecast_table import fetch_history
+
+    store = comtradeapicall._store
+    summary = {'updated': 0, 'retrained': 0, 'skipped': 0, 'failed': 0}
+    for record in _registry.lineages():
+        corridor = record['corridor']
+        if reporterCode is not None and corridor['reporterCode'] != str(reporterCode):
+            continue
+        if model_types is not None and record['model_type'] not in model_types:
+            continue
+        next_year = record['last_year'] + 1
+        cmd = corridor['cmdCode'] or 'TOTAL'
+        if store is not None:
+            query = {'period': str(next_year), 'reporterCode': corridor['reporterCode'],
+                     'partnerCode': corridor['partnerCode'], 'cmdCode': cmd}
+            if comtradeapicall._cache_key_for(query, comtradeapicall.HISTORY_QUERY) not in store:
+                summary['skipped'] += 1
+                continue
+        try:
+            df = fetch_history(corridor['reporterCode'], corridor['partnerCode'], cmd,
+                               corridor['flowCode'], predict_year=next_year + 1)
+            years = pd.to_numeric(df['refYear'], errors='coerce') if 'refYear' in df.columns else pd.Series(dtype=float)
+            if not (years == next_year).any():
+                summary['skipped'] += 1
+                continue
+            entry = get_model(df, record['model_type'])
+        except Exception as e:
+            summary['failed'] += 1
+            logger.warning(f"Could not refresh {record['model_type']} model for {corridor}: {str(e)}")
+            continue
+        summary['updated' if entry.get('updated_from') else 'retrained'] += 1
+    return summary
+
+def train_and_predict(df, predict_year, partner_code, flow_code, model_type='linear'):
+    if model_type not in TRAINERS:
         return {'error': f'Unknown model_type: {model_type}'}
+    try:
+        entry = get_model(df, model_type)
+    except ImportError:
+        return {'error': INSTALL_ERRORS[model_type]}
+    with model_runtime.timed(f"predict_{model_type}"):
+        pred_value = _predict(entry, model_type, predict_year, partner_code, flow_code)
     return {
-        'mse': float(mse),
+        'mse': float(entry['mse']),
         'prediction': float(pred_value),
         'model_type': model_type
     }
+
+def _stack(feature_sets, indices):
+    """Pad the selected rows of each series into (series, rows, features) arrays with a row mask"""
+    width = max(len(rows) for rows in indices)
+    X = np.zeros((len(feature_sets), width, len(FEATURE_COLUMNS)))
+    y = np.zeros((len(feature_sets), width))
+    mask = np.zeros((len(feature_sets), width))
+    for i, (features, rows) in enumerate(zip(feature_sets, indices)):
+        X[i, :len(rows)] = features.X[rows]
+        y[i, :len(rows)] = features.y[rows]
+        mask[i, :len(rows)] = 1.0
+    return X, y, mask
+
+def _fit_linear_batch(feature_sets):
+    """
+    Fit one ordinary least squares model per series in a single batched solve
+
+    Equivalent to _train_linear on each series (same held-out rows); the data are
+    centred per series and the minimum-norm solution of the normal equations is taken, so
+    constant columns (the partner within a corridor) get a zero coefficient.
+
+    Returns:
+        Tuple of (coef, intercept, mse) arrays with one row/value per series
+    """
+    splits = [_split_indices(features) for features in feature_sets]
+    X, y, mask = _stack(feature_sets, [train for train, _ in splits])
+    counts = mask.sum(axis=1)
+    x_mean = (X * mask[..., None]).sum(axis=1) / counts[:, None]
+    y_mean = (y * mask).sum(axis=1) / counts
+    Xc = (X - x_mean[:, None, :]) * mask[..., None]
+    yc = (y - y_mean[:, None]) * mask
+    Xt = Xc.transpose(0, 2, 1)
+    coef = (np.linalg.pinv(Xt @ Xc, rcond=1e-10, hermitian=True) @ (Xt @ yc[..., None]))[..., 0]
+    intercept = y_mean - (x_mean * coef).sum(axis=1)
+
+    X_test, y_test, test_mask = _stack(feature_sets, [test for _, test in splits])
+    residuals = (np.einsum('srf,sf->sr', X_test, coef) + intercept[:, None] - y_test) * test_mask
+    mse = (residuals ** 2).sum(axis=1) / test_mask.sum(axis=1)
+    return coef, intercept, mse
+
+def _corridor_error(corridor):
+    """Return why a batch corridor cannot be fitted, or None"""
+    df = corridor['df']
+    if df is None or df.empty:
+        return 'No historical data available for prediction'
+    missing = [column for column in SOURCE_COLUMNS if column not in df.columns]
+    if missing:
+        # Fallback example data uses another layout
+        return f"Historical data is missing columns: {', '.join(missing)}"
+    try:
+        int(corridor['partner_code'])
+    except (TypeError, ValueError):
+        return f"Invalid partner code: {corridor['partner_code']}"
+    return None
+
+def train_and_predict_batch(corridors, model_type='linear'):
+    """
+    Forecast many corridors in one call
+
+    Args:
+        corridors: List of dicts with 'df' (the corridor's history), 'predict_year',
+            'partner_code' and 'flow_code'
+        model_type: One model type for all corridors
+
+    Returns:
+        List of result dicts in corridor order, shaped like train_and_predict's;
+        corridors that cannot be fitted get an 'error' entry instead
+    """
+    if model_type not in TRAINERS:
+        return [{'error': f'Unknown model_type: {model_type}'} for _ in corridors]
+
+    results = [None] * len(corridors)
+    fit_positions, feature_sets = [], []
+    for i, corridor in enumerate(corridors):
+        error = _corridor_error(corridor)
+        if error is not None:
+            results[i] = {'error': error, 'model_type': model_type}
+        elif model_type != 'linear':
+            # No closed form for these; each corridor still reuses the model registry
+            try:
+                results[i] = train_and_predict(corridor['df'], corridor['predict_year'], corridor['partner_code'],
+                                               corridor['flow_code'], model_type=model_type)
+            except Exception as e:
+                logger.warning(f"Batch corridor {i} failed: {str(e)}")
+                results[i] = {'error': str(e), 'model_type': model_type}
+        else:
+            features = get_features(corridor['df'])
+            if len(features) < 2:
+                results[i] = {'error': 'Not enough historical data available for prediction', 'model_type': model_type}
+            else:
+                fit_positions.append(i)
+                feature_sets.append(features)
+
+    if feature_sets:
+        coef, intercept, mse = _fit_linear_batch(feature_sets)
+        pred_X = np.array([
+            [corridors[i]['predict_year'], FLOW_CODES.get(corridors[i]['flow_code'], -1), int(corridors[i]['partner_code'])]
+            for i in fit_positions
+        ], dtype=np.float64)
+        predictions = (pred_X * coef).sum(axis=1) + intercept
+        for j, i in enumerate(fit_positions):
+            results[i] = {
+                'mse': float(mse[j]),
+                'prediction': float(predictions[j]),
+                'model_type': model_type
+            }
+    return results
@@ -0,0 +1,296 @@
+"""
+Registry of trained prediction models
+Fitted models are keyed by the training data fingerprint, the model type and its
+hyperparameters, kept in a bounded in-memory LRU and persisted to disk (joblib for
+scikit-learn/XGBoost, the native .keras format for Keras) so repeat predictions
+skip training, also after a restart and across workers
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import joblib
+
+from trade_cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def model_key(fingerprint: str, model_type: str, params: Dict[str, Any]) -> str:
+    """Return the registry key for a model trained on a dataset with given hyperparameters"""
+    payload = json.dumps([fingerprint, model_type, params], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ModelRegistry:
+    """
+    Two-level cache of trained models
+
+    Entries are dicts with at least 'model' and 'format' ('joblib' or 'keras');
+    any other items (metrics, scalers) are persisted alongside the model. With
+    root=None the registry is memory-only.
+
+    A lineage index maps a corridor and model type to a record of its most
+    recently trained entry, so a model for a newer window of the same corridor
+    can start from it instead of from scratch.
+
+    On disk, each save drops entries and lineage records unused for longer than
+    max_age seconds, then the least recently used entries until the models take
+    at most max_bytes; loading an entry marks it as used.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_models: int = 32,
+                 max_bytes: int = 512 * 1024 * 1024, max_age: float = 30 * 24 * 3600):
+        self.root = root
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries = OrderedDict()  # key -> entry
+        self._lineages = {}  # lineage key -> {'key', 'corridor', 'model_type', 'last_year'}
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.trainings = 0
+        if root:
+            os.makedirs(os.path.join(root, "lineage"), exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for key from memory or disk, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Add an entry to memory and, if configured, to disk"""
+        self._remember(key, entry)
+        if self.root:
+            try:
+                self._save(key, entry)
+            except Exception as e:
+                logger.warning(f"Could not persist model {key}: {str(e)}")
+            self._prune(keep=key)
+
+    def get_or_train(self, key: str, train: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the entry for key, training it at most once per process on a miss
+
+        Concurrent requests for the same untrained model wait for the first one.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        def load():
+            # A call that finished while this one waited may have stored it already
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+            if entry is None:
+                entry = train()
+                with self._lock:
+                    self.trainings += 1
+                self.put(key, entry)
+            return entry
+
+        return self._single_flight.do(key, load)
+
+    def latest(self, lineage: str) -> Optional[Dict[str, Any]]:
+        """Return the lineage record of the latest model for a corridor, or None"""
+        with self._lock:
+            record = self._lineages.get(lineage)
+        if record is None and self.root:
+            try:
+                with open(self._lineage_path(lineage), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                return None
+            with self._lock:
+                self._lineages.setdefault(lineage, record)
+        return record
+
+    def set_latest(self, lineage: str, record: Dict[str, Any]) -> None:
+        """Point a lineage at a newer entry; the file is only rewritten when the record changes"""
+        with self._lock:
+            if self._lineages.get(lineage) == record:
+                return
+            self._lineages[lineage] = record
+        if self.root:
+            try:
+                tmp_path = self._lineage_path(f"{lineage}.{uuid.uuid4().hex}") + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(record, f)
+                os.replace(tmp_path, self._lineage_path(lineage))
+            except OSError as e:
+                logger.warning(f"Could not persist lineage {lineage}: {str(e)}")
+
+    def lineages(self) -> List[Dict[str, Any]]:
+        """Return every lineage record known in memory or on disk"""
+        names = set()
+        if self.root:
+            try:
+                names = {name[:-5] for name in os.listdir(os.path.join(self.root, "lineage")) if name.endswith(".json")}
+            except OSError:
+                pass
+        with self._lock:
+            names.update(self._lineages)
+        records = [self.latest(name) for name in sorted(names)]
+        return [record for record in records if record is not None]
+
+    def clear(self) -> None:
+        """Drop the in-memory models (files on disk are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_models': self.max_models,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+                'trainings': self.trainings,
+                'lineages': len(self._lineages),
+                'persistent': bool(self.root),
+                'max_disk_bytes': self.max_bytes if self.root else 0,
+            }
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_models:
+                self._entries.popitem(last=False)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, f"{key}.{suffix}")
+
+    def _lineage_path(self, lineage: str) -> str:
+        return os.path.join(self.root, "lineage", f"{lineage}.json")
+
+    def _save(self, key: str, entry: Dict[str, Any]) -> None:
+        meta = dict(entry)
+        if entry['format'] == 'keras':
+            # Keras picks the format from the suffix, so the temporary name keeps it
+            tmp_path = self._path(f"{key}.{uuid.uuid4().hex}.tmp", "keras")
+            entry['model'].save(tmp_path)
+            os.replace(tmp_path, self._path(key, "keras"))
+            meta['model'] = None
+        # Written last: its presence marks the entry as complete
+        tmp_path = self._path(f"{key}.{uuid.uuid4().hex}", "tmp")
+        joblib.dump(meta, tmp_path)
+        os.replace(tmp_path, self._path(key, "joblib"))
+
+    def _prune(self, keep: str) -> None:
+        """Enforce max_age and max_bytes on the directory, never removing keep"""
+        cutoff = time.time() - self.max_age
+        files = {}  # key -> [(path, size)] of its .joblib and .keras files
+        used = {}  # key -> mtime of its .joblib file
+        try:
+            for item in os.scandir(self.root):
+                key, _, suffix = item.name.partition(".")
+                if not item.is_file() or suffix not in ("joblib", "keras"):
+                    continue
+                stat = item.stat()
+                files.setdefault(key, []).append((item.path, stat.st_size))
+                if suffix == "joblib":
+                    used[key] = stat.st_mtime
+        except OSError as e:
+            logger.warning(f"Could not scan model directory {self.root}: {str(e)}")
+            return
+        total = sum(size for paths in files.values() for _, size in paths)
+        # Least recently used first; a .keras file without its .joblib is a save in progress
+        for key in sorted(used, key=used.get):
+            if key == keep or (used[key] >= cutoff and total <= self.max_bytes):
+                continue
+            for path, size in files.pop(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Pruned by another worker
+                except OSError as e:
+                    logger.warning(f"Could not remove model file {path}: {str(e)}")
+                total -= size
+        # Old lineage records whose model is gone would only lead to a full retrain
+        try:
+            stale = [item for item in os.scandir(os.path.join(self.root, "lineage"))
+                     if item.name.endswith(".json") and item.stat().st_mtime < cutoff]
+        except OSError:
+            stale = []
+        for item in stale:
+            lineage = item.name[:-len(".json")]
+            record = self.latest(lineage)
+            if record is not None and record.get('key') in files:
+                continue
+            try:
+                os.remove(item.path)
+            except OSError:
+                pass
+            with self._lock:
+                self._lineages.pop(lineage, None)
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.root:
+            return None
+        path = self._path(key, "joblib")
+        if not os.path.exists(path):
+            return None
+        try:
+            entry = joblib.load(path)
+            # The modification time records the last use for pruning
+            os.utime(path)
+            if entry['format'] == 'keras':
+                from tensorflow.keras.models import load_model
+                entry['model'] = load_model(self._path(key, "keras"))
+            return entry
+        except Exception as e:
+            logger.warning(f"Could not load model {key}: {str(e)}")
+            return None
+
+
+def default_model_dir() -> str:
+    """Return the registry directory configured by ML_MODEL_DIR ('' when disabled)"""
+    return os.environ.get("ML_MODEL_DIR", os.path.join("data", "models"))
+
+
+def open_default_registry() -> ModelRegistry:
+    """
+    Open the registry configured by ML_MODEL_DIR (default data/models)
+
+    An empty value keeps models in memory only; ML_MODEL_CACHE_SIZE bounds the
+    number of models held in memory. On disk, ML_MODEL_DIR_MAX_BYTES (default
+    512 MB) caps the models' size and ML_MODEL_MAX_AGE (seconds, default 30
+    days) drops models and lineages unused for longer.
+    """
+    root = default_model_dir()
+    max_models = int(os.environ.get("ML_MODEL_CACHE_SIZE", "32"))
+    max_bytes = int(os.environ.get("ML_MODEL_DIR_MAX_BYTES", str(512 * 1024 * 1024)))
+    max_age = float(os.environ.get("ML_MODEL_MAX_AGE", str(30 * 24 * 3600)))
+    if root:
+        try:
+            return ModelRegistry(root, max_models, max_bytes=max_bytes, max_age=max_age)
+        except OSError as e:
+            logger.warning(f"Could not open model directory {root}: {str(e)}")
+    return ModelRegistry(None, max_models)
@@ -0,0 +1,185 @@
+"""
+Runtime manager for the heavy model backends
+Imports TensorFlow and XGBoost once per process (lazily, or at worker start when
+ML_PRELOAD_BACKENDS is set), keeps compiled LSTM models in a pool so a refit only
+resets their weights instead of rebuilding and recompiling the graph, and records
+import and first-call latency
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Module imported for each backend name
+BACKEND_MODULES = {
+    'tensorflow': 'tensorflow',
+    'xgboost': 'xgboost',
+}
+
+_lock = threading.Lock()
+_backends = {}  # name -> {'module', 'seconds', 'error'}
+_calls = {}  # name -> {'first_seconds', 'last_seconds', 'count'}
+
+
+def load_backend(name: str) -> Any:
+    """
+    Import a backend once per process and return its module
+
+    A failed import is remembered, so later calls raise ImportError straight away
+    instead of retrying a slow import on every request.
+
+    Raises:
+        ImportError: If the backend is not installed
+    """
+    state = _backends.get(name)
+    if state is None:
+        with _lock:
+            state = _backends.get(name)
+            if state is None:
+                start = time.perf_counter()
+                try:
+                    module, error = importlib.import_module(BACKEND_MODULES[name]), None
+                except ImportError as e:
+                    module, error = None, str(e)
+                state = {'module': module, 'seconds': time.perf_counter() - start, 'error': error}
+                _backends[name] = state
+                if error is None:
+                    logger.info(f"Loaded {name} in {state['seconds']:.2f}s")
+    if state['module'] is None:
+        raise ImportError(state['error'])
+    return state['module']
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record how long a successful model call takes, keeping the first call separately"""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    with _lock:
+        calls = _calls.setdefault(name, {'first_seconds': elapsed, 'last_seconds': elapsed, 'count': 0})
+        calls['last_seconds'] = elapsed
+        calls['count'] += 1
+
+
+class LSTMPool:
+    """
+    Pool of compiled LSTM models per architecture
+
+    Building and compiling a Keras model (and tracing its training function on
+    the first fit) dominates small fits. A leased model is reset to its initial
+    weights and a zeroed optimizer state, which is equivalent to a fresh model
+    but reuses the compiled graph. Each lease is exclusive, so concurrent fits
+    get separate models.
+    """
+
+    def __init__(self):
+        self._idle = {}  # units -> list of (model, initial_weights)
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+
+    def _build(self, units: int):
+        load_backend('tensorflow')
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import LSTM, Dense
+        model = Sequential([
+            LSTM(units, input_shape=(1, 1)),
+            Dense(1)
+        ])
+        model.compile(optimizer='adam', loss='mse')
+        self.built += 1
+        return model, model.get_weights()
+
+    @staticmethod
+    def _reset(model, initial_weights) -> None:
+        model.set_weights(initial_weights)
+        optimizer = getattr(model, 'optimizer', None)
+        variables = getattr(optimizer, 'variables', [])
+        # Adam's moments and step counter; tf.keras exposes them as a method, Keras 3 as a property
+        for variable in (variables() if callable(variables) else variables):
+            dtype = getattr(variable.dtype, 'name', variable.dtype)
+            variable.assign(np.zeros(variable.shape, dtype=dtype))
+
+    @contextmanager
+    def lease(self, units: int) -> Iterator[Any]:
+        """Yield a compiled LSTM(units) -> Dense(1) model in its initial state"""
+        with self._lock:
+            idle = self._idle.setdefault(units, [])
+            item = idle.pop() if idle else None
+        if item is None:
+            item = self._build(units)
+        else:
+            self._reset(*item)
+            self.reused += 1
+        try:
+            yield item[0]
+        finally:
+            with self._lock:
+                self._idle.setdefault(units, []).append(item)
+
+    def warm(self, units: int) -> None:
+        """Build one model and trace its train and predict functions ahead of the first request"""
+        with self.lease(units) as model:
+            x = np.zeros((2, 1, 1), dtype=np.float32)
+            model.fit(x, np.zeros((2, 1), dtype=np.float32), epochs=1, verbose=0)
+            model.predict(x, verbose=0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'idle': {str(units): len(items) for units, items in self._idle.items()},
+                'built': self.built,
+                'reused': self.reused,
+            }
+
+
+lstm_pool = LSTMPool()
+
+
+def preload(names: Iterable[str], lstm_units: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Import backends (and optionally build an LSTM) before the first request
+
+    Failures are logged, not raised, so a missing optional backend does not stop
+    the worker from starting.
+    """
+    names = list(names)
+    for name in names:
+        try:
+            load_backend(name)
+        except (ImportError, KeyError) as e:
+            logger.warning(f"Could not preload {name}: {str(e)}")
+    if lstm_units and 'tensorflow' in names and _backends.get('tensorflow', {}).get('module') is not None:
+        with timed('lstm_build'):
+            lstm_pool.warm(lstm_units)
+    return get_runtime_stats()
+
+
+def preload_from_env(lstm_units: Optional[int] = None) -> None:
+    """Preload the backends listed in ML_PRELOAD_BACKENDS (comma separated, e.g. "tensorflow,xgboost")"""
+    names = [n.strip() for n in os.environ.get("ML_PRELOAD_BACKENDS", "").split(",") if n.strip()]
+    if names:
+        preload(names, lstm_units)
+
+
+def get_runtime_stats() -> Dict[str, Any]:
+    """Return backend import latency, per-model call latency and LSTM pool counters"""
+    with _lock:
+        backends = {
+            name: {'loaded': state['module'] is not None, 'import_seconds': state['seconds'], 'error': state['error']}
+            for name, state in _backends.items()
+        }
+        calls = {name: dict(calls) for name, calls in _calls.items()}
+    return {
+        'backends': backends,
+        'calls': calls,
+        'lstm_pool': lstm_pool.stats(),
+    }
@@ -0,0 +1,205 @@
+"""
+Offline pre-warm job for the default country and commodity menus
+Walks every reporter x partner x commodity x year combination the UI offers by
+default and fetches it through previewFinalData, both as /api/trade asks for it
+and as /api/predict does for its history, so the results land in the persistent
+store (and shared cache) before users ask for them.
+
+Progress is checkpointed to a JSON file so an interrupted run resumes where it
+stopped:
+
+    python prewarm.py --start-year 2018 --end-year 2022
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import comtradeapicall
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = os.path.join("data", "prewarm_checkpoint.json")
+
+# previewFinalData parameters of the lookups to warm: 'trade' as sent by /api/trade
+# and /api/trade/bulk, 'history' as sent by /api/predict for its training history
+QUERY_PROFILES = {
+    'trade': {'typeCode': 'C', 'freqCode': 'A', 'clCode': 'HS', 'maxRecords': 500,
+              'format_output': 'JSON', 'breakdownMode': 'classic', 'includeDesc': True},
+    'history': comtradeapicall.HISTORY_QUERY,
+}
+
+
+def build_tasks(years: Iterable[Any], countries: Optional[List[str]] = None,
+                commodities: Optional[List[str]] = None,
+                profiles: Iterable[str] = ('trade', 'history')) -> List[Dict[str, str]]:
+    """
+    List the queries to warm, in a fixed order
+
+    Defaults to the codes from get_country_list and get_commodity_list; self
+    pairs are skipped. Years are the outermost loop so the most useful
+    (latest) years can be warmed first by passing them in that order. Each
+    task names the QUERY_PROFILES entry it is sent with.
+    """
+    countries = countries or [c['code'] for c in comtradeapicall.get_country_list()]
+    commodities = commodities or [c['code'] for c in comtradeapicall.get_commodity_list()]
+    return [
+        {'period': str(year), 'reporterCode': reporter, 'partnerCode': partner, 'cmdCode': cmd, 'profile': profile}
+        for year, profile, reporter, partner, cmd in itertools.product(years, profiles, countries, countries, commodities)
+        if reporter != partner
+    ]
+
+
+def _is_stored(key: tuple) -> bool:
+    """Whether a genuine API result for key is in the persistent store or the shared cache"""
+    if comtradeapicall._store is not None and key in comtradeapicall._store:
+        return True
+    shared = comtradeapicall._shared_cache.get(key) if comtradeapicall._shared_cache is not None else None
+    return shared is not None and not shared[1]
+
+
+def _fingerprint(tasks: List[Dict[str, str]], query: Dict[str, Any]) -> str:
+    """Identify a task list so a checkpoint is only resumed for the same job"""
+    digest = hashlib.sha1(json.dumps([tasks, query], sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_checkpoint(path: str, fingerprint: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('fingerprint') == fingerprint:
+            return checkpoint
+        logger.info("Checkpoint belongs to a different job; starting from the beginning")
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        logger.warning(f"Ignoring unreadable checkpoint {path}")
+    return {'fingerprint': fingerprint, 'next_index': 0, 'failed': [], 'completed': 0}
+
+
+def _save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def run_prewarm(
+    years: Iterable[Any],
+    countries: Optional[List[str]] = None,
+    commodities: Optional[List[str]] = None,
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    max_requests: Optional[int] = None,
+    checkpoint_every: int = 10,
+    retry_failed: bool = True,
+    profiles: Iterable[str] = ('trade', 'history'),
+    **query
+) -> Dict[str, Any]:
+    """
+    Warm the cache/store for every default-menu combination
+
+    Requests go through previewFinalData, so the rate limiter paces them and
+    combinations already in the store cost no upstream call. A lookup only
+    counts as warmed once its result is in the store or the shared cache;
+    failures (fallback data) are remembered in the checkpoint and retried at the
+    start of the next run when retry_failed is set.
+
+    Args:
+        years: Years to warm
+        countries: Country codes (defaults to get_country_list)
+        commodities: Commodity codes (defaults to get_commodity_list)
+        checkpoint_path: JSON file recording progress
+        max_requests: Stop after this many lookups (None runs to completion)
+        checkpoint_every: Save progress after this many lookups
+        retry_failed: Retry tasks that failed in earlier runs first
+        profiles: QUERY_PROFILES to warm
+        **query: Overrides of the 'trade' profile's previewFinalData parameters;
+            they must match the parameters the app uses so the warmed entries are hit
+
+    Returns:
+        Summary dict with counts of processed, failed and remaining tasks
+
+    Raises:
+        RuntimeError: If neither the persistent store nor the shared cache is enabled
+    """
+    if comtradeapicall._store is None and comtradeapicall._shared_cache is None:
+        raise RuntimeError("Pre-warming needs the persistent store (COMTRADE_STORE_DIR) or the shared cache")
+    queries = {name: dict(QUERY_PROFILES[name], **(query if name == 'trade' else {})) for name in profiles}
+    tasks = build_tasks(years, countries, commodities, profiles)
+    checkpoint = _load_checkpoint(checkpoint_path, _fingerprint(tasks, queries))
+
+    # Earlier failures first, then continue where the last run stopped
+    queue = [(index, True) for index in checkpoint['failed']] if retry_failed else []
+    checkpoint['failed'] = [] if retry_failed else checkpoint['failed']
+    queue += [(index, False) for index in range(checkpoint['next_index'], len(tasks))]
+
+    processed = 0
+    started = time.time()
+    for index, retry in queue:
+        if max_requests is not None and processed >= max_requests:
+            break
+        task = dict(tasks[index])
+        query = queries[task.pop('profile')]
+        try:
+            if retry:
+                # Bypass the short-lived negative cache entry left by the failure
+                comtradeapicall.refreshFinalData(**task, **query)
+            else:
+                comtradeapicall.previewFinalData(**task, **query)
+            # Fallback data is returned without being stored, so only stored results count
+            ok = _is_stored(comtradeapicall._cache_key_for(task, query))
+        except Exception as e:
+            logger.error(f"Pre-warm failed for {task}: {str(e)}")
+            ok = False
+        if not ok and index not in checkpoint['failed']:
+            checkpoint['failed'].append(index)
+        if index >= checkpoint['next_index']:
+            checkpoint['next_index'] = index + 1
+        checkpoint['completed'] += 1 if ok else 0
+        processed += 1
+        if processed % checkpoint_every == 0:
+            _save_checkpoint(checkpoint_path, checkpoint)
+            logger.info(f"Pre-warm progress: {checkpoint['next_index']}/{len(tasks)}, {len(checkpoint['failed'])} failed")
+    _save_checkpoint(checkpoint_path, checkpoint)
+
+    return {
+        'total': len(tasks),
+        'processed': processed,
+        'completed': checkpoint['completed'],
+        'failed': len(checkpoint['failed']),
+        'remaining': len(tasks) - checkpoint['next_index'],
+        'seconds': time.time() - started,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the COMTRADE cache/store for the default menus")
+    parser.add_argument("--start-year", type=int, required=True)
+    parser.add_argument("--end-year", type=int, required=True)
+    parser.add_argument("--countries", nargs="*", default=None, help="Country codes (default: the UI country list)")
+    parser.add_argument("--commodities", nargs="*", default=None, help="Commodity codes (default: the UI commodity list)")
+    parser.add_argument("--max-records", type=int, default=500, help="maxRecords of the /api/trade lookups to warm")
+    parser.add_argument("--profiles", nargs="+", default=list(QUERY_PROFILES), choices=list(QUERY_PROFILES),
+                        help="Lookups to warm: trade (/api/trade) and/or history (/api/predict)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--max-requests", type=int, default=None, help="Stop after this many lookups")
+    args = parser.parse_args()
+
+    # Latest years first: they are the ones users ask for most
+    years = range(args.end_year, args.start_year - 1, -1)
+    summary = run_prewarm(
+        years, args.countries, args.commodities,
+        checkpoint_path=args.checkpoint, max_requests=args.max_requests, profiles=args.profiles,
+        maxRecords=args.max_records
+    )
+    print(f"Processed {summary['processed']} of {summary['total']} combinations in {summary['seconds']:.0f}s: "
+          f"{summary['completed']} warmed, {summary['failed']} failed, {summary['remaining']} remaining")
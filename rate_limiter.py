@@ -0,0 +1,212 @@
+"""
+Client-side rate limiting for the UN COMTRADE API
+A multi-bucket token bucket (e.g. 1 request/second and 100 requests/hour) that
+schedules callers instead of letting them run into 429 responses
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits are enforced per process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket limiter with several budgets that must all be satisfied
+
+    acquire() reserves a token from every bucket and sleeps until the
+    reservation is due, so waiting callers are served in arrival order without
+    polling. When `state_path` is given the bucket state lives in that file and
+    is updated under an exclusive file lock, sharing the budget between all
+    processes on the host.
+    """
+
+    def __init__(self, limits: List[Tuple[int, float]], state_path: Optional[str] = None):
+        """
+        Args:
+            limits: List of (requests, period_seconds) budgets, e.g. [(1, 1), (100, 3600)]
+            state_path: Optional file used to share the buckets across processes
+        """
+        self.limits = [(int(capacity), float(period)) for capacity, period in limits]
+        self.state_path = state_path if fcntl is not None else None
+        if state_path and self.state_path is None:
+            logger.warning("fcntl is unavailable; rate limit is enforced per process only")
+        now = time.time()
+        self._state = {'tokens': [float(c) for c, _ in self.limits], 'updated': now}
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a request may be sent
+
+        Args:
+            timeout: Maximum seconds to wait; None waits as long as needed
+
+        Returns:
+            True when the caller may proceed, False if the wait would exceed timeout
+        """
+        wait = self._begin(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._end()
+        return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Asyncio counterpart of acquire() that waits without blocking the event loop"""
+        wait = self._begin(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._end()
+        return True
+
+    def _begin(self, timeout: Optional[float]) -> Optional[float]:
+        """Reserve a slot and update counters; return the wait in seconds or None if rejected"""
+        with self._transaction() as state:
+            wait = self._reserve(state, timeout)
+        with self._lock:
+            if wait is None:
+                self.rejected += 1
+                return None
+            self.acquired += 1
+            self.total_wait += wait
+            if wait > 0:
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        return wait
+
+    def _end(self) -> None:
+        with self._lock:
+            self.queue_depth -= 1
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Stop everyone sending for `seconds` (e.g. after a 429 Retry-After)
+
+        Sets a deadline rather than draining the buckets, so a short Retry-After
+        does not eat into the hourly budget. Buckets do not refill while blocked,
+        and queued reservations resume at their usual spacing after the deadline.
+        """
+        with self._transaction() as state:
+            self._refill(state)
+            state['blocked_until'] = max(state.get('blocked_until', 0.0), time.time() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and wait counters"""
+        with self._transaction() as state:
+            self._refill(state)
+            tokens = list(state['tokens'])
+            blocked = max(0.0, state.get('blocked_until', 0.0) - time.time())
+        with self._lock:
+            return {
+                'limits': [{'requests': c, 'period_seconds': p} for c, p in self.limits],
+                'tokens': tokens,
+                'blocked_seconds': blocked,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'acquired': self.acquired,
+                'rejected': self.rejected,
+                'total_wait_seconds': self.total_wait,
+                'shared': self.state_path is not None,
+            }
+
+    def _refill(self, state: Dict[str, Any]) -> None:
+        now = time.time()
+        # Time spent blocked by penalize() does not refill the buckets
+        elapsed = max(0.0, now - max(state['updated'], state.get('blocked_until', 0.0)))
+        for i, (capacity, period) in enumerate(self.limits):
+            state['tokens'][i] = min(float(capacity), state['tokens'][i] + elapsed * capacity / period)
+        state['updated'] = now
+
+    def _reserve(self, state: Dict[str, Any], timeout: Optional[float]) -> Optional[float]:
+        """Take one token from every bucket and return how long to wait for it (None if over timeout)"""
+        self._refill(state)
+        blocked = max(0.0, state.get('blocked_until', 0.0) - time.time())
+        wait = 0.0
+        for i, (capacity, period) in enumerate(self.limits):
+            remaining = state['tokens'][i] - 1
+            if remaining < 0:
+                wait = max(wait, -remaining * period / capacity)
+        # Refill resumes at the deadline, so missing tokens are counted from there
+        wait += blocked
+        if timeout is not None and wait > timeout:
+            return None
+        for i in range(len(self.limits)):
+            # Tokens may go negative: that is the queue of reservations ahead of the next caller
+            state['tokens'][i] -= 1
+        return wait
+
+    @contextmanager
+    def _transaction(self):
+        """Yield the bucket state, loading and saving it under the file lock if shared"""
+        with self._lock:
+            if self.state_path is None:
+                yield self._state
+                return
+            fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = b""
+                while True:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    raw += chunk
+                state = self._state
+                if raw:
+                    try:
+                        loaded = json.loads(raw)
+                        if len(loaded.get('tokens', [])) == len(self.limits):
+                            state = loaded
+                    except ValueError:
+                        pass
+                yield state
+                self._state = state
+                data = json.dumps(state).encode("utf-8")
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+
+def limiter_from_env() -> RateLimiter:
+    """
+    Build the COMTRADE limiter from the environment
+
+    COMTRADE_RATE_PER_SECOND and COMTRADE_RATE_PER_HOUR default to the documented
+    1 request/second and 100 requests/hour; COMTRADE_RATE_LOCK_FILE shares the
+    budget across processes.
+    """
+    per_second = float(os.environ.get("COMTRADE_RATE_PER_SECOND", "1"))
+    per_hour = float(os.environ.get("COMTRADE_RATE_PER_HOUR", "100"))
+    limits = []
+    if per_second > 0:
+        # Bucket of at least one token refilled at per_second tokens/second
+        limits.append((max(1, int(per_second)), max(1, int(per_second)) / per_second))
+    if per_hour > 0:
+        limits.append((int(per_hour), 3600.0))
+    return RateLimiter(limits, state_path=os.environ.get("COMTRADE_RATE_LOCK_FILE") or None)
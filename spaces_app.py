@@ -188,7 +188,12 @@ def predict_trade(data, model_type):
     return {"predictions": [], "status": "placeholder"}
 
 def export_data(data, format_type):
-    return "placeholder_data"
+    """Return a generator of CSV/NDJSON text chunks for records or a DataFrame"""
+    import trade_export
+    if isinstance(data, dict) and "data" in data:
+        data = data["data"]
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    return trade_export.iter_export([df], format_type)
 
 def get_ml_models():
     return ["Linear Regression", "Random Forest"]
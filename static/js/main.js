@@ -341,46 +341,35 @@ document.addEventListener('DOMContentLoaded', function() {
           return;
         }
         dataDownloadStatus.innerHTML = '<div>Fetching data...</div>';
-        let allRows = [];
-        let columnsSet = new Set();
-        for (let r of reporterList) {
-          for (let p of partnerList) {
-            if (r === p) continue; // skip self-pairs
-            const payload = {
-              reporterCode: r,
-              partnerCode: p,
-              period: year,
-              cmdCode: cmdCode,
-              flowCode: flowCode
-            };
-            try {
-              const resp = await fetch('/api/trade', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(payload)
-              });
-              const data = await resp.json();
-              if (data && data.rows && data.rows.length > 0) {
-                data.rows.forEach(row => {
-                  allRows.push(row);
-                });
-                data.columns.forEach(col => columnsSet.add(col));
-              }
-            } catch (err) {
-              // skip errors
-            }
+        // One bulk request; the server deduplicates, fetches concurrently and streams CSV back
+        let csv = '';
+        try {
+          const resp = await fetch('/api/trade/bulk', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+              reporterCodes: reporterList,
+              partnerCodes: partnerList,
+              periods: [year],
+              cmdCodes: [cmdCode],
+              flowCode: flowCode,
+              format: 'csv'
+            })
+          });
+          if (!resp.ok) {
+            const err = await resp.json().catch(() => ({}));
+            dataDownloadStatus.innerHTML = '<div style="color:red;">' + (err.error || 'Download failed.') + '</div>';
+            return;
           }
+          csv = await resp.text();
+        } catch (err) {
+          dataDownloadStatus.innerHTML = '<div style="color:red;">Download failed.</div>';
+          return;
         }
-        if (allRows.length === 0) {
+        if (!csv) {
           dataDownloadStatus.innerHTML = '<div>No data found for your selection.</div>';
           return;
         }
-        // Build CSV
-        const columns = Array.from(columnsSet);
-        let csv = columns.join(',') + '\n';
-        allRows.forEach(row => {
-          csv += columns.map(col => row[col] !== undefined ? row[col] : '').join(',') + '\n';
-        });
         const blob = new Blob([csv], {type: 'text/csv'});
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
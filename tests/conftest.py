@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests must not read from or write to the persistent store or model directory,
+# whichever test module happens to import comtradeapicall first
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+
+class StubComtradeServer:
+    """
+    Local HTTP/1.1 server answering every GET with a small COMTRADE-style payload
+
+    Counts accepted TCP connections so benchmarks can show connection reuse, and
+    the most requests in progress at once. statuses are answered first, in order,
+    before the payload (429s carry Retry-After: 1); delay slows every response.
+    """
+
+    def __init__(self, payload=None, statuses=(), delay=0.0):
+        self.payload = json.dumps(payload or {'dataset': [{'yr': 2022, 'primaryValue': 1.0}]}).encode("utf-8")
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send headers and body in one segment so keep-alive is not penalised by Nagle
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                with stub._lock:
+                    stub.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    body = stub.payload if status == 200 else b'{"error": "stub"}'
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", "1")
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/api/get"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        self.connections = 0
+        self.requests = 0
+        self.max_active = 0
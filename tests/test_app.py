@@ -0,0 +1,90 @@
+import os
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+app = pytest.importorskip("app")
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("value", ["abc", None, 0, True, 1.5])
+def test_export_rejects_bad_max_records(client, value):
+    response = client.post('/api/trade/export', json={'maxRecords': value})
+    assert response.status_code == 400
+    assert 'maxRecords' in response.get_json()['error']
+
+
+@pytest.mark.parametrize("body", [
+    {'corridors': [{'period': 'x'}]},
+    {'corridors': [{}], 'period': [2023]},
+    {'corridors': [{'period': 2023}, {'period': 2023.5}]},
+])
+def test_batch_rejects_bad_periods(client, body):
+    response = client.post('/api/predict/batch', json=body)
+    assert response.status_code == 400
+    assert 'period' in response.get_json()['error']
+
+
+def test_hierarchy_rejects_bad_period(client):
+    response = client.post('/api/predict/hierarchy', json={'period': 'soon'})
+    assert response.status_code == 400
+
+
+def test_hierarchy_reports_fallback_data(client, monkeypatch):
+    comtradeapicall = app.comtradeapicall
+    monkeypatch.setattr(comtradeapicall, 'fetchPeriods', lambda periods, **kwargs: comtradeapicall.get_fallback_data(
+        kwargs.get('reporterCode'), kwargs.get('partnerCode'), periods[0], kwargs.get('cmdCode'), kwargs.get('flowCode')))
+    response = client.post('/api/predict/hierarchy', json={'period': 2023})
+    assert response.status_code == 503
+    assert response.get_json()['fallback'] is True
+
+
+def test_hierarchy_without_hs_codes_is_not_found(client, monkeypatch):
+    frame = pd.DataFrame({'cmdCode': ['TOTAL'], 'flowCode': ['M'], 'refYear': [2020], 'primaryValue': [1.0]})
+    monkeypatch.setattr(app.comtradeapicall, 'fetchPeriods', lambda periods, **kwargs: frame)
+    response = client.post('/api/predict/hierarchy', json={'period': 2023})
+    assert response.status_code == 404
+
+
+def test_hierarchy_forecasts_hs_codes(client, monkeypatch):
+    frame = pd.DataFrame({
+        'cmdCode': ['01', '02'] * 3, 'flowCode': ['M'] * 6,
+        'refYear': [2020, 2020, 2021, 2021, 2022, 2022], 'primaryValue': [1.0, 2.0, 2.0, 3.0, 3.0, 4.0],
+    })
+    monkeypatch.setattr(app.comtradeapicall, 'fetchPeriods', lambda periods, **kwargs: frame)
+    response = client.post('/api/predict/hierarchy', json={'period': 2023})
+    assert response.status_code == 200
+    tree = response.get_json()['trees']['M']
+    assert tree['code'] == 'TOTAL' and len(tree['children']) == 2
+
+
+def test_bulk_export_skips_fallback_pairs(client, monkeypatch):
+    def lookup(**query):
+        if query['partnerCode'] == '156':
+            return app.comtradeapicall.get_fallback_data('842', '156', '2022', 'TOTAL', None), False
+        return pd.DataFrame({'reporterCode': [842], 'partnerCode': [int(query['partnerCode'])],
+                             'primaryValue': [1.0], 'extra': ['x']}), True
+
+    monkeypatch.setattr(app.comtradeapicall, 'lookupFinalData', lookup)
+    response = client.post('/api/trade/bulk', json={
+        'reporterCodes': ['842'], 'partnerCodes': ['156', '124', '484'], 'periods': ['2022'],
+    })
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.status_code == 200
+    assert lines[0].split(',') == app.trade_export.EXPORT_COLUMNS
+    assert len(lines) == 3
+    assert 'United States' not in response.get_data(as_text=True)
+
+
+def test_async_predict_needs_training_workers(client, monkeypatch):
+    monkeypatch.setattr(app.training_executor.get_executor(), 'max_workers', 0)
+    response = client.post('/api/predict', json={'modelType': 'xgboost', 'async': True})
+    assert response.status_code == 400
+    assert 'ML_TRAIN_WORKERS' in response.get_json()['error']
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import StubComtradeServer
+import comtradeapicall
+from comtrade_async import AIOHTTP_AVAILABLE, AsyncComtradeClient
+from rate_limiter import RateLimiter
+
+pytestmark = pytest.mark.skipif(not AIOHTTP_AVAILABLE, reason="aiohttp is not installed")
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Unlimited limiter in place of the COMTRADE one, with an empty cache and no store"""
+    limiter = RateLimiter([])
+    monkeypatch.setattr(comtradeapicall, '_rate_limiter', limiter)
+    monkeypatch.setattr(comtradeapicall, '_store', None)
+    monkeypatch.setattr(comtradeapicall, '_shared_cache', None)
+    comtradeapicall._data_cache.clear()
+    yield limiter
+    comtradeapicall._data_cache.clear()
+
+
+def fetch_many(server, queries, **client_kwargs):
+    async def run():
+        async with AsyncComtradeClient(base_url=server.url, alternative_url=server.url, **client_kwargs) as client:
+            return await client.fetchMany(queries)
+    return asyncio.run(run())
+
+
+def is_stub_payload(df):
+    return 'primaryValue' in df.columns and df['primaryValue'].tolist() == [1.0]
+
+
+def is_fallback(df):
+    return 'rtTitle' in df.columns
+
+
+def test_connection_limit_bounds_requests_in_flight(limiter):
+    queries = [{'period': '2022', 'reporterCode': str(i)} for i in range(20)]
+    with StubComtradeServer(delay=0.05) as server:
+        frames = fetch_many(server, queries, max_connections=4)
+    assert all(is_stub_payload(df) for df in frames)
+    assert server.requests == 20
+    assert 1 < server.max_active <= 4
+    assert server.connections <= 4
+
+
+def test_rate_limiter_spaces_requests(monkeypatch, limiter):
+    monkeypatch.setattr(comtradeapicall, '_rate_limiter', RateLimiter([(1, 0.1)]))
+    queries = [{'period': '2022', 'reporterCode': str(i)} for i in range(5)]
+    with StubComtradeServer() as server:
+        start = time.monotonic()
+        frames = fetch_many(server, queries)
+        elapsed = time.monotonic() - start
+    assert all(is_stub_payload(df) for df in frames)
+    # The first token is available at once, the other four are 0.1 s apart
+    assert elapsed >= 0.35
+
+
+def test_identical_queries_share_one_request(limiter):
+    with StubComtradeServer(delay=0.05) as server:
+        frames = fetch_many(server, [{'period': '2022', 'reporterCode': '842'}] * 10)
+    assert all(is_stub_payload(df) for df in frames)
+    assert server.requests == 1
+
+
+def test_429_penalizes_the_limiter_and_retries(limiter):
+    with StubComtradeServer(statuses=[429]) as server:
+        start = time.monotonic()
+        [df] = fetch_many(server, [{'period': '2022', 'reporterCode': '842'}])
+        elapsed = time.monotonic() - start
+    assert is_stub_payload(df)
+    assert server.requests == 2
+    # Retry-After: 1 blocks the limiter before the retry is sent
+    assert elapsed >= 0.9
+    assert limiter.acquired == 2
+
+
+def test_404_switches_to_the_alternative_endpoint(limiter):
+    with StubComtradeServer(statuses=[404]) as server:
+        [df] = fetch_many(server, [{'period': '2022', 'reporterCode': '842'}], retry_delay=0)
+    assert is_stub_payload(df)
+    assert server.requests == 2
+
+
+def test_server_errors_fall_back_and_are_cached_as_negative(limiter):
+    query = {'period': '2022', 'reporterCode': '842', 'partnerCode': '156'}
+    with StubComtradeServer(statuses=[500] * 3) as server:
+        [df] = fetch_many(server, [query], retry_delay=0)
+        assert server.requests == 3
+        assert is_fallback(df)
+        # The fallback frame is cached, so the next lookup does not reach the server
+        [again] = fetch_many(server, [query], retry_delay=0)
+        assert server.requests == 3
+    assert again.equals(df)
+
+
+def test_exhausted_rate_budget_returns_fallback_without_a_request(monkeypatch, limiter):
+    limiter = RateLimiter([(1, 3600)])
+    limiter.acquire()
+    monkeypatch.setattr(comtradeapicall, '_rate_limiter', limiter)
+    monkeypatch.setattr(comtradeapicall, 'RATE_WAIT_TIMEOUT', 0.01)
+    with StubComtradeServer() as server:
+        [df] = fetch_many(server, [{'period': '2022', 'reporterCode': '842'}])
+    assert server.requests == 0
+    assert is_fallback(df)
@@ -0,0 +1,22 @@
+from conftest import StubComtradeServer
+import http_session
+
+
+def test_pooled_session_reuses_one_connection():
+    with StubComtradeServer() as server:
+        session = http_session.get_session()
+        for _ in range(100):
+            response = session.get(server.url, params={'ps': '2022'}, timeout=http_session.get_timeout())
+            assert response.status_code == 200
+            assert response.json()['dataset']
+        assert server.requests == 100
+        assert server.connections == 1
+
+
+def test_session_is_shared_within_a_process():
+    assert http_session.get_session() is http_session.get_session()
+
+
+def test_timeout_is_split_into_connect_and_read():
+    assert http_session.get_timeout() == (http_session.CONNECT_TIMEOUT, http_session.READ_TIMEOUT)
+    assert http_session.get_timeout(read=60) == (http_session.CONNECT_TIMEOUT, 60)
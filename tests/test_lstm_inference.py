@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from lstm_inference import export_lstm
+
+
+@pytest.mark.parametrize("time_steps", [1, 3])
+def test_export_matches_keras(time_steps):
+    tf = pytest.importorskip("tensorflow")
+    rng = np.random.default_rng(0)
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(time_steps, 1)),
+        tf.keras.layers.LSTM(16),
+        tf.keras.layers.Dense(1),
+    ])
+    # Trained weights rather than the initial ones, which leave the biases at zero
+    model.compile(optimizer='adam', loss='mse')
+    x = rng.random((64, time_steps, 1)).astype(np.float32)
+    model.fit(x, x.sum(axis=1), epochs=5, verbose=0)
+
+    exported = export_lstm(model)
+    expected = model.predict(x, verbose=0)
+    assert exported.predict(x).shape == expected.shape
+    assert np.allclose(exported.predict(x), expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+import comtradeapicall
+import ml_model
+
+
+def history(years=range(2010, 2022), partner=156, seed=0):
+    """COMTRADE-style history of one corridor, both flows"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for year in years:
+        for flow in ('M', 'X'):
+            rows.append({'refYear': year, 'flowCode': flow, 'partnerCode': partner,
+                         'primaryValue': 1e9 + 5e7 * (year - 2010) + rng.normal(0, 2e7)})
+    return pd.DataFrame(rows)
+
+
+def corridor(df, partner='156'):
+    return {'df': df, 'predict_year': 2023, 'partner_code': partner, 'flow_code': 'M'}
+
+
+@pytest.mark.parametrize("model_type", ['linear', 'xgboost'])
+def test_batch_reports_bad_corridors_individually(model_type):
+    if model_type == 'xgboost':
+        pytest.importorskip("xgboost")
+    fallback = comtradeapicall.get_fallback_data('842', '156', '2021', 'TOTAL', None)
+    results = ml_model.train_and_predict_batch(
+        [corridor(history()), corridor(None), corridor(fallback)], model_type=model_type)
+
+    assert 'error' not in results[0] and np.isfinite(results[0]['prediction'])
+    assert 'error' in results[1]
+    assert 'error' in results[2]
+    assert all(result['model_type'] == model_type for result in results)
+
+
+def test_linear_update_is_identical_to_a_retrain():
+    full = history(range(2010, 2022))
+    old = ml_model.get_features(full[full['refYear'] < 2021])
+    new = ml_model.get_features(full[full['refYear'] > 2010])
+    base = ml_model._train_linear(old, ml_model.MODEL_PARAMS['linear'])
+
+    updated = ml_model._update_linear(base, new, ml_model.MODEL_PARAMS['linear'], added=[2021], dropped=[2010])
+    retrained = ml_model._train_linear(new, ml_model.MODEL_PARAMS['linear'])
+    assert np.array_equal(updated['model'].coef_, retrained['model'].coef_)
+    assert updated['model'].intercept_ == retrained['model'].intercept_
+    assert updated['mse'] == retrained['mse']
+
+
+def test_batch_linear_fit_matches_single_fits():
+    feature_sets = [ml_model.get_features(history(partner=partner, seed=seed))
+                    for seed, partner in enumerate([156, 124, 484])]
+    # A shorter history pads the batch
+    feature_sets.append(ml_model.get_features(history(range(2015, 2022), seed=3)))
+    coef, intercept, mse = ml_model._fit_linear_batch(feature_sets)
+
+    for i, features in enumerate(feature_sets):
+        single = ml_model._train_linear(features, ml_model.MODEL_PARAMS['linear'])
+        scale = np.abs(features.y).max()
+        assert np.allclose(coef[i], single['model'].coef_, rtol=1e-6, atol=1e-9 * scale)
+        assert np.isclose(intercept[i], single['model'].intercept_, rtol=1e-6, atol=1e-9 * scale)
+        assert np.isclose(mse[i], single['mse'], rtol=1e-6)
@@ -0,0 +1,43 @@
+import os
+import time
+
+from model_registry import ModelRegistry
+
+
+def entry(size):
+    return {'format': 'joblib', 'model': b'x' * size}
+
+
+def test_save_evicts_least_recently_used_over_size_cap(tmp_path):
+    registry = ModelRegistry(str(tmp_path), max_models=2, max_bytes=3000)
+    for i in range(5):
+        registry.put(f"k{i}", entry(900))
+        time.sleep(0.01)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".joblib")) == \
+        ['k2.joblib', 'k3.joblib', 'k4.joblib']
+    assert registry.get('k0') is None
+
+
+def test_save_drops_old_entries_and_their_lineages(tmp_path):
+    registry = ModelRegistry(str(tmp_path), max_age=100)
+    registry.put('old', entry(10))
+    registry.set_latest('corridor', {'key': 'old', 'last_year': 2020})
+    past = time.time() - 1000
+    os.utime(tmp_path / "old.joblib", (past, past))
+    os.utime(tmp_path / "lineage" / "corridor.json", (past, past))
+
+    registry.put('new', entry(10))
+    assert not (tmp_path / "old.joblib").exists()
+    assert registry.latest('corridor') is None
+    assert registry.get('new') is not None
+
+
+def test_counters(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    registry.get('missing')
+    registry.get_or_train('k', lambda: entry(10))
+    registry.get('k')
+    registry.clear()
+    registry.get('k')
+    stats = registry.stats()
+    assert (stats['misses'], stats['trainings'], stats['memory_hits'], stats['disk_hits']) == (2, 1, 1, 1)
@@ -0,0 +1,31 @@
+import os
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+import comtradeapicall
+import prewarm
+
+app = pytest.importorskip("app")
+
+
+def test_prewarmed_trade_key_matches_ui_lookup(monkeypatch):
+    calls = []
+
+    def preview(**kwargs):
+        calls.append(kwargs)
+        return pd.DataFrame({'primaryValue': [1.0]})
+
+    monkeypatch.setattr(comtradeapicall, 'previewFinalData', preview)
+    # The payload main.js sends for a bilateral lookup
+    payload = {'reporterCode': '842', 'partnerCode': '156', 'period': '2022', 'cmdCode': 'TOTAL', 'flowCode': ''}
+    assert app.app.test_client().post('/api/trade', json=payload).status_code == 200
+
+    [task] = [t for t in prewarm.build_tasks([2022], ['842', '156'], ['TOTAL'], profiles=['trade'])
+              if t['reporterCode'] == '842']
+    task.pop('profile')
+    assert comtradeapicall._cache_key_for(task, prewarm.QUERY_PROFILES['trade']) == \
+        comtradeapicall.make_cache_key(**calls[0])
@@ -0,0 +1,35 @@
+import threading
+import time
+
+import pandas as pd
+
+from trade_cache import SharedCache
+
+
+def test_lease_is_renewed_while_computing(tmp_path):
+    path = str(tmp_path / "shared.sqlite")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(1.0)
+        return pd.DataFrame({'primaryValue': [1.0]}), True
+
+    # One cache per worker; each owns its leases like a separate process would
+    caches = [SharedCache(path, lease_timeout=0.3, poll_interval=0.05) for _ in range(3)]
+    results = []
+    threads = [threading.Thread(target=lambda c=c: results.append(c.get_or_compute(('k',), compute))) for c in caches]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [ok for _, ok in results] == [True] * 3
+
+
+def test_lease_is_released_after_compute(tmp_path):
+    cache = SharedCache(str(tmp_path / "shared.sqlite"), lease_timeout=0.3)
+    cache.get_or_compute(('k',), lambda: (pd.DataFrame({'a': [1]}), True))
+    assert cache._conn().execute("SELECT COUNT(*) FROM leases").fetchone()[0] == 0
@@ -0,0 +1,65 @@
+import json
+
+import pandas as pd
+import pytest
+
+import trade_decode
+
+
+def records(n):
+    return [{'refYear': 2010 + i % 5, 'flowCode': 'X' if i % 2 else 'M', 'partnerCode': 156,
+             'cmdDesc': f'Commodity {i}', 'qty': None if i % 3 == 0 else i / 2, 'primaryValue': float(i)}
+            for i in range(n)]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(trade_decode, 'orjson', None)
+    # Tiny slices so every payload is split at many record boundaries
+    monkeypatch.setattr(trade_decode, 'SLICE_BYTES', 64)
+    return request.param
+
+
+def check(document, separators=(',', ':'), sliced=None):
+    payload = json.dumps(document, separators=separators).encode("utf-8")
+    if sliced is not None:
+        assert (trade_decode._decode_sliced(payload) is not None) == sliced
+    decoded = trade_decode.decode_payload(payload)
+    expected = dict(document)
+    if isinstance(document.get('dataset'), list):
+        frame = decoded.pop('dataset')
+        rows = expected.pop('dataset')
+        pd.testing.assert_frame_equal(frame, pd.DataFrame(rows) if rows else pd.DataFrame())
+    assert decoded == expected
+
+
+@pytest.mark.parametrize("separators", [(',', ':'), (', ', ': ')])
+def test_records_decode_like_json_loads(backend, separators):
+    check({'elapsedTime': '1s', 'count': 50, 'dataset': records(50),
+           'validation': {'valid': [{'type': 'reporter', 'id': 842, 'text': 'USA'}, {'type': 'partner'}]}},
+          separators, sliced=True)
+
+
+@pytest.mark.parametrize("dataset", [
+    [{'cmdDesc': 'tricky },{ "quoted" }] text', 'primaryValue': 1.0}] * 20,
+    [{'a': 1, 'nested': [{'x': 1}, {'y': 2}]}] * 10,
+    [{'a': 1}, {'a': 2, 'b': 3}, {'b': 4}] * 10,
+    [],
+])
+def test_unusual_datasets_fall_back_correctly(backend, dataset):
+    check({'count': len(dataset), 'dataset': dataset, 'more': [{'a': 1}, {'a': 2}]})
+
+
+def test_documents_without_dataset(backend):
+    assert trade_decode.decode_payload(b'{"error": "x", "items": [{"a": 1}, {"a": 2}]}') == \
+        {'error': 'x', 'items': [{'a': 1}, {'a': 2}]}
+    assert trade_decode.decode_payload('[]') == []
+
+
+def test_frame_from_records_leaves_input_alone():
+    rows = records(3)
+    trade_decode.frame_from_records(rows)
+    assert len(rows) == 3
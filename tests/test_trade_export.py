@@ -0,0 +1,21 @@
+import pandas as pd
+
+import trade_export
+
+
+def test_csv_header_is_fixed_across_frames():
+    frames = [
+        pd.DataFrame({'refYear': [2021], 'primaryValue': [1.0]}),
+        pd.DataFrame({'refYear': [2022], 'primaryValue': [2.0], 'reporterDesc': ['USA'], 'fallback': [True]}),
+    ]
+    lines = ''.join(trade_export.iter_csv(frames)).splitlines()
+    assert lines[0].split(',') == trade_export.EXPORT_COLUMNS
+    rows = [dict(zip(trade_export.EXPORT_COLUMNS, line.split(','))) for line in lines[1:]]
+    assert [row['refYear'] for row in rows] == ['2021', '2022']
+    assert [row['reporterDesc'] for row in rows] == ['', 'USA']
+    assert 'fallback' not in lines[0]
+
+
+def test_csv_without_frames_still_has_header():
+    lines = ''.join(trade_export.iter_csv([pd.DataFrame({'message': ['error']})])).splitlines()
+    assert lines == [','.join(trade_export.EXPORT_COLUMNS)]
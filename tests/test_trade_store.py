@@ -0,0 +1,47 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from trade_store import TradeStore
+
+THIS_YEAR = time.localtime().tm_year
+
+
+def test_opening_does_not_create_the_directory(tmp_path):
+    root = tmp_path / "store"
+    store = TradeStore(str(root))
+    assert not root.exists()
+    assert ('k',) not in store
+    store.put(('k',), pd.DataFrame({'a': [1]}), period='2010')
+    assert root.exists()
+
+
+def test_final_periods(tmp_path):
+    store = TradeStore(str(tmp_path), final_lag=2)
+    assert store.is_final(str(THIS_YEAR - 2))
+    assert store.is_final(f"{THIS_YEAR - 3}01")
+    assert not store.is_final(str(THIS_YEAR - 1))
+    assert not store.is_final(f"{THIS_YEAR - 5},{THIS_YEAR}")
+    assert not store.is_final(None)
+
+
+def test_provisional_periods_expire(tmp_path):
+    store = TradeStore(str(tmp_path), provisional_ttl=0.2)
+    df = pd.DataFrame({'primaryValue': [1.0]})
+    store.put(('final',), df, period=str(THIS_YEAR - 5))
+    store.put(('provisional',), df, period=str(THIS_YEAR))
+    assert ('provisional',) in store
+
+    time.sleep(0.3)
+    assert store.get(('provisional',)) is None
+    assert ('provisional',) not in store
+    assert store.get(('final',)) is not None
+    assert [r['period'] for r in store.records()] == [str(THIS_YEAR - 5)]
+
+    # A rewrite by another process is picked up
+    TradeStore(str(tmp_path), provisional_ttl=0.2).put(('provisional',), df, period=str(THIS_YEAR))
+    assert store.get(('provisional',)) is not None
@@ -0,0 +1,30 @@
+import os
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+pytest.importorskip("pyarrow")
+
+import comtradeapicall
+import trade_sync
+from trade_store import TradeStore
+
+
+@pytest.mark.parametrize("partners, refreshed", [(None, False), (['156'], True)])
+def test_models_are_refreshed_only_for_partner_syncs(tmp_path, monkeypatch, partners, refreshed):
+    monkeypatch.setattr(comtradeapicall, '_store', TradeStore(str(tmp_path)))
+    monkeypatch.setattr(comtradeapicall, 'refreshFinalData',
+                        lambda **query: (pd.DataFrame({'primaryValue': [1.0]}), True))
+    calls = []
+    fake_ml_model = types.SimpleNamespace(refresh_models=lambda reporter: calls.append(reporter) or {})
+    monkeypatch.setitem(sys.modules, 'ml_model', fake_ml_model)
+
+    summary = trade_sync.sync_reporter('842', partners, start='2020', end='2021')
+    assert summary['fetched'] == ['2020', '2021']
+    assert ('models' in summary) == refreshed
+    assert calls == (['842'] if refreshed else [])
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("COMTRADE_STORE_DIR", "")
+os.environ.setdefault("ML_MODEL_DIR", "")
+
+import training_executor
+
+
+def history():
+    rows = [{'refYear': year, 'flowCode': 'M', 'partnerCode': 156, 'primaryValue': 1e9 + 5e7 * (year - 2010)}
+            for year in range(2010, 2022)]
+    return pd.DataFrame(rows)
+
+
+def test_jobs_are_visible_to_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setenv("ML_MODEL_DIR", str(tmp_path))
+    # Two executors sharing a job table stand in for two gunicorn workers
+    submitter = training_executor.TrainingExecutor(max_workers=1, start_method='fork')
+    poller = training_executor.TrainingExecutor(max_workers=1, start_method='fork')
+    try:
+        job_id = submitter.submit(history(), 2023, '156', 'M', 'linear', meta={'prediction_year': 2023})
+        state = poller.result(job_id)
+        assert state['status'] in ('pending', 'done')
+        assert state['meta'] == {'prediction_year': 2023}
+
+        expected = submitter.result(job_id, wait=60)
+        assert expected['status'] == 'done'
+        state = poller.result(job_id, wait=10)
+        assert state['status'] == 'done'
+        assert np.isclose(state['result']['prediction'], expected['result']['prediction'])
+        assert poller.result('missing')['status'] == 'unknown'
+    finally:
+        for executor in (submitter, poller):
+            if executor._pool is not None:
+                executor._pool.shutdown()
+
+
+def test_lost_jobs_are_reported_failed(tmp_path, monkeypatch):
+    monkeypatch.setenv("ML_MODEL_DIR", str(tmp_path))
+    executor = training_executor.TrainingExecutor(max_workers=1, timeout=1)
+    executor._store.add('orphan', {}, submitted_at=0)
+    assert executor.result('orphan')['status'] == 'failed'
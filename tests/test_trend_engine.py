@@ -0,0 +1,30 @@
+import numpy as np
+
+import trend_engine
+
+
+def test_fit_trends_matches_per_series_least_squares():
+    rng = np.random.default_rng(0)
+    years = np.arange(2012, 2022)
+    values = 1e9 + rng.normal(0, 1e8, (50, len(years))) + rng.normal(0, 5e7, (50, 1)) * (years - 2012)
+    # Gaps, a single observation and an empty series
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[1, 1:] = np.nan
+    values[2] = np.nan
+    fit = trend_engine.fit_trends(values, years, forecast_year=2023)
+
+    for i, row in enumerate(values):
+        observed = ~np.isnan(row)
+        n = observed.sum()
+        assert fit['n_obs'][i] == n
+        if n == 0:
+            assert np.isnan(fit['slope'][i]) and np.isnan(fit['forecast'][i])
+            continue
+        if n == 1:
+            assert fit['slope'][i] == 0.0 and np.isclose(fit['forecast'][i], row[observed][0])
+            continue
+        slope, intercept = np.polyfit(years[observed], row[observed], 1)
+        residuals = row[observed] - (intercept + slope * years[observed])
+        assert np.isclose(fit['slope'][i], slope, rtol=1e-6)
+        assert np.isclose(fit['forecast'][i], intercept + slope * 2023, rtol=1e-6)
+        assert np.isclose(fit['mse'][i], np.mean(residuals ** 2), rtol=1e-5)
@@ -0,0 +1,362 @@
+"""
+Caches for COMTRADE query results
+TradeCache is a per-process LRU bounded by the memory footprint of the cached DataFrames;
+SharedCache is an SQLite (WAL mode) cache shared by every worker on the host
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def key_digest(key: Any) -> str:
+    """Return a stable hex digest for a cache key"""
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+def dataframe_nbytes(df: pd.DataFrame) -> int:
+    """Return the deep memory usage of a DataFrame in bytes"""
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+class TradeCache:
+    """
+    Thread-safe LRU cache of DataFrames with a byte budget and per-entry expiry
+
+    Successful lookups are stored with `ttl`, failed lookups (fallback or error
+    frames) with the shorter `negative_ttl` so a flapping endpoint is not hammered
+    but recovers quickly.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 24 * 3600, negative_ttl: float = 300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires_at, negative)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+        """Return the cached DataFrame for key, or None if missing or expired"""
+        found = self.lookup(key)
+        return None if found is None else found[0]
+
+    def lookup(self, key: Hashable) -> Optional[Tuple[pd.DataFrame, bool]]:
+        """Return (DataFrame, negative) for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, nbytes, expires_at, negative = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value, negative
+
+    def set(self, key: Hashable, value: pd.DataFrame, negative: bool = False, ttl: Optional[float] = None) -> None:
+        """Store a DataFrame, evicting least recently used entries to stay within max_bytes"""
+        nbytes = dataframe_nbytes(value)
+        if ttl is None:
+            ttl = self.negative_ttl if negative else self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if nbytes > self.max_bytes:
+                # Never let a single oversized frame flush the whole cache
+                return
+            self._entries[key] = (value, nbytes, time.monotonic() + ttl, negative)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[2] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'negative_entries': sum(1 for e in self._entries.values() if e[3]),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, nbytes, _, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key within one process
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight block and receive the same result (or exception) instead of
+    issuing their own upstream request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn for key unless an identical call is already in flight, and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how many calls ran and how many were served by an in-flight call"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+            }
+
+
+class _Call:
+    """State of one in-flight SingleFlight call"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SharedCache:
+    """
+    Cross-process cache backed by a local SQLite database in WAL mode
+
+    All gunicorn workers on a host open the same file, so a result fetched by one
+    worker is visible to the others. get_or_compute also coalesces misses across
+    processes: the first worker to miss takes a lease on the key and fetches, the
+    others poll until the result appears or the lease expires. The holder renews
+    the lease while it computes, so a fetch queued behind the rate limiter for
+    longer than lease_timeout keeps it; only a crashed holder's lease lapses.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, negative_ttl: float = 300,
+                 lease_timeout: float = 60, poll_interval: float = 0.1):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.coalesced = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, payload BLOB, negative INTEGER, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: Hashable) -> Optional[Tuple[pd.DataFrame, bool]]:
+        """Return (DataFrame, negative) for key, or None if missing or expired"""
+        row = self._conn().execute(
+            "SELECT payload, negative FROM entries WHERE key = ? AND expires_at > ?",
+            (key_digest(key), time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[0]), bool(row[1])
+
+    def set(self, key: Hashable, value: pd.DataFrame, negative: bool = False) -> None:
+        """Store a DataFrame for all workers"""
+        ttl = self.negative_ttl if negative else self.ttl
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, payload, negative, expires_at) VALUES (?, ?, ?, ?)",
+            (key_digest(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), int(negative), time.time() + ttl)
+        )
+        # Opportunistic cleanup keeps the file from growing without bound
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Tuple[pd.DataFrame, bool]]) -> Tuple[pd.DataFrame, bool]:
+        """
+        Return the shared result for key, computing it in at most one process
+
+        Args:
+            key: Cache key
+            compute: Callable returning (DataFrame, ok); only called by the lease holder
+
+        Returns:
+            Tuple of (DataFrame, ok)
+        """
+        digest = key_digest(key)
+        waited = False
+        while True:
+            found = self.get(key)
+            if found is not None:
+                if waited:
+                    self.coalesced += 1
+                df, negative = found
+                return df, not negative
+            if self._acquire(digest):
+                done = threading.Event()
+                keeper = threading.Thread(target=self._keep_lease, args=(digest, done), daemon=True)
+                keeper.start()
+                try:
+                    self.fetches += 1
+                    df, ok = compute()
+                    try:
+                        self.set(key, df, negative=not ok)
+                    except sqlite3.Error as e:
+                        logger.warning(f"Could not write shared cache entry: {str(e)}")
+                    return df, ok
+                finally:
+                    done.set()
+                    keeper.join()
+                    self._release(digest)
+            # Another worker is fetching this key; wait for its result or its lease to lapse
+            waited = True
+            time.sleep(self.poll_interval)
+
+    def _acquire(self, digest: str) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (digest, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+            (digest, self._owner, now + self.lease_timeout)
+        )
+        return cursor.rowcount == 1
+
+    def _keep_lease(self, digest: str, done: threading.Event) -> None:
+        """Extend our lease on digest every third of lease_timeout until done is set"""
+        conn = self._conn()
+        try:
+            while not done.wait(self.lease_timeout / 3):
+                try:
+                    conn.execute(
+                        "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?",
+                        (time.time() + self.lease_timeout, digest, self._owner)
+                    )
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not renew shared cache lease: {str(e)}")
+        finally:
+            conn.close()
+            self._local.conn = None
+
+    def _release(self, digest: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (digest, self._owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not release shared cache lease: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count and hit/miss/coalescing counters"""
+        entries = self._conn().execute("SELECT COUNT(*) FROM entries WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {
+            'path': self.path,
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'fetches': self.fetches,
+            'coalesced': self.coalesced,
+        }
+
+
+def open_shared_cache() -> Optional[SharedCache]:
+    """
+    Open the shared cache configured by COMTRADE_SHARED_CACHE (a SQLite file path)
+
+    Returns None when the variable is unset or the database cannot be opened.
+    """
+    path = os.environ.get("COMTRADE_SHARED_CACHE")
+    if not path:
+        return None
+    try:
+        return SharedCache(
+            path,
+            ttl=float(os.environ.get("COMTRADE_CACHE_TTL", str(24 * 3600))),
+            negative_ttl=float(os.environ.get("COMTRADE_CACHE_NEGATIVE_TTL", "300"))
+        )
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not open shared cache at {path}: {str(e)}")
+        return None
@@ -0,0 +1,121 @@
+"""
+Decoding of COMTRADE JSON payloads
+The 'dataset' array is parsed a slice of records at a time, with orjson when it is
+installed, and each slice is appended to per-column lists before its row dicts
+are dropped. Only one slice of dicts is alive at a time, so the peak memory of
+turning a large response into a DataFrame stays well below json.loads +
+pd.DataFrame (and orjson's larger dicts), while orjson makes it faster as well.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# COMTRADE_JSON_BACKEND=json forces the standard library parser
+if os.environ.get("COMTRADE_JSON_BACKEND", "auto") == "json":
+    orjson = None
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Bytes of records parsed per slice
+SLICE_BYTES = 1 << 20
+
+_DATASET_START = re.compile(rb'"dataset"\s*:\s*\[\s*')
+_RECORD_SEPARATOR = re.compile(rb'\}\s*,\s*\{')
+_DATASET_END = re.compile(rb'\}\s*\]')
+
+
+def loads(payload: Union[bytes, str]) -> Any:
+    """Decode a JSON document with the fastest available parser"""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _decode_sliced(payload: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Decode a document whose 'dataset' is an array of flat records with the same keys
+
+    A slice boundary that falls inside a string or a nested value leaves an
+    unbalanced slice that fails to parse, so any payload outside that shape
+    returns None rather than a wrong frame.
+    """
+    start = _DATASET_START.search(payload)
+    if start is None or payload[start.end():start.end() + 1] == b']':
+        return None
+    pos = start.end()
+    # Records are flat, so the first '}]' closes the array (or a slice fails to parse)
+    end = _DATASET_END.search(payload, pos)
+    if end is None or end.start() - pos <= SLICE_BYTES:
+        # One slice or less: decoding the whole document at once is quicker
+        return None
+    keys, columns = None, None
+    while pos < end.start():
+        separator = _RECORD_SEPARATOR.search(payload, pos + SLICE_BYTES, end.start())
+        stop = separator.start() if separator is not None else end.start()
+        try:
+            rows = loads(b'[' + payload[pos:stop + 1] + b']')
+        except ValueError:
+            return None
+        if keys is None:
+            if not isinstance(rows[0], dict):
+                return None
+            keys = list(rows[0])
+            columns = [[] for _ in keys]
+        try:
+            if any(len(row) != len(keys) for row in rows):
+                return None
+            for key, column in zip(keys, columns):
+                column.extend([row[key] for row in rows])
+        except (KeyError, TypeError):
+            return None
+        del rows
+        pos = separator.end() - 1 if separator is not None else end.end()
+
+    # The rest of the document, with the dataset left out
+    try:
+        document = loads(payload[:start.start()] + b'"dataset":null' + payload[end.end():])
+    except ValueError:
+        return None
+    if not isinstance(document, dict) or document.get('dataset', False) is not None:
+        return None
+    data = {}
+    for i, key in enumerate(keys):
+        data[key] = pd.Series(columns[i], copy=False)
+        columns[i] = None
+    document['dataset'] = pd.DataFrame(data, copy=False)
+    return document
+
+
+def decode_payload(payload: Union[bytes, str]) -> Any:
+    """
+    Decode a COMTRADE response body
+
+    Returns:
+        The decoded document; a 'dataset' list of records is returned as a DataFrame
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    document = _decode_sliced(payload)
+    if document is not None:
+        return document
+    document = loads(payload)
+    if isinstance(document, dict) and isinstance(document.get('dataset'), list):
+        # The document is ours, so its record list is released once the frame exists
+        document['dataset'] = frame_from_records(document['dataset'])
+    return document
+
+
+def frame_from_records(rows: Union[List[Dict[str, Any]], pd.DataFrame]) -> pd.DataFrame:
+    """Build a DataFrame from a list of record dicts (frames are returned as they are)"""
+    if isinstance(rows, pd.DataFrame):
+        return rows
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows)
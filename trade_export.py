@@ -0,0 +1,88 @@
+"""
+Streaming serialization of trade DataFrames
+Generators that turn one or more DataFrames into CSV or NDJSON text in fixed-size
+row chunks, so Flask can stream large downloads without building them in memory
+"""
+import io
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Rows serialized per yielded chunk
+CHUNK_ROWS = 5000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Fields of a COMTRADE v1 data record, in API order; every CSV export has this header
+EXPORT_COLUMNS = [
+    'typeCode', 'freqCode', 'refPeriodId', 'refYear', 'refMonth', 'period',
+    'reporterCode', 'reporterISO', 'reporterDesc', 'flowCode', 'flowDesc',
+    'partnerCode', 'partnerISO', 'partnerDesc', 'partner2Code', 'partner2ISO', 'partner2Desc',
+    'classificationCode', 'classificationSearchCode', 'isOriginalClassification',
+    'cmdCode', 'cmdDesc', 'aggrLevel', 'isLeaf', 'customsCode', 'customsDesc',
+    'mosCode', 'motCode', 'motDesc', 'qtyUnitCode', 'qtyUnitAbbr', 'qty', 'isQtyEstimated',
+    'altQtyUnitCode', 'altQtyUnitAbbr', 'altQty', 'isAltQtyEstimated',
+    'netWgt', 'isNetWgtEstimated', 'grossWgt', 'isGrossWgtEstimated',
+    'cifvalue', 'fobvalue', 'primaryValue', 'legacyEstimationFlag', 'isReported', 'isAggregate',
+]
+
+
+def _is_error_frame(df: pd.DataFrame) -> bool:
+    """Empty results and frames carrying only an error message are not exported"""
+    return df.empty or list(df.columns) == ['message']
+
+
+def _clean(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Turn +/-inf into missing values, which both formats write as empty/null"""
+    numeric = chunk.select_dtypes(include=[np.number]).columns
+    if len(numeric) and chunk[numeric].isin([np.inf, -np.inf]).to_numpy().any():
+        chunk = chunk.copy()
+        chunk[numeric] = chunk[numeric].replace([np.inf, -np.inf], np.nan)
+    return chunk
+
+
+def iter_csv(frames: Iterable[pd.DataFrame], chunk_rows: int = CHUNK_ROWS,
+             columns: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Yield CSV text for a sequence of DataFrames
+
+    The header is `columns` (EXPORT_COLUMNS by default) and is written before any
+    frame is read, so every frame is aligned to the same schema: missing fields
+    are left empty and fields outside the schema are dropped.
+    """
+    columns = list(EXPORT_COLUMNS if columns is None else columns)
+    buffer = io.StringIO()
+    pd.DataFrame(columns=columns).to_csv(buffer, index=False)
+    yield buffer.getvalue()
+    for df in frames:
+        if _is_error_frame(df):
+            continue
+        if list(df.columns) != columns:
+            df = df.reindex(columns=columns)
+        for start in range(0, len(df), chunk_rows):
+            buffer = io.StringIO()
+            _clean(df.iloc[start:start + chunk_rows]).to_csv(buffer, header=False, index=False)
+            yield buffer.getvalue()
+
+
+def iter_ndjson(frames: Iterable[pd.DataFrame], chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """Yield newline-delimited JSON records for a sequence of DataFrames"""
+    for df in frames:
+        if _is_error_frame(df):
+            continue
+        for start in range(0, len(df), chunk_rows):
+            text = _clean(df.iloc[start:start + chunk_rows]).to_json(orient='records', lines=True, date_format='iso')
+            yield text if text.endswith('\n') else text + '\n'
+
+
+def iter_export(frames: Iterable[pd.DataFrame], format_type: str = 'csv', chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """Yield the export of frames in the given format ('csv' or 'ndjson')"""
+    if format_type == 'csv':
+        return iter_csv(frames, chunk_rows=chunk_rows)
+    if format_type == 'ndjson':
+        return iter_ndjson(frames, chunk_rows=chunk_rows)
+    raise ValueError(f"Unknown export format: {format_type}")
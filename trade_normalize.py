@@ -0,0 +1,72 @@
+"""
+Ingest-time normalization of COMTRADE DataFrames
+Applied once when a response enters the cache so every later request works on
+compact, clean columns instead of re-cleaning object columns per request
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Low-cardinality code and label columns stored as categoricals
+CATEGORICAL_COLUMNS = [
+    'typeCode', 'freqCode', 'classificationCode', 'classificationSearchCode',
+    'reporterCode', 'reporterISO', 'reporterDesc', 'rtCode', 'rtTitle',
+    'partnerCode', 'partnerISO', 'partnerDesc', 'ptCode', 'ptTitle',
+    'partner2Code', 'partner2ISO', 'partner2Desc',
+    'flowCode', 'flowDesc', 'rgCode', 'rgDesc',
+    'cmdCode', 'cmdDesc', 'aggrLevel', 'customsCode', 'customsDesc',
+    'motCode', 'motDesc', 'qtyUnitCode', 'qtyUnitAbbr', 'altQtyUnitCode', 'altQtyUnitAbbr',
+]
+
+# Integer columns (years and periods) stored as nullable Int64
+INTEGER_COLUMNS = ['refYear', 'refMonth', 'period', 'yr']
+
+# Measured values stored as nullable Float64 so missing values carry an explicit mask
+VALUE_COLUMNS = [
+    'primaryValue', 'cifvalue', 'fobvalue', 'TradeValue',
+    'netWgt', 'NetWeight', 'grossWgt', 'qty', 'Quantity', 'altQty',
+]
+
+
+def normalize_trade_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a freshly decoded COMTRADE DataFrame to compact, clean dtypes
+
+    Code columns become categoricals, integer-like columns Int64 and value
+    columns Float64; +/-inf and NaN become <NA>. Columns not listed above are
+    left untouched, and a column whose values cannot be converted keeps its dtype.
+
+    Returns:
+        A new DataFrame (the input is not modified)
+    """
+    if df.empty:
+        return df
+    out = {}
+    for name in df.columns:
+        column = df[name]
+        try:
+            if name in VALUE_COLUMNS:
+                values = pd.to_numeric(column, errors='coerce').astype('float64')
+                values[np.isinf(values.to_numpy())] = np.nan
+                column = values.astype('Float64')
+            elif name in INTEGER_COLUMNS:
+                values = pd.to_numeric(column, errors='coerce')
+                if values.notna().sum() == column.notna().sum():
+                    column = values.astype('Int64')
+            elif name in CATEGORICAL_COLUMNS and not isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.astype('category')
+        except (TypeError, ValueError):
+            pass
+        out[name] = column
+    return pd.DataFrame(out, index=df.index)
+
+
+def json_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Return rows as JSON-serializable dicts, with missing values as None"""
+    records = df.to_dict(orient='records')
+    for record in records:
+        for name, value in record.items():
+            if value is pd.NA or (isinstance(value, float) and value != value):
+                record[name] = None
+    return records
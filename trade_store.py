@@ -0,0 +1,317 @@
+"""
+Persistent on-disk store for COMTRADE query results
+Results are written as Arrow IPC files partitioned by classification/reporter/period
+and located through an append-only manifest, so lookups never list directories.
+Periods recent enough to still be revised upstream expire; final years are kept.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from trade_cache import key_digest
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+WATERMARKS_NAME = "watermarks.json"
+
+# Years at least this far behind the current one are treated as final
+FINAL_LAG_YEARS = 2
+# Seconds a result for a provisional (non-final) period stays valid
+PROVISIONAL_TTL = 7 * 24 * 3600
+
+
+def _partition_value(value: Any) -> str:
+    """Make a parameter value safe to use as a directory name"""
+    text = "all" if value in (None, "") else str(value)
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in text)
+
+
+class TradeStore:
+    """
+    Columnar store of query results shared by every process using the same directory
+
+    Each entry is an uncompressed Arrow IPC (Feather v2) file, read back with
+    memory mapping so concurrent workers share the same OS pages. The manifest is a
+    JSON-lines file that is only ever appended to; each process keeps an in-memory
+    index of it and reads only the lines added since its last refresh.
+
+    Entries whose period may still be revised (any year later than final_lag
+    years before the current one, or no period at all) are served for
+    provisional_ttl seconds after they were written; older years never expire.
+    The directory is created by the first write.
+    """
+
+    def __init__(self, root: str, final_lag: int = FINAL_LAG_YEARS, provisional_ttl: float = PROVISIONAL_TTL):
+        self.root = root
+        self.final_lag = final_lag
+        self.provisional_ttl = provisional_ttl
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.watermarks = WatermarkIndex(os.path.join(root, WATERMARKS_NAME))
+        self._index = {}  # digest -> manifest record
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.expired = 0
+        self._refresh()
+
+    def is_final(self, period: Any) -> bool:
+        """Return whether every year in a period ('2019', '202203', '2019,2020') is final"""
+        years = [p.strip()[:4] for p in str(period or "").split(",")]
+        if not years or not all(y.isdigit() for y in years):
+            return False
+        return max(int(y) for y in years) <= time.localtime().tm_year - self.final_lag
+
+    def _lookup(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Return the live manifest record for digest (caller holds the lock)"""
+        record = self._index.get(digest)
+        if record is None or not self._live(record):
+            # Another worker may have written or rewritten it since our last look
+            self._refresh()
+            record = self._index.get(digest)
+        if record is not None and not self._live(record):
+            self.expired += 1
+            return None
+        return record
+
+    def _live(self, record: Dict[str, Any]) -> bool:
+        return self.is_final(record.get('period')) or \
+            time.time() - record.get('written_at', 0) < self.provisional_ttl
+
+    def get(self, key: Any) -> Optional[pd.DataFrame]:
+        """Return the stored DataFrame for key, or None if it is missing or expired"""
+        digest = key_digest(key)
+        with self._lock:
+            record = self._lookup(digest)
+        if record is None:
+            self.misses += 1
+            return None
+        path = os.path.join(self.root, record['path'])
+        try:
+            df = feather.read_feather(path, memory_map=True)
+        except Exception as e:
+            logger.warning(f"Could not read stored result {path}: {str(e)}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return df
+
+    def read(self, record: Dict[str, Any], columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        Read the file of a manifest record (see records), optionally only some columns
+
+        Columns missing from the file are skipped rather than raising.
+        """
+        path = os.path.join(self.root, record['path'])
+        try:
+            if columns is not None:
+                available = set(feather.read_table(path, memory_map=True).column_names)
+                columns = [c for c in columns if c in available]
+            return feather.read_feather(path, columns=columns, memory_map=True)
+        except Exception as e:
+            logger.warning(f"Could not read stored result {path}: {str(e)}")
+            return None
+
+    def put(self, key: Any, df: pd.DataFrame, clCode=None, reporterCode=None, period=None, **meta) -> bool:
+        """
+        Write a DataFrame through to disk and record it in the manifest
+
+        Returns:
+            True if the entry was written, False if it could not be serialized
+        """
+        digest = key_digest(key)
+        rel_dir = os.path.join(
+            f"cl={_partition_value(clCode)}",
+            f"reporter={_partition_value(reporterCode)}",
+            f"period={_partition_value(period)}"
+        )
+        rel_path = os.path.join(rel_dir, f"{digest}.arrow")
+        abs_path = os.path.join(self.root, rel_path)
+        tmp_path = f"{abs_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.join(self.root, rel_dir), exist_ok=True)
+            # Uncompressed so the file can be memory-mapped without decoding
+            feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+            os.replace(tmp_path, abs_path)
+        except Exception as e:
+            logger.warning(f"Could not store result for {rel_path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        record = {
+            'key': digest,
+            'path': rel_path,
+            'rows': int(len(df)),
+            'clCode': clCode,
+            'reporterCode': None if reporterCode is None else str(reporterCode),
+            'period': None if period is None else str(period),
+            'written_at': time.time(),
+        }
+        record.update(meta)
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            # A single small O_APPEND write is not interleaved with other writers
+            fd = os.open(self.manifest_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+            self._index[digest] = record
+        self.writes += 1
+        return True
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return self._lookup(key_digest(key)) is not None
+
+    def records(self):
+        """Return a snapshot of all live manifest records"""
+        with self._lock:
+            self._refresh()
+            return [record for record in self._index.values() if self._live(record)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return store size and hit/miss counters"""
+        with self._lock:
+            return {
+                'root': self.root,
+                'entries': len(self._index),
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'expired': self.expired,
+            }
+
+    def _refresh(self) -> None:
+        """Read manifest lines appended since the last refresh (caller holds the lock)"""
+        try:
+            with open(self.manifest_path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        # Ignore a trailing partial line still being written
+        end = chunk.rfind(b"\n") + 1
+        for raw in chunk[:end].splitlines():
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue
+            self._index[record['key']] = record
+        self._offset += end
+
+
+class WatermarkIndex:
+    """
+    Per-(reporter, classification, frequency) record of periods already synced
+
+    Stored as one JSON document next to the manifest and rewritten atomically.
+    Periods flagged as revised stay listed until they have been re-synced.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(reporterCode, clCode, freqCode) -> str:
+        return f"{reporterCode}|{clCode}|{freqCode}"
+
+    def get(self, reporterCode, clCode='HS', freqCode='A') -> Dict[str, Any]:
+        """Return {'periods': {period: synced_at}, 'revised': [...], 'latest': period or None}"""
+        with self._lock:
+            entry = self._load().get(self._key(reporterCode, clCode, freqCode), {})
+        periods = entry.get('periods', {})
+        return {
+            'periods': periods,
+            'revised': entry.get('revised', []),
+            'latest': max(periods, key=int) if periods else None,
+        }
+
+    def mark_synced(self, reporterCode, clCode, freqCode, periods) -> None:
+        """Record periods as fully synced and clear any revision flag on them"""
+        periods = [str(p) for p in periods]
+        if not periods:
+            return
+        now = time.time()
+        with self._lock:
+            data = self._load()
+            entry = data.setdefault(self._key(reporterCode, clCode, freqCode), {'periods': {}, 'revised': []})
+            for period in periods:
+                entry['periods'][period] = now
+            entry['revised'] = [p for p in entry.get('revised', []) if p not in periods]
+            self._save(data)
+
+    def mark_revised(self, reporterCode, clCode, freqCode, periods) -> None:
+        """Flag periods whose upstream data was revised so the next sync fetches them again"""
+        with self._lock:
+            data = self._load()
+            entry = data.setdefault(self._key(reporterCode, clCode, freqCode), {'periods': {}, 'revised': []})
+            revised = set(entry.get('revised', []))
+            revised.update(str(p) for p in periods)
+            entry['revised'] = sorted(revised, key=int)
+            self._save(data)
+
+    def all(self) -> Dict[str, Any]:
+        """Return the raw watermark document"""
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring unreadable watermark file {self.path}")
+            return {}
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def open_default_store() -> Optional[TradeStore]:
+    """
+    Open the store configured by COMTRADE_STORE_DIR
+
+    COMTRADE_STORE_FINAL_LAG (years, default 2) and COMTRADE_STORE_PROVISIONAL_TTL
+    (seconds, default 7 days) set when periods are final and how long others are kept.
+
+    Returns None when pyarrow is missing or the store is disabled (empty value).
+    """
+    root = os.environ.get("COMTRADE_STORE_DIR", os.path.join("data", "comtrade_store"))
+    if not root:
+        return None
+    if not ARROW_AVAILABLE:
+        logger.info("pyarrow is not installed; persistent COMTRADE store disabled")
+        return None
+    try:
+        return TradeStore(
+            root,
+            final_lag=int(os.environ.get("COMTRADE_STORE_FINAL_LAG", str(FINAL_LAG_YEARS))),
+            provisional_ttl=float(os.environ.get("COMTRADE_STORE_PROVISIONAL_TTL", str(PROVISIONAL_TTL)))
+        )
+    except OSError as e:
+        logger.warning(f"Could not open COMTRADE store at {root}: {str(e)}")
+        return None
@@ -0,0 +1,197 @@
+"""
+Incremental synchronisation of COMTRADE data into the local store
+Tracks per-(reporter, classification, frequency) watermarks so each run only fetches
+periods that are new, flagged as revised, or recent enough to still be provisional.
+
+Typical nightly job:
+
+    python trade_sync.py --reporters 842 156 276 --partners 156 842 --start 2013
+
+Without --partners each period is fetched once for all partners. Those results
+are stored under an all-partner key that the predictor never reads, so such a
+sync feeds trend_engine.score_store only and leaves cached models alone.
+"""
+import argparse
+import datetime
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+import comtradeapicall
+
+logger = logging.getLogger(__name__)
+
+
+def period_range(freqCode: str, start, end) -> List[str]:
+    """
+    List periods from start to end inclusive
+
+    Annual periods are years (YYYY); monthly periods are YYYYMM.
+    """
+    start, end = int(start), int(end)
+    if freqCode == 'M':
+        periods = []
+        year, month = divmod(start, 100)
+        while year * 100 + month <= end:
+            periods.append(f"{year}{month:02d}")
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+        return periods
+    return [str(year) for year in range(start, end + 1)]
+
+
+def _default_end(freqCode: str) -> str:
+    """Latest period that can plausibly be published: last year, or last month"""
+    today = datetime.date.today()
+    if freqCode == 'M':
+        year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+        return f"{year}{month:02d}"
+    return str(today.year - 1)
+
+
+def _shift_period(freqCode: str, period, offset: int) -> str:
+    """Move a period by offset years (annual) or months (monthly)"""
+    if freqCode == 'M':
+        year, month = divmod(int(period), 100)
+        index = year * 12 + (month - 1) + offset
+        return f"{index // 12}{index % 12 + 1:02d}"
+    return str(int(period) + offset)
+
+
+def plan_sync(reporterCode, clCode='HS', freqCode='A', start=None, end=None,
+              revised: Iterable[Any] = (), refresh_recent: int = 1) -> List[str]:
+    """
+    Work out which periods a sync must fetch for one reporter
+
+    Args:
+        reporterCode: Reporter country code
+        clCode: Classification
+        freqCode: Frequency (A or M)
+        start: First period of the window (default: ten periods before end)
+        end: Last period of the window (default: the latest publishable period)
+        revised: Extra periods to refetch because upstream revised them
+        refresh_recent: Number of most recent synced periods to refetch anyway,
+            since recent COMTRADE figures are provisional
+
+    Returns:
+        Sorted list of periods to fetch
+    """
+    store = comtradeapicall._store
+    if store is None:
+        raise RuntimeError("Incremental sync needs the persistent store (install pyarrow and set COMTRADE_STORE_DIR)")
+    end = str(end or _default_end(freqCode))
+    if not start:
+        start = _shift_period(freqCode, end, -9)
+    window = period_range(freqCode, start, end)
+
+    mark = store.watermarks.get(str(reporterCode), clCode, freqCode)
+    synced = set(mark['periods'])
+    needed = {p for p in window if p not in synced}
+    needed.update(str(p) for p in mark['revised'] if p in window)
+    needed.update(str(p) for p in revised)
+    if refresh_recent > 0:
+        recent = sorted((p for p in synced if p in window), key=int)[-refresh_recent:]
+        needed.update(recent)
+    return sorted(needed, key=int)
+
+
+def sync_reporter(
+    reporterCode,
+    partnerCodes: Optional[Iterable[Any]] = None,
+    cmdCodes: Iterable[Any] = ('TOTAL',),
+    clCode: str = 'HS',
+    freqCode: str = 'A',
+    start=None,
+    end=None,
+    revised: Iterable[Any] = (),
+    refresh_recent: int = 1,
+    update_models: bool = True,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Bring one reporter's data in the local store up to date
+
+    Each planned period is fetched for every partner/commodity combination
+    through refreshFinalData (rate limited, bypassing caches). A period's
+    watermark only advances if every combination succeeded, so failed periods
+    are retried on the next run. Queries use comtradeapicall.HISTORY_QUERY, the
+    parameters the predictor reads its histories with, so synced periods are
+    served to it from the store; extra keyword arguments override them.
+
+    With update_models, cached prediction models of the reporter's corridors
+    are then updated incrementally with the new periods (ml_model.refresh_models).
+    That needs explicit partnerCodes: an all-partner sync stores data the models'
+    per-partner histories never read, so it only feeds trend_engine.score_store
+    and the model update is skipped.
+
+    Returns:
+        Summary dict with the periods fetched and failed, the new watermark and,
+        if models were refreshed, their counts
+    """
+    store = comtradeapicall._store
+    partners = [str(p) for p in partnerCodes] if partnerCodes else [None]
+    cmds = [str(c) for c in cmdCodes]
+    planned = plan_sync(reporterCode, clCode, freqCode, start, end, revised, refresh_recent)
+
+    fetched, failed = [], []
+    for period in planned:
+        period_ok = True
+        for partner in partners:
+            for cmd in cmds:
+                query = dict(comtradeapicall.HISTORY_QUERY, freqCode=freqCode, clCode=clCode, **kwargs)
+                df, ok = comtradeapicall.refreshFinalData(
+                    period=period, reporterCode=str(reporterCode), partnerCode=partner, cmdCode=cmd, **query
+                )
+                if not ok:
+                    period_ok = False
+                    logger.warning(f"Sync failed for reporter={reporterCode} partner={partner} cmd={cmd} period={period}")
+        if period_ok:
+            store.watermarks.mark_synced(str(reporterCode), clCode, freqCode, [period])
+            fetched.append(period)
+        else:
+            failed.append(period)
+
+    mark = store.watermarks.get(str(reporterCode), clCode, freqCode)
+    summary = {
+        'reporterCode': str(reporterCode),
+        'fetched': fetched,
+        'failed': failed,
+        'requests': len(planned) * len(partners) * len(cmds),
+        'latest': mark['latest'],
+    }
+    # The models are trained on annual per-partner histories
+    if update_models and fetched and freqCode == 'A':
+        if not partnerCodes:
+            logger.info(f"Skipping model update for reporter={reporterCode}: all-partner data does not feed the models")
+            return summary
+        import ml_model
+        summary['models'] = ml_model.refresh_models(reporterCode)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync COMTRADE data into the local store")
+    parser.add_argument("--reporters", nargs="+", required=True, help="Reporter country codes")
+    parser.add_argument("--partners", nargs="*", default=None, help="Partner country codes (default: all partners, which feeds trend scoring "
+                             "but not the prediction models)")
+    parser.add_argument("--commodities", nargs="+", default=['TOTAL'], help="Commodity codes")
+    parser.add_argument("--classification", default='HS')
+    parser.add_argument("--freq", default='A', choices=['A', 'M'])
+    parser.add_argument("--start", default=None, help="First period (YYYY or YYYYMM)")
+    parser.add_argument("--end", default=None, help="Last period (YYYY or YYYYMM)")
+    parser.add_argument("--revised", nargs="*", default=[], help="Periods to refetch because they were revised")
+    parser.add_argument("--refresh-recent", type=int, default=1, help="Most recent synced periods to refetch")
+    parser.add_argument("--no-model-update", action="store_true", help="Do not update cached models with new periods")
+    args = parser.parse_args()
+
+    for reporter in args.reporters:
+        summary = sync_reporter(
+            reporter, args.partners, args.commodities, args.classification, args.freq,
+            args.start, args.end, args.revised, args.refresh_recent, update_models=not args.no_model_update
+        )
+        print(f"Reporter {reporter}: fetched {summary['fetched'] or 'nothing'}, "
+              f"failed {summary['failed'] or 'nothing'}, latest period {summary['latest']}")
+        if 'models' in summary:
+            models = summary['models']
+            print(f"  models: {models['updated']} updated, {models['retrained']} retrained, "
+                  f"{models['skipped']} without a new year, {models['failed']} failed")
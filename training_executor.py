@@ -0,0 +1,300 @@
+"""
+Process-pool executor for model training
+Slow fits (XGBoost, LSTM) run in separate worker processes so they neither hold
+the GIL of the web process nor, with async submission, a request thread for the
+whole fit. Jobs are tracked by id in a SQLite table next to the model registry,
+so clients can poll for the result through any web worker.
+The pool is off unless ML_TRAIN_WORKERS is set.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from model_registry import default_model_dir
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for offloaded training; 0 (default) trains in the request process
+TRAIN_WORKERS = int(os.environ.get("ML_TRAIN_WORKERS", "0"))
+TRAIN_TIMEOUT = float(os.environ.get("ML_TRAIN_TIMEOUT", "300"))
+# Finished jobs are kept this long for polling
+JOB_TTL = float(os.environ.get("ML_JOB_TTL", "600"))
+# TensorFlow is not fork-safe once imported, so workers are spawned by default
+START_METHOD = os.environ.get("ML_TRAIN_START_METHOD", "spawn")
+
+# Model types trained out of process; the linear model is cheaper than the hand-off
+OFFLOAD_MODEL_TYPES = {'xgboost', 'lstm'}
+
+
+class TrainingTimeout(Exception):
+    """Raised inside a worker when a job exceeds its time limit"""
+
+
+def _on_alarm(signum, frame):
+    raise TrainingTimeout()
+
+
+def _run_job(df: pd.DataFrame, predict_year, partner_code, flow_code, model_type: str, timeout: float) -> Dict[str, Any]:
+    """Train and predict in a worker process, aborting after timeout seconds"""
+    import ml_model
+
+    # Tasks run on the worker's main thread, so an interval timer can interrupt the fit
+    use_alarm = timeout > 0 and hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return ml_model.train_and_predict(df, predict_year, partner_code, flow_code, model_type=model_type)
+    except TrainingTimeout:
+        return {'error': f'Training timed out after {timeout:g} seconds', 'model_type': model_type}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class JobStore:
+    """
+    Job states shared by all web processes, in a local SQLite database in WAL mode
+
+    The process that submits a job records it and writes its outcome when the job
+    finishes, so a poll that lands on another gunicorn worker still finds it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT, meta BLOB, "
+            "submitted_at REAL, finished_at REAL, outcome BLOB)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, job_id: str, meta: Dict[str, Any], submitted_at: float) -> None:
+        """Record a newly submitted job as pending"""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, meta, submitted_at) VALUES (?, 'pending', ?, ?)",
+            (job_id, pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL), submitted_at)
+        )
+
+    def finish(self, job_id: str, status: str, outcome: Any, finished_at: float) -> None:
+        """Record a job's outcome: its result when done, the error message when failed"""
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, outcome = ? WHERE job_id = ?",
+            (status, finished_at, pickle.dumps(outcome, protocol=pickle.HIGHEST_PROTOCOL), job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the recorded job, or None if it is unknown or expired"""
+        row = self._conn().execute(
+            "SELECT status, meta, submitted_at, finished_at, outcome FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, meta, submitted_at, finished_at, outcome = row
+        return {
+            'status': status,
+            'meta': pickle.loads(meta),
+            'submitted_at': submitted_at,
+            'finished_at': finished_at,
+            'outcome': pickle.loads(outcome) if outcome is not None else None,
+        }
+
+    def expire(self, cutoff: float) -> None:
+        """Drop jobs that finished before cutoff"""
+        self._conn().execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+
+
+class TrainingExecutor:
+    """
+    Submit training jobs to a process pool and track them by job id
+
+    Workers hand their models to the web process through the model registry
+    directory, so without one (ML_MODEL_DIR empty) the pool is disabled and
+    training stays in process. Job states are kept in `job_path` (by default
+    jobs.sqlite in that directory), so any web process can report on any job.
+    """
+
+    def __init__(self, max_workers: int = TRAIN_WORKERS, timeout: float = TRAIN_TIMEOUT,
+                 job_ttl: float = JOB_TTL, start_method: str = START_METHOD,
+                 job_path: Optional[str] = None):
+        if max_workers > 0 and not default_model_dir():
+            logger.warning("ML_TRAIN_WORKERS needs a shared ML_MODEL_DIR; training in process instead")
+            max_workers = 0
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.job_ttl = job_ttl
+        self.start_method = start_method
+        self._pool = None
+        self._pid = None
+        self._jobs = {}  # job_id -> {'future', 'submitted_at', 'finished_at', 'meta'} of this process's jobs
+        self._store = None
+        if max_workers > 0:
+            self._store = JobStore(job_path or os.path.join(default_model_dir(), "jobs.sqlite"))
+        self._lock = threading.Lock()
+        self.submitted = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Create the pool on first use, in a forked child, or after a worker died"""
+        if self._pool is None or self._pid != os.getpid() or getattr(self._pool, '_broken', False):
+            context = multiprocessing.get_context(self.start_method)
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            self._pid = os.getpid()
+        return self._pool
+
+    def submit(self, df: pd.DataFrame, predict_year, partner_code, flow_code, model_type: str,
+               meta: Optional[Dict[str, Any]] = None) -> str:
+        """Queue a train-and-predict job and return its id"""
+        with self._lock:
+            self._expire()
+            future = self._get_pool().submit(
+                _run_job, df, predict_year, partner_code, flow_code, model_type, self.timeout
+            )
+            job_id = uuid.uuid4().hex
+            job = {'future': future, 'submitted_at': time.time(), 'finished_at': None, 'meta': meta or {}}
+            self._jobs[job_id] = job
+            self.submitted += 1
+        if self._store is not None:
+            self._store.add(job_id, job['meta'], job['submitted_at'])
+        future.add_done_callback(lambda _: self._finished(job_id, job))
+        return job_id
+
+    def _finished(self, job_id: str, job: Dict[str, Any]) -> None:
+        """Done callback: stamp the job and publish its outcome to the other processes"""
+        job['finished_at'] = time.time()
+        if self._store is None:
+            return
+        future = job['future']
+        error = future.exception() if not future.cancelled() else 'Job was cancelled'
+        try:
+            if error is not None:
+                self._store.finish(job_id, 'failed', str(error), job['finished_at'])
+            else:
+                self._store.finish(job_id, 'done', future.result(), job['finished_at'])
+        except Exception as e:
+            logger.warning(f"Could not record the outcome of job {job_id}: {str(e)}")
+
+    def result(self, job_id: str, wait: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Return the state of a job
+
+        Args:
+            job_id: Id returned by submit
+            wait: Seconds to wait for the job to finish (None returns immediately)
+
+        Returns:
+            Dict with 'status' ('pending', 'running', 'done', 'failed' or 'unknown'),
+            the job's meta and, once done, its 'result'
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._shared_result(job_id, wait)
+        future = job['future']
+        if wait:
+            try:
+                future.result(timeout=wait)
+            except Exception:
+                # Still running (timeout) or failed; both are reported below
+                pass
+        state = {'job_id': job_id, 'meta': job['meta'], 'submitted_at': job['submitted_at']}
+        if not future.done():
+            state['status'] = 'running' if future.running() else 'pending'
+            return state
+        state['finished_at'] = job['finished_at']
+        error = future.exception()
+        if error is not None:
+            state.update(status='failed', error=str(error))
+            return state
+        state.update(status='done', result=future.result())
+        return state
+
+    def _shared_result(self, job_id: str, wait: Optional[float]) -> Dict[str, Any]:
+        """Return the state of a job submitted by another web process"""
+        if self._store is None:
+            return {'status': 'unknown', 'job_id': job_id}
+        deadline = time.monotonic() + (wait or 0)
+        while True:
+            job = self._store.get(job_id)
+            if job is None:
+                return {'status': 'unknown', 'job_id': job_id}
+            if job['status'] != 'pending' or time.monotonic() >= deadline:
+                break
+            time.sleep(min(0.1, max(deadline - time.monotonic(), 0)))
+        state = {'job_id': job_id, 'meta': job['meta'], 'submitted_at': job['submitted_at']}
+        if job['status'] == 'pending':
+            # Same limit as run(); past it the submitting process has most likely died
+            if self.timeout > 0 and time.time() - job['submitted_at'] > self.timeout * 2:
+                state.update(status='failed', error='Job was lost before it finished')
+            else:
+                state['status'] = 'pending'
+            return state
+        state['finished_at'] = job['finished_at']
+        if job['status'] == 'failed':
+            state.update(status='failed', error=job['outcome'])
+        else:
+            state.update(status='done', result=job['outcome'])
+        return state
+
+    def run(self, df: pd.DataFrame, predict_year, partner_code, flow_code, model_type: str) -> Dict[str, Any]:
+        """Train in the pool and wait for the result (the calling thread releases the GIL while waiting)"""
+        job_id = self.submit(df, predict_year, partner_code, flow_code, model_type)
+        with self._lock:
+            future = self._jobs[job_id]['future']
+        # The worker enforces the timeout; the margin covers queueing behind other jobs
+        wait = self.timeout * 2 if self.timeout > 0 else None
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            return {'error': f'Training did not finish within {wait:g} seconds', 'model_type': model_type}
+        except Exception as e:
+            return {'error': str(e), 'model_type': model_type}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job['future'].done())
+            return {
+                'max_workers': self.max_workers,
+                'timeout': self.timeout,
+                'jobs': len(self._jobs),
+                'pending': pending,
+                'submitted': self.submitted,
+            }
+
+    def _expire(self) -> None:
+        """Forget finished jobs older than job_ttl (caller holds the lock)"""
+        cutoff = time.time() - self.job_ttl
+        for job_id in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]:
+            del self._jobs[job_id]
+        if self._store is not None:
+            self._store.expire(cutoff)
+
+
+_executor = TrainingExecutor()
+
+
+def get_executor() -> TrainingExecutor:
+    """Return the process-wide training executor"""
+    return _executor
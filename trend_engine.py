@@ -0,0 +1,141 @@
+"""
+Vectorized linear trend engine
+Fits value = intercept + slope * year for every row of a (series x years) matrix in
+one NumPy pass, so every corridor in the local store can be scored at once instead
+of fitting a scikit-learn model per series:
+
+    python trend_engine.py --out data/trend_scores.csv
+"""
+import argparse
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns identifying one series (corridor) in a COMTRADE frame
+SERIES_KEYS = ['reporterCode', 'partnerCode', 'cmdCode', 'flowCode']
+
+
+def fit_trends(values: np.ndarray, years: Iterable[float], forecast_year: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Fit an ordinary least squares trend to every row of a value matrix
+
+    Args:
+        values: Array of shape (series, years); NaN marks a missing observation
+        years: The year of each column
+        forecast_year: Year to forecast (defaults to the year after the last column)
+
+    Returns:
+        Dict of per-series arrays: slope, intercept, mse (in-sample residual mean
+        squared error), n_obs and forecast. Series with one observation get a zero
+        slope; series without observations get NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[None, :]
+    years = np.asarray(years, dtype=np.float64)
+    if forecast_year is None:
+        forecast_year = years[-1] + 1 if len(years) else np.nan
+
+    observed = ~np.isnan(values)
+    n_obs = observed.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        year_mean = (observed * years).sum(axis=1) / n_obs
+        value_mean = np.where(observed, values, 0.0).sum(axis=1) / n_obs
+        dx = np.where(observed, years - year_mean[:, None], 0.0)
+        dy = np.where(observed, values - value_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = np.where(sxx > 0, (dx * dy).sum(axis=1) / np.where(sxx > 0, sxx, 1.0), 0.0)
+        slope[n_obs == 0] = np.nan
+        intercept = value_mean - slope * year_mean
+        residuals = dy - slope[:, None] * dx
+        mse = (residuals * residuals).sum(axis=1) / n_obs
+
+    return {
+        'slope': slope,
+        'intercept': intercept,
+        'mse': mse,
+        'n_obs': n_obs,
+        'forecast': intercept + slope * forecast_year,
+    }
+
+
+def series_matrix(df: pd.DataFrame, keys: List[str] = SERIES_KEYS, year_column: str = 'refYear',
+                  value_column: str = 'primaryValue') -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    Pivot a long COMTRADE frame into a (series x years) value matrix
+
+    Rows sharing a series key and year are summed; years a series has no data
+    for are NaN.
+
+    Returns:
+        Tuple of (series keys as a DataFrame, years, value matrix)
+    """
+    keys = [k for k in keys if k in df.columns]
+    frame = df[keys + [year_column, value_column]].copy()
+    frame[year_column] = pd.to_numeric(frame[year_column], errors='coerce')
+    frame[value_column] = pd.to_numeric(frame[value_column], errors='coerce').astype('float64')
+    for key in keys:
+        # Categorical keys would make groupby build the full cartesian product
+        frame[key] = frame[key].astype(object)
+    frame = frame.dropna(subset=[year_column])
+    grouped = frame.groupby(keys + [year_column], dropna=False)[value_column].sum(min_count=1)
+    table = grouped.unstack(year_column).sort_index(axis=1)
+    return table.index.to_frame(index=False), table.columns.to_numpy(dtype=np.float64), table.to_numpy(dtype=np.float64)
+
+
+def score_frame(df: pd.DataFrame, forecast_year: Optional[float] = None, keys: List[str] = SERIES_KEYS) -> pd.DataFrame:
+    """Fit a trend per series of a long COMTRADE frame and return one row per series"""
+    if df.empty:
+        return pd.DataFrame(columns=list(keys) + ['slope', 'intercept', 'mse', 'n_obs', 'forecast'])
+    index, years, values = series_matrix(df, keys)
+    fit = fit_trends(values, years, forecast_year)
+    for name, column in fit.items():
+        index[name] = column
+    return index
+
+
+def score_store(store=None, forecast_year: Optional[float] = None, freqCode: str = 'A') -> pd.DataFrame:
+    """
+    Score every series held in the persistent store
+
+    Only the key, year and value columns are read from the Arrow files. Rows
+    stored by overlapping queries (e.g. one flow and all flows) are counted once.
+    """
+    if store is None:
+        import comtradeapicall
+        store = comtradeapicall._store
+    if store is None:
+        raise RuntimeError("Scoring the store needs the persistent store (install pyarrow and set COMTRADE_STORE_DIR)")
+    columns = SERIES_KEYS + ['freqCode', 'refYear', 'primaryValue']
+    frames = []
+    for record in store.records():
+        df = store.read(record, columns=columns)
+        if df is None or df.empty or 'primaryValue' not in df.columns or 'refYear' not in df.columns:
+            continue
+        if 'freqCode' in df.columns:
+            df = df[df['freqCode'].astype(object) == freqCode]
+        frames.append(df.drop(columns=['freqCode'], errors='ignore'))
+    if not frames:
+        return score_frame(pd.DataFrame(), forecast_year)
+    df = pd.concat(frames, ignore_index=True)
+    for key in SERIES_KEYS:
+        if key in df.columns:
+            df[key] = df[key].astype(object).astype(str)
+    df = df.drop_duplicates()
+    return score_frame(df, forecast_year)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit a linear trend to every series in the local store")
+    parser.add_argument("--forecast-year", type=int, default=None, help="Year to forecast (default: after the last year)")
+    parser.add_argument("--out", default=None, help="Write the scores to this CSV file")
+    args = parser.parse_args()
+
+    scores = score_store(forecast_year=args.forecast_year)
+    if args.out:
+        scores.to_csv(args.out, index=False)
+    print(f"Scored {len(scores)} series")